@@ -0,0 +1,160 @@
+"""
+Concurrency of the ASGI entry point (asgi:app under uvicorn) against local stand-ins.
+
+Starts the stub DNS, Security Trails and RDAP servers and a uvicorn process
+serving asgi:app pointed at them, then opens --mappings concurrent POST /
+requests for distinct domains, each with a /dns/progress/<domain>/stream
+SSE viewer and a /dns/progress/<domain> poller. Reports latencies and the
+server's peak thread count, which should stay near ASGI_MAP_WORKERS times
+the threads of one run however many requests are open. Stubs, client and
+server share the machine's cores, so on small hosts poll latency mostly
+measures CPU contention rather than event loop blocking.
+
+    python benchmarks/bench_asgi.py --mappings 200 --subdomains 100 --map-workers 8
+"""
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+CONTAINER_SRC = os.path.join(BENCHMARKS_DIR, '..', 'container_src')
+
+import httpx  # noqa: E402
+
+from bench_load import percentile  # noqa: E402
+from stub_dns import StubDNSServer  # noqa: E402
+from stub_rdap import StubRDAPServer  # noqa: E402
+from stub_securitytrails import StubSecurityTrailsServer  # noqa: E402
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def thread_count(pid: int) -> int:
+    with open(f"/proc/{pid}/status") as status:
+        for line in status:
+            if line.startswith('Threads:'):
+                return int(line.split()[1])
+    return 0
+
+
+async def wait_ready(base: str, timeout: float = 30) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                await client.get(f"{base}/dns/progress/ready.example")
+                return
+            except httpx.HTTPError:
+                await asyncio.sleep(0.2)
+    raise RuntimeError('uvicorn did not start')
+
+
+async def load(base: str, args):
+    map_latencies, poll_latencies, stream_events = [], [], []
+    failures = {'map': 0}
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+
+    async with httpx.AsyncClient(timeout=3600, limits=limits) as client:
+        async def stream(domain, done):
+            events = 0
+            async with client.stream('GET', f"{base}/dns/progress/{domain}/stream") as response:
+                async for line in response.aiter_lines():
+                    events += line.startswith('data:')
+                    if done.is_set() and line.startswith('event: finished'):
+                        break
+            stream_events.append(events)
+
+        async def poll(domain, done):
+            while not done.is_set():
+                began = time.perf_counter()
+                await client.get(f"{base}/dns/progress/{domain}")
+                poll_latencies.append(time.perf_counter() - began)
+                await asyncio.sleep(args.poll_interval)
+
+        async def map_one(i):
+            domain = f"asgi{i}.example"
+            done = asyncio.Event()
+            viewers = [asyncio.create_task(poll(domain, done)),
+                       asyncio.create_task(asyncio.wait_for(stream(domain, done), args.stream_timeout))]
+            began = time.perf_counter()
+            response = await client.post(f"{base}/", json={'domain': domain})
+            map_latencies.append(time.perf_counter() - began)
+            if response.status_code != 200 or len(response.json()['all_subdomains']) != args.subdomains:
+                failures['map'] += 1
+            done.set()
+            await asyncio.gather(*viewers, return_exceptions=True)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(map_one(i) for i in range(args.mappings)))
+        elapsed = time.perf_counter() - start
+    return elapsed, map_latencies, poll_latencies, stream_events, failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mappings', type=int, default=200, help='concurrent POST / requests (distinct domains)')
+    parser.add_argument('--subdomains', type=int, default=100, help='subdomains per domain')
+    parser.add_argument('--map-workers', type=int, default=8, help='ASGI_MAP_WORKERS of the server')
+    parser.add_argument('--poll-interval', type=float, default=1.0, help='seconds between progress polls')
+    parser.add_argument('--stream-timeout', type=float, default=600, help='give up on an SSE stream after (s)')
+    parser.add_argument('--dns-latency', type=float, default=0.005, help='injected per-query DNS latency (s)')
+    parser.add_argument('--st-latency', type=float, default=0.2, help='injected Security Trails latency (s)')
+    parser.add_argument('--rdap-latency', type=float, default=0.05, help='injected RDAP latency (s)')
+    args = parser.parse_args()
+
+    with StubDNSServer(latency=args.dns_latency) as dns_server, \
+            StubSecurityTrailsServer(args.subdomains, latency=args.st_latency) as security_trails, \
+            StubRDAPServer(latency=args.rdap_latency) as rdap, tempfile.TemporaryDirectory() as workdir:
+        host, port = dns_server.address
+        env = dict(os.environ, DNS_UPSTREAMS=f"{host}:{port}", SECURITY_TRAILS_BASE_URL=security_trails.base_url,
+                   RDAP_BOOTSTRAP_BASE_URL=rdap.base_url, ASN_DATABASE_PATH='',
+                   ASGI_MAP_WORKERS=str(args.map_workers), PYTHONPATH=os.path.abspath(CONTAINER_SRC),
+                   IP_ORG_INDEX_PATH=os.path.join(workdir, 'ip_org_index.json'),
+                   SUBDOMAIN_INVENTORY_PATH=os.path.join(workdir, 'inventory.db'))
+        server_port = free_port()
+        server = subprocess.Popen([sys.executable, '-m', 'uvicorn', 'asgi:app', '--port', str(server_port),
+                                   '--log-level', 'warning'], cwd=workdir, env=env,
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        peak_threads = [0]
+        sampling = threading.Event()
+
+        def sample():
+            while not sampling.is_set():
+                peak_threads[0] = max(peak_threads[0], thread_count(server.pid))
+                time.sleep(0.05)
+
+        try:
+            base = f"http://127.0.0.1:{server_port}"
+            asyncio.run(wait_ready(base))
+            idle_threads = thread_count(server.pid)
+            sampler = threading.Thread(target=sample, daemon=True)
+            sampler.start()
+            elapsed, maps, polls, streams, failures = asyncio.run(load(base, args))
+            sampling.set()
+            sampler.join()
+        finally:
+            server.terminate()
+            server.wait()
+
+    print(f"{args.mappings} concurrent mappings of {args.subdomains} subdomains, "
+          f"{args.map_workers} map workers: {elapsed:.1f}s")
+    print(f"POST /              {len(maps):>6} requests  {failures['map']} failed  "
+          f"p50 {percentile(maps, 0.5):.2f}s  p99 {percentile(maps, 0.99):.2f}s")
+    print(f"GET /dns/progress   {len(polls):>6} requests  "
+          f"p50 {percentile(polls, 0.5) * 1000:.1f}ms  p99 {percentile(polls, 0.99) * 1000:.1f}ms")
+    print(f"SSE streams         {len(streams):>6} finished  {sum(streams)} events")
+    print(f"server threads: {idle_threads} idle, {peak_threads[0]} peak")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+"""
+Legacy first-A lookups vs. the A/AAAA batch resolver with CNAME-chain caching.
+
+Builds a synthetic zone where most hosts CNAME to a handful of CDN edge names
+in another zone, some hosts are IPv6-only and some don't exist, then resolves
+every host both ways against StubZoneServer. Reports upstream queries, hosts
+with at least one address, addresses found and wall time.
+
+    python benchmarks/bench_batch_resolver.py --hosts 2000 --targets 8 --latency 0.005
+    python benchmarks/bench_batch_resolver.py --authoritative    # upstream only follows in-zone CNAMEs
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'container_src'))
+
+import dns.exception  # noqa: E402
+import dns.resolver  # noqa: E402
+
+from batch_resolver import resolve_addresses  # noqa: E402
+from dns_cache import DNSAnswerCache  # noqa: E402
+from resolver_engine import build_resolver  # noqa: E402
+from stub_dns import StubZoneServer  # noqa: E402
+
+ZONE = 'bench.example'
+CDN_ZONE = 'cdn.example.net'
+
+
+def build_zone(hosts: int, targets: int, v6_share: float, nx_share: float):
+    """Return (records, host names, names expected to resolve, IPv6-only names)."""
+    records = {}
+    for t in range(targets):
+        # edge-N is a CNAME to its canonical eN, which carries both address families
+        records[f'edge-{t}.{CDN_ZONE}'] = {'CNAME': [f'e{t}.{CDN_ZONE}.']}
+        records[f'e{t}.{CDN_ZONE}'] = {'A': [f'198.51.100.{t + 1}', f'198.51.101.{t + 1}'],
+                                       'AAAA': [f'2001:db8:{t + 1:x}::1']}
+
+    names, expected, v6_only = [], set(), set()
+    v6_every = int(1 / v6_share) if v6_share else 0
+    nx_every = int(1 / nx_share) if nx_share else 0
+    for i in range(hosts):
+        name = f'host{i}.{ZONE}'
+        names.append(name)
+        if nx_every and i % nx_every == nx_every - 1:
+            continue
+        expected.add(name)
+        if v6_every and i % v6_every == 0:
+            records[name] = {'AAAA': [f'2001:db8:ffff::{i % 65535:x}']}
+            v6_only.add(name)
+        else:
+            records[name] = {'CNAME': [f'edge-{i % targets}.{CDN_ZONE}.']}
+    return records, names, expected, v6_only
+
+
+def legacy_lookup(resolver, cache, name):
+    """The pre-batch lookup: first A record only, through the answer cache."""
+    try:
+        for rdata in cache.resolve(resolver, name, 'A'):
+            return [rdata.address]
+    except dns.exception.DNSException:
+        pass
+    return []
+
+
+def run(lookup, names, concurrency):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = dict(zip(names, executor.map(lookup, names)))
+    return results, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--hosts', type=int, default=2000, help='number of hosts in the zone')
+    parser.add_argument('--targets', type=int, default=8, help='number of shared CDN edge names')
+    parser.add_argument('--v6-share', type=float, default=0.05, help='share of IPv6-only hosts')
+    parser.add_argument('--nx-share', type=float, default=0.05, help='share of hosts that do not exist')
+    parser.add_argument('--latency', type=float, default=0.005, help='injected per-query server latency (s)')
+    parser.add_argument('--concurrency', type=int, default=32, help='lookups in flight')
+    parser.add_argument('--authoritative', action='store_true',
+                        help='upstream stops at out-of-zone CNAME targets instead of following the chain')
+    args = parser.parse_args()
+
+    records, names, expected, v6_only = build_zone(args.hosts, args.targets, args.v6_share, args.nx_share)
+    print(f"{len(names)} hosts, {args.targets} CDN targets, {len(v6_only)} IPv6-only, "
+          f"{len(names) - len(expected)} NXDOMAIN, {'authoritative' if args.authoritative else 'recursive'} upstream")
+    print(f"{'lookup':<10}{'queries':>10}{'hosts':>10}{'addresses':>12}{'seconds':>10}")
+
+    outcomes = {}
+    for label in ('legacy', 'batch'):
+        with StubZoneServer([ZONE, CDN_ZONE], records, latency=args.latency,
+                            recursive=not args.authoritative) as server:
+            host, port = server.address
+            resolver = build_resolver(5, [host], port)
+            cache = DNSAnswerCache()
+            if label == 'legacy':
+                lookup = lambda name: legacy_lookup(resolver, cache, name)  # noqa: E731
+            else:
+                lookup = lambda name: resolve_addresses(resolver, name, cache=cache)[0]  # noqa: E731
+            results, elapsed = run(lookup, names, args.concurrency)
+            queries = sum(server.queries.values())
+            found = {name for name, addresses in results.items() if addresses}
+            addresses = sum(len(a) for a in results.values())
+            print(f"{label:<10}{queries:>10}{len(found):>10}{addresses:>12}{elapsed:>10.2f}")
+            outcomes[label] = (server.queries.copy(), found)
+
+    batch_queries, batch_found = outcomes['batch']
+    assert batch_found == expected, f"{len(expected - batch_found)} resolvable hosts missed"
+    assert v6_only <= batch_found
+    # Shared targets are only asked again while their first answer is still in flight, however many hosts use them
+    target_queries = sum(count for (name, _), count in batch_queries.items() if name.endswith(CDN_ZONE))
+    assert target_queries <= 2 * args.targets * (1 + args.concurrency), target_queries
+    print(f"batch sent {target_queries} queries for CDN names; "
+          f"legacy missed {len(expected - outcomes['legacy'][1])} resolvable hosts "
+          f"({len(v6_only - outcomes['legacy'][1])} of them IPv6-only)")
+
+
+if __name__ == '__main__':
+    main()
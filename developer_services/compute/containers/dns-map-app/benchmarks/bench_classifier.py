@@ -0,0 +1,102 @@
+"""
+Subdomain classification and provider matching: per-keyword substring scans vs.
+the compiled single-pass matchers in keyword_matcher.
+
+Generates synthetic subdomains (a share of them containing category keywords,
+exclusion words like "capital"/"rapid", and provider names), checks that both
+implementations agree, and prints the time each takes.
+
+    python benchmarks/bench_classifier.py --subdomains 200000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'container_src'))
+
+from dns_map_for_flask import (  # noqa: E402
+    EMAIL_PROVIDER_MATCHER, EMAIL_PROVIDERS, HOSTING_PROVIDER_MATCHER, HOSTING_PROVIDERS, SUBDOMAIN_CLASSIFIER
+)
+
+PLAIN_WORDS = ['www', 'mail', 'dev', 'staging', 'cdn', 'app', 'portal', 'internal', 'shop', 'static', 'img', 'blog']
+KEYWORD_WORDS = ['secure', 'access', 'remote', 'api', 'vpn', 'capital', 'rapid', 'capitol', 'apis', 'myvpn',
+                 'remoteaccess', 'securemote']
+
+
+def legacy_classify(all_subdomains):
+    """The original five list comprehensions over the whole list."""
+    secure_subdomains = [s for s in all_subdomains if any(keyword in s.lower() for keyword in ["secure"])]
+    access_subdomains = [s for s in all_subdomains if any(keyword in s.lower() for keyword in ["access"])]
+    remote_subdomains = [s for s in all_subdomains if any(keyword in s.lower() for keyword in ["remote"])]
+    api_subdomains_raw = [s for s in all_subdomains if any(keyword in s.lower() for keyword in ["api"])]
+    api_subdomains = [s for s in api_subdomains_raw
+                      if "capital" not in s.lower() and "rapid" not in s.lower() and "capitol" not in s.lower()]
+    vpn_subdomains = [s for s in all_subdomains if any(keyword in s.lower() for keyword in ["vpn"])]
+    return secure_subdomains, access_subdomains, remote_subdomains, api_subdomains, vpn_subdomains
+
+
+def compiled_classify(all_subdomains):
+    classified = SUBDOMAIN_CLASSIFIER.classify(all_subdomains)
+    return tuple(classified[name] for name in ('secure', 'access', 'remote', 'api', 'vpn'))
+
+
+def legacy_match(mapping, texts, default):
+    """The original loop: first key in dict order that is a substring wins."""
+    matched = []
+    for text in texts:
+        for key, name in mapping.items():
+            if key.lower() in text.lower():
+                matched.append(name)
+                break
+        else:
+            matched.append(default)
+    return matched
+
+
+def timed(label, func, *args, repeat=3):
+    """Best of repeat runs, to keep scheduler noise out of the comparison."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - start)
+    print(f"{label:<36} {best:8.3f}s")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--subdomains', type=int, default=200000)
+    parser.add_argument('--keyword-share', type=float, default=0.2,
+                        help='fraction of subdomain labels drawn from category/exclusion keywords')
+    parser.add_argument('--texts', type=int, default=100000, help='organization/MX strings for provider matching')
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    subdomains = []
+    for i in range(args.subdomains):
+        labels = [rng.choice(KEYWORD_WORDS if rng.random() < args.keyword_share else PLAIN_WORDS)
+                  for _ in range(rng.randint(1, 3))]
+        subdomains.append(f"{'-'.join(labels).upper() if i % 17 == 0 else '-'.join(labels)}{i}.example.com")
+
+    legacy = timed(f"classify {len(subdomains)} (legacy)", legacy_classify, subdomains)
+    compiled = timed(f"classify {len(subdomains)} (compiled)", compiled_classify, subdomains)
+    assert legacy == compiled, "classifier results differ"
+    print("categories:", {name: len(found) for name, found in zip(('secure', 'access', 'remote', 'api', 'vpn'), compiled)})
+
+    filler = ['corp', 'networks', 'llc', 'hosting', 'as', 'inc', 'datacenter', 'mx', 'smtp', 'in']
+    for label, mapping, matcher in (('hosting', HOSTING_PROVIDERS, HOSTING_PROVIDER_MATCHER),
+                                    ('email', EMAIL_PROVIDERS, EMAIL_PROVIDER_MATCHER)):
+        keys = list(mapping)
+        texts = [' '.join(rng.sample(filler, 3) + ([rng.choice(keys).upper()] if rng.random() < 0.5 else []))
+                 for _ in range(args.texts)]
+        legacy = timed(f"{label} match {len(texts)} (legacy)", legacy_match, mapping, texts, None)
+        compiled = timed(f"{label} match {len(texts)} (compiled)",
+                         lambda: [matcher.match(text) for text in texts])
+        assert legacy == compiled, f"{label} provider matches differ"
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""
+ResolutionEngine throughput over UDP, pipelined DNS-over-TCP and HTTP/2 DoH.
+
+Resolves N synthetic subdomains (A and AAAA each) through each transport
+against local stubs and prints names per second plus the connections the
+TCP/DoH stubs accepted. --loss drops that share of UDP queries, each of
+which then costs a full query timeout. Stubs and client share one process,
+so absolute rates are CPU bound. Then routes queries over two TCP upstreams
+with different latencies, and over a dead plus a live one, to check that
+the router prefers the fastest upstream and fails over.
+
+    python benchmarks/bench_dns_transport.py --names 2000 --latency 0.02 --concurrency 128
+    python benchmarks/bench_dns_transport.py --loss 0.01 --timeout 2
+"""
+import argparse
+import os
+import socket
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'container_src'))
+
+from dns_cache import DNS_CACHE  # noqa: E402
+from dns_transport import build_router  # noqa: E402
+from resolver_engine import ResolutionEngine  # noqa: E402
+from stub_dns import StubDNSServer, StubDoHServer, StubTCPDNSServer  # noqa: E402
+
+
+def run_engine(transport: str, nameservers, port: int, names, mode: str, concurrency: int, timeout: float):
+    DNS_CACHE.clear()
+    engine = ResolutionEngine(mode=mode, max_in_flight=concurrency, query_timeout=timeout,
+                              nameservers=nameservers, port=port, transport=transport)
+    start = time.perf_counter()
+    resolved = sum(1 for _, addresses, _ in engine.resolve(names) if addresses)
+    return resolved, time.perf_counter() - start
+
+
+def report(transport: str, mode: str, resolved: int, elapsed: float, connections='-'):
+    print(f"{transport:<10}{mode:<8}{resolved:>10}{elapsed:>10.2f}{resolved / elapsed:>12.1f}{connections:>13}")
+
+
+def throughput(args, names):
+    print(f"{'transport':<10}{'mode':<8}{'resolved':>10}{'seconds':>10}{'names/s':>12}{'connections':>13}")
+    for mode in args.modes.split(','):
+        with StubDNSServer(latency=args.latency, loss=args.loss) as server:
+            host, port = server.address
+            resolved, elapsed = run_engine('udp', [host], port, names, mode, args.concurrency, args.timeout)
+            report('udp', mode, resolved, elapsed)
+
+        with StubTCPDNSServer(latency=args.latency) as server:
+            host, port = server.address
+            resolved, elapsed = run_engine('tcp', [f"{host}:{port}"], 53, names, mode, args.concurrency, args.timeout)
+            report('tcp', mode, resolved, elapsed, server.connections)
+            assert resolved == len(names), resolved
+
+        with StubDoHServer(latency=args.latency) as server:
+            resolved, elapsed = run_engine('doh', [server.url], 53, names, mode, args.concurrency, args.timeout)
+            report('doh', mode, resolved, elapsed, server.connections)
+            assert resolved == len(names), resolved
+
+
+def routing(args):
+    names = [f"route{i}.bench.example" for i in range(args.route_queries)]
+    with StubTCPDNSServer(latency=args.latency / 10) as fast, StubTCPDNSServer(latency=args.latency) as slow:
+        router = build_router('tcp', [f"{h}:{p}" for h, p in (slow.address, fast.address)], timeout=args.timeout)
+        for name in names:
+            router.resolve(name, 'A')
+        share = fast.queries / (fast.queries + slow.queries)
+        print(f"routing: fast upstream answered {fast.queries}, slow {slow.queries} ({share:.0%} to the fastest)")
+        assert share > 0.8, share
+
+    # A port nobody listens on stands in for a dead upstream
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        dead = f"127.0.0.1:{sock.getsockname()[1]}"
+    with StubTCPDNSServer(latency=args.latency) as live:
+        router = build_router('tcp', [dead, f"{live.address[0]}:{live.address[1]}"], timeout=args.timeout)
+        answered = sum(1 for name in names[:100] if router.resolve(name, 'A').rrset is not None)
+        print(f"failover: {answered}/100 answered with one upstream down")
+        assert answered == 100, answered
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--names', type=int, default=2000, help='number of subdomains to resolve')
+    parser.add_argument('--latency', type=float, default=0.02, help='injected per-query server latency (s)')
+    parser.add_argument('--concurrency', type=int, default=128, help='in-flight limit of the engine')
+    parser.add_argument('--loss', type=float, default=0.0, help='share of UDP queries the stub drops')
+    parser.add_argument('--modes', default='thread,async', help='comma separated resolver modes')
+    parser.add_argument('--route-queries', type=int, default=400, help='queries sent in the routing check')
+    parser.add_argument('--timeout', type=float, default=5, help='per-query deadline (s)')
+    args = parser.parse_args()
+
+    names = [f"host{i}.bench.example" for i in range(args.names)]
+    throughput(args, names)
+    routing(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,200 @@
+"""
+Load test of the dns-map-app container against local stand-ins.
+
+Starts StubDNSServer, StubSecurityTrailsServer and StubRDAPServer, then for
+each subdomain count runs a fresh worker process that points the app at the
+stubs through its environment variables (DNS_UPSTREAMS,
+SECURITY_TRAILS_BASE_URL, RDAP_BOOTSTRAP_BASE_URL) and
+  1. calls DNS_MAP.dns_map() --runs times directly,
+  2. serves the Flask app on a threaded WSGI server and sends --requests
+     POST / from --clients concurrent clients, each polling
+     /dns/progress/<domain> every --poll-interval while its map runs.
+Every run maps a different apex domain, so neither the result cache nor the
+subdomain inventory answers it. Reports requests, wall time, requests/s,
+p50/p99 latency and the worker's peak RSS after each phase (one process per
+size, so sizes don't share a high-water mark; the stubs run in the parent).
+
+    python benchmarks/bench_load.py --sizes 100,1000,10000 --dns-latency 0.005
+    python benchmarks/bench_load.py --sizes 1000 --st-latency 0.5 --rdap-latency 0.05 --clients 8
+"""
+import argparse
+import json
+import logging
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARKS_DIR, '..', 'container_src'))
+
+from stub_dns import StubDNSServer  # noqa: E402
+from stub_rdap import StubRDAPServer  # noqa: E402
+from stub_securitytrails import StubSecurityTrailsServer  # noqa: E402
+
+
+def percentile(samples, share: float) -> float:
+    """Nearest-rank percentile of samples (0 when empty)."""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(share * len(ordered)))]
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def summary(phase: str, latencies, elapsed: float, failures: int = 0):
+    return {
+        'phase': phase,
+        'requests': len(latencies),
+        'failures': failures,
+        'seconds': elapsed,
+        'rate': len(latencies) / elapsed if elapsed else 0.0,
+        'p50': percentile(latencies, 0.50),
+        'p99': percentile(latencies, 0.99),
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def direct_runs(size: int, runs: int):
+    """Time DNS_MAP.dns_map() for runs fresh apex domains."""
+    from dns_map_for_flask import DNS_MAP
+
+    latencies = []
+    start = time.perf_counter()
+    for i in range(runs):
+        began = time.perf_counter()
+        mapper = DNS_MAP(apex_domain=f"direct{size}-{i}.example", security_trails_api_keys=['bench-key'])
+        *_, all_subdomains, security_trails_error = mapper.dns_map()
+        assert not security_trails_error and len(all_subdomains) == size, (security_trails_error, len(all_subdomains))
+        latencies.append(time.perf_counter() - began)
+    return summary('dns_map()', latencies, time.perf_counter() - start)
+
+
+def http_runs(size: int, requests_count: int, clients: int, poll_interval: float):
+    """POST / from concurrent clients while each one polls /dns/progress for its domain."""
+    import requests
+    from werkzeug.serving import make_server
+
+    from app import app
+
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, name='bench-wsgi', daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_port}"
+
+    lock = threading.Lock()
+    map_latencies, progress_latencies = [], []
+    failures = {'map': 0, 'progress': 0}
+
+    def poll(session, domain, done):
+        while not done.wait(poll_interval):
+            began = time.perf_counter()
+            try:
+                session.get(f"{base}/dns/progress/{domain}", timeout=30).raise_for_status()
+                ok = True
+            except requests.RequestException:
+                ok = False
+            with lock:
+                progress_latencies.append(time.perf_counter() - began)
+                failures['progress'] += not ok
+
+    def map_one(i):
+        domain = f"load{size}-{i}.example"
+        session, poll_session = requests.Session(), requests.Session()
+        done = threading.Event()
+        poller = threading.Thread(target=poll, args=(poll_session, domain, done), daemon=True)
+        poller.start()
+        began = time.perf_counter()
+        try:
+            response = session.post(f"{base}/", json={'domain': domain}, timeout=3600)
+            ok = response.status_code == 200 and len(response.json()['all_subdomains']) == size
+        except (requests.RequestException, ValueError, KeyError):
+            ok = False
+        elapsed = time.perf_counter() - began
+        done.set()
+        poller.join()
+        with lock:
+            map_latencies.append(elapsed)
+            failures['map'] += not ok
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as executor:
+        list(executor.map(map_one, range(requests_count)))
+    elapsed = time.perf_counter() - start
+    server.shutdown()
+    return [summary('POST /', map_latencies, elapsed, failures['map']),
+            summary('GET /dns/progress', progress_latencies, elapsed, failures['progress'])]
+
+
+def worker(args):
+    """Entry point of the per-size child process; prints its results as one JSON line."""
+    logging.disable(logging.WARNING)
+    results = [direct_runs(args.size, args.runs)]
+    results.extend(http_runs(args.size, args.requests or 2 * args.clients, args.clients, args.poll_interval))
+    print(json.dumps(results))
+
+
+def run_size(size: int, args, env):
+    command = [sys.executable, os.path.abspath(__file__), '--worker', '--size', str(size), '--runs', str(args.runs),
+               '--requests', str(args.requests), '--clients', str(args.clients),
+               '--poll-interval', str(args.poll_interval)]
+    with tempfile.TemporaryDirectory() as workdir:
+        # The app keeps its inventory, org index and templates dir relative to the working directory
+        completed = subprocess.run(command, cwd=workdir, capture_output=True, text=True,
+                                   env=dict(env, IP_ORG_INDEX_PATH=os.path.join(workdir, 'ip_org_index.json'),
+                                            SUBDOMAIN_INVENTORY_PATH=os.path.join(workdir, 'inventory.db')))
+    if completed.returncode != 0:
+        raise RuntimeError(f"worker for {size} subdomains failed:\n{completed.stderr[-4000:]}")
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='100,1000,10000', help='comma separated subdomain counts')
+    parser.add_argument('--runs', type=int, default=3, help='direct dns_map() runs per size')
+    parser.add_argument('--requests', type=int, default=0, help='POST / requests per size (default: 2 per client)')
+    parser.add_argument('--clients', type=int, default=4, help='concurrent HTTP clients')
+    parser.add_argument('--poll-interval', type=float, default=0.5, help='seconds between progress polls')
+    parser.add_argument('--dns-latency', type=float, default=0.005, help='injected per-query DNS latency (s)')
+    parser.add_argument('--st-latency', type=float, default=0.2, help='injected Security Trails latency (s)')
+    parser.add_argument('--rdap-latency', type=float, default=0.05, help='injected RDAP latency (s)')
+    parser.add_argument('--transport', default='udp', help='DNS transport of the app (udp or tcp)')
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--size', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        return worker(args)
+    if args.transport not in ('udp', 'tcp'):
+        parser.error('the DNS stub only speaks udp and tcp')
+
+    print(f"{'subdomains':>10}  {'phase':<18}{'requests':>9}{'failed':>7}{'seconds':>9}{'req/s':>9}"
+          f"{'p50 (s)':>9}{'p99 (s)':>9}{'peak RSS (MB)':>15}")
+    if args.transport == 'tcp':
+        from stub_dns import StubTCPDNSServer
+        dns_server = StubTCPDNSServer(latency=args.dns_latency)
+    else:
+        dns_server = StubDNSServer(latency=args.dns_latency)
+    with dns_server, StubSecurityTrailsServer(latency=args.st_latency) as security_trails, \
+            StubRDAPServer(latency=args.rdap_latency) as rdap:
+        host, port = dns_server.address
+        env = dict(os.environ, DNS_UPSTREAMS=f"{host}:{port}", DNS_TRANSPORT=args.transport,
+                   SECURITY_TRAILS_BASE_URL=security_trails.base_url, RDAP_BOOTSTRAP_BASE_URL=rdap.base_url,
+                   ASN_DATABASE_PATH='', PYTHONPATH=BENCHMARKS_DIR)
+        for size in (int(s) for s in args.sizes.split(',')):
+            security_trails.count = size
+            for result in run_size(size, args, env):
+                print(f"{size:>10}  {result['phase']:<18}{result['requests']:>9}{result['failures']:>7}"
+                      f"{result['seconds']:>9.2f}{result['rate']:>9.1f}{result['p50']:>9.3f}{result['p99']:>9.3f}"
+                      f"{result['peak_rss_mb']:>15.1f}")
+
+
+if __name__ == '__main__':
+    main()
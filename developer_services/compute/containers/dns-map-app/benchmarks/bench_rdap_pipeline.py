@@ -0,0 +1,92 @@
+"""
+RDAP attribution: serial lookups vs. the async RDAPPipeline, against a local stub.
+
+IPs are drawn from a limited number of /16 networks, so most of them should be
+answered by request coalescing and the prefix index instead of the network.
+
+    python benchmarks/bench_rdap_pipeline.py --ips 500 --networks 20 --latency 0.05
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'container_src'))
+
+import requests  # noqa: E402
+
+from ip_org_index import PrefixIndex  # noqa: E402
+from rdap_pipeline import REGISTRY_RATES, RDAPPipeline, rdap_to_results  # noqa: E402
+from stub_rdap import StubRDAPServer  # noqa: E402
+
+
+def organization_from_rdap(results):
+    return results['network']['name'] or 'Unknown Company'
+
+
+def serial(ips, server):
+    """Baseline: one blocking RDAP request per IP, like the original _get_organization_for_ip."""
+    session = requests.Session()
+    companies = {}
+    for ip in ips:
+        registry = 'arin' if int(ip.split('.')[0]) < 64 or int(ip.split('.')[0]) >= 192 else \
+            'ripe' if int(ip.split('.')[0]) < 128 else 'apnic'
+        data = session.get(f"{server.base_url}/{registry}/ip/{ip}").json()
+        companies[ip] = organization_from_rdap(rdap_to_results(data))
+    return companies
+
+
+def pipelined(ips, server, concurrency, rates):
+    index = PrefixIndex()
+    companies = {}
+    pipeline = RDAPPipeline(organization_from_rdap, fallback=lambda ip: 'Unknown Company',
+                            max_concurrency=concurrency, registry_rates=rates,
+                            bootstrap_urls=server.bootstrap_urls, index=index)
+    with pipeline:
+        for ip in ips:
+            pipeline.submit(ip)
+        for ip, company in pipeline.finish():
+            companies[ip] = company
+    return companies, pipeline.stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--ips', type=int, default=500)
+    parser.add_argument('--networks', type=int, default=20, help='distinct /16 networks the IPs come from')
+    parser.add_argument('--latency', type=float, default=0.05, help='injected RDAP latency (s)')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--rate', type=float, default=50.0, help='client token bucket rate per registry')
+    parser.add_argument('--skip-serial', action='store_true')
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    networks = [(rng.randrange(1, 223), rng.randrange(256)) for _ in range(args.networks)]
+    ips = []
+    for _ in range(args.ips):
+        a, b = rng.choice(networks)
+        ips.append(f"{a}.{b}.{rng.randrange(256)}.{rng.randrange(1, 255)}")
+
+    rates = {registry: (args.rate, int(args.rate)) for registry in REGISTRY_RATES}
+
+    with StubRDAPServer(latency=args.latency) as server:
+        if not args.skip_serial:
+            start = time.perf_counter()
+            baseline = serial(ips, server)
+            elapsed = time.perf_counter() - start
+            print(f"serial     {elapsed:8.2f}s  upstream requests: {sum(server.requests.values())}")
+            server.requests.clear()
+
+        start = time.perf_counter()
+        companies, stats = pipelined(ips, server, args.concurrency, rates)
+        elapsed = time.perf_counter() - start
+        print(f"pipeline   {elapsed:8.2f}s  upstream requests: {sum(server.requests.values())}  stats: {stats}")
+
+        if not args.skip_serial:
+            mismatches = sum(1 for ip in set(ips) if baseline[ip] != companies[ip])
+            print(f"attribution mismatches vs serial: {mismatches}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""
+Memory and time of a large DNS map: the plain result dict vs. the compact DNSMapResult.
+
+Builds a map of --subdomains synthetic names (as Security Trails would return
+them, every tenth one matching a category keyword) both ways and prints, under
+tracemalloc, the bytes each representation holds and the peak while encoding
+it for a response: json.dumps of the dict vs. iter_json of the compact result,
+which never holds more than one chunk of text. It also holds a second map of
+the same domain next to the first, as the cache does while a refresh runs,
+where the refreshed map shares the cached one's names (SubdomainSet.share_names). The two encodings are checked to decode to
+the same document.
+
+    python benchmarks/bench_result_model.py --subdomains 50000
+"""
+import argparse
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'container_src'))
+
+from dns_map_for_flask import SUBDOMAIN_CLASSIFIER  # noqa: E402
+from result_model import DNSMapResult, SubdomainSet  # noqa: E402
+from stub_securitytrails import synthetic_subdomains  # noqa: E402
+
+
+def fetched_names(count: int, domain: str):
+    # Fresh string objects, like names decoded from an API response
+    return [f"{label}.{domain}" for label in synthetic_subdomains(count)]
+
+
+def build_dict(names, domain):
+    classified = SUBDOMAIN_CLASSIFIER.classify(names)
+    return {
+        'domain': domain,
+        'dns_providers': ['Cloudflare'],
+        'email_hosting': ['Google'],
+        'it_workload': ['Example Org: 192.0.2.1'],
+        'zero_trust': {name: classified[name] for name in ('secure', 'access', 'remote', 'vpn')},
+        'api_domains': classified['api'],
+        'all_subdomains': names,
+        'security_trails_error': None,
+        'success': True,
+    }
+
+
+def build_compact(names, domain):
+    categories = SUBDOMAIN_CLASSIFIER.classify_indices(names)
+    return DNSMapResult(domain, ['Cloudflare'], ['Google'], ['Example Org: 192.0.2.1'],
+                        SubdomainSet(names, categories))
+
+
+def measure(build, encode, count, domain):
+    """Bytes retained by the result (names included) and the peak while encoding it."""
+    gc.collect()
+    tracemalloc.start()
+    began = time.perf_counter()
+    result = build(fetched_names(count, domain), domain)
+    built = time.perf_counter() - began
+    retained = tracemalloc.get_traced_memory()[0]
+    tracemalloc.reset_peak()
+    began = time.perf_counter()
+    size = encode(result)
+    encoded = time.perf_counter() - began
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, retained, peak, built, encoded, size
+
+
+def measure_refresh(build, count, domain):
+    """Bytes a second map of the same domain adds while the first is still held (cache + refresh)."""
+    first = build(fetched_names(count, domain), domain)
+    gc.collect()
+    tracemalloc.start()
+    second = build(fetched_names(count, domain), domain)
+    if isinstance(second, DNSMapResult):
+        # What run_dns_map() does when a refresh replaces a cached map
+        second.subdomains.share_names(first.subdomains)
+    retained = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del first, second
+    return retained
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--subdomains', type=int, default=50000, help='subdomains in the map')
+    args = parser.parse_args()
+    domain = 'bench.example'
+
+    plain = measure(build_dict, lambda result: len(json.dumps(result)), args.subdomains, domain)
+    compact = measure(build_compact, lambda result: sum(len(chunk) for chunk in result.iter_json()),
+                      args.subdomains, domain)
+
+    print(f"{args.subdomains} subdomains, {plain[5] / 1e6:.1f} MB of JSON")
+    print(f"{'representation':<18}{'retained MB':>12}{'encode peak MB':>16}{'build ms':>10}{'encode ms':>11}")
+    for label, (_, retained, peak, built, encoded, _) in (('dict + dumps', plain), ('compact + stream', compact)):
+        print(f"{label:<18}{retained / 1e6:>12.2f}{peak / 1e6:>16.2f}{built * 1000:>10.1f}{encoded * 1000:>11.1f}")
+
+    print(f"{'second map of the same domain':<34}{'retained MB':>12}")
+    for label, build in (('dict', build_dict), ('compact (shared names)', build_compact)):
+        print(f"{label:<34}{measure_refresh(build, args.subdomains, domain) / 1e6:>12.2f}")
+
+    streamed = json.loads(''.join(compact[0].iter_json()))
+    assert streamed == plain[0] == compact[0].to_dict(), 'streamed JSON differs from the dict'
+    print('streamed JSON matches the dict')
+
+
+if __name__ == '__main__':
+    main()
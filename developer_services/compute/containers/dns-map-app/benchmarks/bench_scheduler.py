@@ -0,0 +1,81 @@
+"""
+Deferred expirations: one threading.Timer per entry vs. the shared ExpiryScheduler.
+
+Schedules N expirations spread over --spread seconds both ways and prints the
+time to schedule them, the peak thread count, how late the callbacks ran
+(p50/p99) and the time until all of them fired. Then stores one progress
+entry per domain and rewrites each one --updates times, to check that
+rescheduling an entry keeps a single pending timer.
+
+    python benchmarks/bench_scheduler.py --entries 2000 --spread 2
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'container_src'))
+
+from bench_load import percentile  # noqa: E402
+from progress_store import MemoryProgressStore  # noqa: E402
+from scheduler import ExpiryScheduler  # noqa: E402
+
+
+def run(label: str, schedule, entries: int, spread: float):
+    lateness = []
+    lock = threading.Lock()
+    done = threading.Event()
+
+    def fire(deadline):
+        with lock:
+            lateness.append(time.time() - deadline)
+            if len(lateness) == entries:
+                done.set()
+
+    start = time.perf_counter()
+    base = time.time()
+    for i in range(entries):
+        schedule(base + spread * i / entries, fire)
+    scheduled = time.perf_counter() - start
+    peak_threads = threading.active_count()
+    done.wait()
+    print(f"{label:<16}{scheduled * 1000:>12.1f}{peak_threads:>9}{percentile(lateness, 0.5) * 1000:>11.1f}"
+          f"{percentile(lateness, 0.99) * 1000:>11.1f}{time.perf_counter() - start:>10.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--entries', type=int, default=2000, help='expirations to schedule')
+    parser.add_argument('--spread', type=float, default=2.0, help='seconds over which deadlines are spread')
+    parser.add_argument('--updates', type=int, default=20, help='progress writes per domain')
+    args = parser.parse_args()
+
+    print(f"{'strategy':<16}{'schedule ms':>12}{'threads':>9}{'p50 late':>11}{'p99 late':>11}{'seconds':>10}")
+
+    def timer_per_entry(deadline, fire):
+        timer = threading.Timer(max(0.0, deadline - time.time()), fire, args=(deadline,))
+        timer.daemon = True
+        timer.start()
+
+    run('threading.Timer', timer_per_entry, args.entries, args.spread)
+
+    scheduler = ExpiryScheduler()
+    run('ExpiryScheduler', lambda deadline, fire: scheduler.call_at(deadline, lambda: fire(deadline), 'bench'),
+        args.entries, args.spread)
+
+    store = MemoryProgressStore(ttl=args.spread, scheduler=scheduler)
+    for update in range(args.updates):
+        for i in range(args.entries):
+            store.set(f"domain{i}.example", {'percent': update})
+    print(f"progress store: {args.entries * args.updates} writes, {scheduler.pending('progress')} pending "
+          f"expirations, heap size {scheduler.stats()['heap_size']}")
+    assert scheduler.pending('progress') == args.entries
+    time.sleep(args.spread + 0.5)
+    print(f"after ttl: {len(store._entries)} entries left, {scheduler.pending()} pending")
+    assert not store._entries
+    scheduler.shutdown(timeout=5)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,378 @@
+"""
+Local stub DNS server used by the dns-map-app benchmarks.
+
+StubDNSServer answers every A query with a deterministic address derived
+from the name, after an injectable delay that stands in for upstream latency.
+Names whose first label starts with "nx" get NXDOMAIN.
+
+StubZoneServer is authoritative for a set of synthetic zones instead: it
+serves A/AAAA/CNAME records and, like a real authoritative server, only
+follows CNAMEs that stay inside the zone that was queried (or, with
+recursive=True, the whole chain the way a recursive resolver answers).
+
+StubTCPDNSServer and StubDoHServer answer like StubDNSServer over pipelined
+DNS-over-TCP and cleartext HTTP/2 DoH, counting the connections clients open.
+"""
+import hashlib
+import random
+import socketserver
+import struct
+import threading
+import time
+from collections import Counter, defaultdict
+
+import dns.flags
+import dns.message
+import dns.name
+import dns.rcode
+import dns.rdatatype
+import dns.rrset
+
+
+def synthetic_ip(name: str) -> str:
+    """Stable IPv4 address for a name, spread over 198.18.0.0/15 (benchmark range)."""
+    digest = hashlib.sha1(name.lower().encode()).digest()
+    return f"198.{18 + digest[0] % 2}.{digest[1]}.{digest[2] or 1}"
+
+
+def synthetic_response(query: dns.message.Message, ttl: int) -> dns.message.Message:
+    """Synthetic A answer for query, or NXDOMAIN for names whose first label starts with "nx"."""
+    response = dns.message.make_response(query)
+    response.flags |= dns.flags.AA
+    question = query.question[0]
+    qname = question.name.to_text()
+    if qname.split('.', 1)[0].startswith('nx'):
+        response.set_rcode(dns.rcode.NXDOMAIN)
+    elif question.rdtype == dns.rdatatype.A:
+        response.answer.append(dns.rrset.from_text(qname, ttl, 'IN', 'A', synthetic_ip(qname)))
+    return response
+
+
+class _StubHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        data, sock = self.request
+        server = self.server
+        try:
+            query = dns.message.from_wire(data)
+        except Exception:
+            return
+
+        with server.lock:
+            server.queries += 1
+        if server.loss and random.random() < server.loss:
+            # Dropped datagram: the client only notices when its timeout expires
+            return
+
+        if server.latency:
+            time.sleep(server.latency)
+
+        sock.sendto(synthetic_response(query, server.ttl).to_wire(), self.client_address)
+
+
+class StubDNSServer(socketserver.ThreadingUDPServer):
+    """
+    Threaded UDP DNS stub bound to localhost.
+
+    Args:
+        latency (float): Seconds to sleep before answering each query
+        ttl (int): TTL placed on synthetic answers
+        loss (float): Share of queries silently dropped, like UDP packet loss
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, latency: float = 0.0, ttl: int = 300, loss: float = 0.0, host: str = '127.0.0.1',
+                 port: int = 0):
+        super().__init__((host, port), _StubHandler)
+        self.latency = latency
+        self.ttl = ttl
+        self.loss = loss
+        self.queries = 0
+        self.lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def address(self):
+        return self.server_address
+
+    def start(self) -> 'StubDNSServer':
+        self._thread = threading.Thread(target=self.serve_forever, name='stub-dns', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class _ZoneHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        data, sock = self.request
+        server = self.server
+        try:
+            query = dns.message.from_wire(data)
+        except Exception:
+            return
+
+        if server.latency:
+            time.sleep(server.latency)
+
+        response = dns.message.make_response(query)
+        response.flags |= dns.flags.AA
+        question = query.question[0]
+        rdtype = dns.rdatatype.to_text(question.rdtype)
+        name = question.name.to_text().lower()
+
+        with server.lock:
+            server.queries[(name.rstrip('.'), rdtype)] += 1
+
+        zone = server.zone_of(name)
+        if zone is None or name not in server.records:
+            response.set_rcode(dns.rcode.NXDOMAIN if zone is not None else dns.rcode.REFUSED)
+        else:
+            # Follow CNAMEs only while they stay inside the queried zone, unless acting as a recursive upstream
+            for _ in range(16):
+                records = server.records.get(name, {})
+                if 'CNAME' in records:
+                    target = records['CNAME'][0]
+                    response.answer.append(dns.rrset.from_text(name, server.ttl, 'IN', 'CNAME', target))
+                    name = target
+                    if (not server.recursive and server.zone_of(name) != zone) or name not in server.records:
+                        break
+                    continue
+                if rdtype in records:
+                    response.answer.append(dns.rrset.from_text(name, server.ttl, 'IN', rdtype, *records[rdtype]))
+                break
+
+        sock.sendto(response.to_wire(), self.client_address)
+
+
+class StubZoneServer(socketserver.ThreadingUDPServer):
+    """
+    Threaded UDP authoritative stub for synthetic zones, bound to localhost.
+
+    Args:
+        zones (Iterable[str]): Zone apexes this server is authoritative for
+        records (Dict[str, Dict[str, List[str]]]): name -> rdtype -> values, e.g.
+            {'www.example.com': {'CNAME': ['edge.cdn.example.net.']}}
+        latency (float): Seconds to sleep before answering each query
+        ttl (int): TTL placed on every record
+        recursive (bool): Follow CNAMEs across all served zones, like a recursive resolver would
+
+    queries counts the questions received per (name, rdtype).
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, zones, records, latency: float = 0.0, ttl: int = 300, recursive: bool = False,
+                 host: str = '127.0.0.1', port: int = 0):
+        super().__init__((host, port), _ZoneHandler)
+        self.zones = [dns.name.from_text(zone) for zone in zones]
+        self.records = defaultdict(dict)
+        for name, rdatas in records.items():
+            self.records[dns.name.from_text(name).to_text().lower()].update(rdatas)
+        self.latency = latency
+        self.ttl = ttl
+        self.recursive = recursive
+        self.queries = Counter()
+        self.lock = threading.Lock()
+        self._thread = None
+
+    def zone_of(self, name: str):
+        qname = dns.name.from_text(name)
+        for zone in self.zones:
+            if qname.is_subdomain(zone):
+                return zone
+        return None
+
+    @property
+    def address(self):
+        return self.server_address
+
+    def start(self) -> 'StubZoneServer':
+        self._thread = threading.Thread(target=self.serve_forever, name='stub-zone-dns', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class _TCPStubHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        server = self.server
+        sock = self.request
+        write_lock = threading.Lock()
+        with server.lock:
+            server.connections += 1
+
+        def answer(query):
+            if server.latency:
+                time.sleep(server.latency)
+            wire = synthetic_response(query, server.ttl).to_wire()
+            with write_lock:
+                try:
+                    sock.sendall(struct.pack('!H', len(wire)) + wire)
+                except OSError:
+                    pass
+
+        reader = sock.makefile('rb')
+        while True:
+            header = reader.read(2)
+            if len(header) < 2:
+                return
+            (length,) = struct.unpack('!H', header)
+            try:
+                query = dns.message.from_wire(reader.read(length))
+            except Exception:
+                return
+            with server.lock:
+                server.queries += 1
+            # Each query is answered on its own thread, so pipelined answers come back out of order
+            threading.Thread(target=answer, args=(query,), daemon=True).start()
+
+
+class StubTCPDNSServer(socketserver.ThreadingTCPServer):
+    """
+    Threaded DNS-over-TCP stub bound to localhost, answering like StubDNSServer.
+
+    Pipelined queries on one connection are answered concurrently, in
+    completion order. connections counts accepted TCP connections.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, latency: float = 0.0, ttl: int = 300, host: str = '127.0.0.1', port: int = 0):
+        super().__init__((host, port), _TCPStubHandler)
+        self.latency = latency
+        self.ttl = ttl
+        self.queries = 0
+        self.connections = 0
+        self.lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def address(self):
+        return self.server_address
+
+    def start(self) -> 'StubTCPDNSServer':
+        self._thread = threading.Thread(target=self.serve_forever, name='stub-dns-tcp', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class _DoHStubHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        import h2.config
+        import h2.connection
+        import h2.events
+        import h2.exceptions
+
+        server = self.server
+        sock = self.request
+        connection = h2.connection.H2Connection(config=h2.config.H2Configuration(client_side=False))
+        lock = threading.Lock()
+        bodies = {}
+        with server.lock:
+            server.connections += 1
+
+        def answer(stream_id, body):
+            if server.latency:
+                time.sleep(server.latency)
+            wire = synthetic_response(dns.message.from_wire(body), server.ttl).to_wire()
+            with lock:
+                try:
+                    connection.send_headers(stream_id, [(':status', '200'), ('content-type', 'application/dns-message'),
+                                                        ('content-length', str(len(wire)))])
+                    connection.send_data(stream_id, wire, end_stream=True)
+                    sock.sendall(connection.data_to_send())
+                except (OSError, h2.exceptions.H2Error):
+                    # The client went away meanwhile
+                    pass
+
+        with lock:
+            connection.initiate_connection()
+            sock.sendall(connection.data_to_send())
+        while True:
+            data = sock.recv(65535)
+            if not data:
+                return
+            with lock:
+                events = connection.receive_data(data)
+                sock.sendall(connection.data_to_send())
+            for event in events:
+                if isinstance(event, h2.events.RequestReceived):
+                    bodies[event.stream_id] = b''
+                elif isinstance(event, h2.events.DataReceived):
+                    bodies[event.stream_id] += event.data
+                    with lock:
+                        connection.acknowledge_received_data(event.flow_controlled_length, event.stream_id)
+                elif isinstance(event, h2.events.StreamEnded):
+                    with server.lock:
+                        server.queries += 1
+                    threading.Thread(target=answer, args=(event.stream_id, bodies.pop(event.stream_id)),
+                                     daemon=True).start()
+                elif isinstance(event, h2.events.ConnectionTerminated):
+                    return
+
+
+class StubDoHServer(socketserver.ThreadingTCPServer):
+    """
+    Cleartext HTTP/2 (prior knowledge) DoH stub bound to localhost, answering like StubDNSServer.
+
+    Needs the h2 package. url is the endpoint to POST application/dns-message
+    to; connections counts accepted TCP connections, queries the DoH requests.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, latency: float = 0.0, ttl: int = 300, host: str = '127.0.0.1', port: int = 0):
+        super().__init__((host, port), _DoHStubHandler)
+        self.latency = latency
+        self.ttl = ttl
+        self.queries = 0
+        self.connections = 0
+        self.lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.server_address[0]}:{self.server_address[1]}/dns-query"
+
+    def start(self) -> 'StubDoHServer':
+        self._thread = threading.Thread(target=self.serve_forever, name='stub-doh', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -0,0 +1,127 @@
+"""
+Local stub RDAP server used by the dns-map-app benchmarks.
+
+Serves IANA-style bootstrap files that split the address space between three
+fake registries (arin, ripe, apnic) and answers /<registry>/ip/<ip> with a
+network object covering the enclosing /16, named NET-<a>-<b>. Latency and a
+per-registry requests/second limit (answered with 429) are injectable.
+"""
+import ipaddress
+import json
+import threading
+import time
+from collections import Counter, defaultdict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class _RDAPHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/rdap+json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        server = self.server
+        base = server.base_url
+        if self.path == '/ipv4.json':
+            return self._send_json(200, {'services': [
+                [['0.0.0.0/2', '192.0.0.0/2'], [f"{base}/arin/"]],
+                [['64.0.0.0/2'], [f"{base}/ripe/"]],
+                [['128.0.0.0/2'], [f"{base}/apnic/"]],
+            ]})
+        if self.path == '/ipv6.json':
+            return self._send_json(200, {'services': [[['::/1', '8000::/1'], [f"{base}/ripe/"]]]})
+
+        parts = self.path.strip('/').split('/')
+        if len(parts) != 3 or parts[1] != 'ip':
+            return self._send_json(404, {'errorCode': 404})
+        registry, ip = parts[0], parts[2]
+
+        if server.latency:
+            time.sleep(server.latency)
+        if server.throttled(registry):
+            return self._send_json(429, {'errorCode': 429}, {'Retry-After': '1'})
+
+        with server.lock:
+            server.requests[registry] += 1
+
+        address = ipaddress.ip_address(ip)
+        prefixlen = 16 if address.version == 4 else 32
+        network = ipaddress.ip_network(f"{ip}/{prefixlen}", strict=False)
+        label = '-'.join(str(network.network_address).replace(':', '.').split('.')[:2])
+        self._send_json(200, {
+            'objectClassName': 'ip network',
+            'handle': f"{registry.upper()}-{label}",
+            'name': f"NET-{label}",
+            'startAddress': str(network.network_address),
+            'endAddress': str(network.broadcast_address),
+            'cidr0_cidrs': [{('v4prefix' if address.version == 4 else 'v6prefix'): str(network.network_address),
+                             'length': prefixlen}],
+        })
+
+
+class StubRDAPServer(ThreadingHTTPServer):
+    """
+    Threaded HTTP RDAP stub bound to localhost.
+
+    Args:
+        latency (float): Seconds to sleep before answering each lookup
+        rate_limit (float, optional): Allowed lookups per second per registry before 429s
+    """
+    daemon_threads = True
+
+    def __init__(self, latency: float = 0.0, rate_limit: float = None, host: str = '127.0.0.1', port: int = 0):
+        super().__init__((host, port), _RDAPHandler)
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.requests = Counter()
+        self.rejected = Counter()
+        self.lock = threading.Lock()
+        self._windows = defaultdict(deque)
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def bootstrap_urls(self):
+        return {4: f"{self.base_url}/ipv4.json", 6: f"{self.base_url}/ipv6.json"}
+
+    def throttled(self, registry: str) -> bool:
+        if not self.rate_limit:
+            return False
+        now = time.monotonic()
+        with self.lock:
+            window = self._windows[registry]
+            while window and now - window[0] > 1.0:
+                window.popleft()
+            if len(window) >= self.rate_limit:
+                self.rejected[registry] += 1
+                return True
+            window.append(now)
+            return False
+
+    def start(self) -> 'StubRDAPServer':
+        self._thread = threading.Thread(target=self.serve_forever, name='stub-rdap', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -0,0 +1,105 @@
+"""
+Local stand-in for the Security Trails API used by the dns-map-app benchmarks.
+
+Answers /v1/domain/<apex>/subdomains with `count` synthetic labels in the
+shape of the real API. Every 20th label starts with "nx" (NXDOMAIN on
+StubDNSServer) and a share carry the zero-trust/API keywords, so every
+classification path runs. Latency before the response is injectable.
+"""
+import json
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+KEYWORD_LABELS = ('secure', 'access', 'remote', 'api', 'vpn')
+
+
+def synthetic_subdomains(count: int):
+    """Deterministic labels: mostly hostN, every 20th nxN, every 10th a keyword label."""
+    labels = []
+    for i in range(count):
+        if i % 20 == 19:
+            labels.append(f"nx{i}")
+        elif i % 10 == 0:
+            labels.append(f"{KEYWORD_LABELS[(i // 10) % len(KEYWORD_LABELS)]}{i}")
+        else:
+            labels.append(f"host{i}")
+    return labels
+
+
+class _SecurityTrailsHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        parts = self.path.split('?', 1)[0].strip('/').split('/')
+        if len(parts) != 4 or parts[:2] != ['v1', 'domain'] or parts[3] != 'subdomains':
+            body = b'{"message": "not found"}'
+            self.send_response(404)
+        else:
+            if server.latency:
+                time.sleep(server.latency)
+            with server.lock:
+                server.requests[parts[2]] += 1
+            body = server.body(parts[2])
+            self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class StubSecurityTrailsServer(ThreadingHTTPServer):
+    """
+    Threaded HTTP Security Trails stub bound to localhost.
+
+    Args:
+        count (int): Subdomains returned for every apex domain (can be changed between runs)
+        latency (float): Seconds to sleep before answering each request
+    """
+    daemon_threads = True
+
+    def __init__(self, count: int = 100, latency: float = 0.0, host: str = '127.0.0.1', port: int = 0):
+        super().__init__((host, port), _SecurityTrailsHandler)
+        self.count = count
+        self.latency = latency
+        self.requests = Counter()
+        self.lock = threading.Lock()
+        self._bodies = {}
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def body(self, apex_domain: str) -> bytes:
+        with self.lock:
+            labels = self._bodies.get(self.count)
+            if labels is None:
+                labels = self._bodies[self.count] = synthetic_subdomains(self.count)
+        return json.dumps({
+            'endpoint': f"/v1/domain/{apex_domain}/subdomains",
+            'meta': {'limit_reached': False},
+            'subdomain_count': len(labels),
+            'subdomains': labels,
+        }).encode()
+
+    def start(self) -> 'StubSecurityTrailsServer':
+        self._thread = threading.Thread(target=self.serve_forever, name='stub-securitytrails', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
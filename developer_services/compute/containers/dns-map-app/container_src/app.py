@@ -1,17 +1,25 @@
-from flask import Flask, render_template, request, jsonify, send_from_directory, redirect, url_for
+from flask import Flask, render_template, request, jsonify, send_from_directory, redirect, url_for, Response, stream_with_context
 import re
 import os
 import logging
 import json
 import time
-from dns_map_for_flask import DNS_MAP
-import threading
+from dns_map_for_flask import DNS_MAP, DNSMapCancelled
+from dns_cache import DNS_CACHE
+from dns_transport import upstream_stats
+from ip_org_index import load_ip_org_index
+from progress_store import PROGRESS_STORE
+from result_cache import RESULT_CACHE, ComputeCancelled
+from result_model import iter_json
+from scheduler import SCHEDULER
+from subdomain_inventory import load_subdomain_inventory
+from job_queue import JobQueue, QueueFull
+from metrics import METRICS, CONTENT_TYPE, counter, gauge
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger('dns_app')
 
 os.makedirs('templates', exist_ok=True)
-os.makedirs('temp', exist_ok=True)
 
 # Will try in sequence if one fails
 SECURITY_TRAILS_API_KEYS = [
@@ -22,11 +30,13 @@ SECURITY_TRAILS_API_KEYS = [
 
 app = Flask(__name__)
 
+# Seconds a finished run's progress stays readable after its results were returned
+COMPLETED_PROGRESS_TTL = 60
 
-
-# Run cleanup on a timer
-cleanup_thread = None
-CLEANUP_INTERVAL = 300  # Cleanup every 5 minutes
+# Progress streams send a comment this often so proxies keep the connection open
+PROGRESS_STREAM_HEARTBEAT = 15
+# Streams give up after this long without a progress update (e.g. the run died)
+PROGRESS_STREAM_IDLE_TIMEOUT = 120
 
 
 @app.route('/', methods=['GET', 'POST'])
@@ -47,44 +57,26 @@ def dns_mapping():
                 logger.warning(error_msg)
                 return jsonify({'error': error_msg, 'success': False}), 400
             
+            # ?refresh=1 (or "refresh": true in JSON) bypasses a cached map; ?trace=1 attaches timings
+            options = data if request.is_json else request.values
+            refresh = is_true(options.get('refresh'))
+            trace = is_true(options.get('trace'))
+            
             try:
-                dns_mapper = DNS_MAP(apex_domain=domain, security_trails_api_keys=SECURITY_TRAILS_API_KEYS)
-                
-                mapped_dns_hosts, mx_records, a_records, secure_subdomains, access_subdomains, \
-                    remote_subdomains, api_subdomains, vpn_subdomains, all_subdomains, security_trails_error = dns_mapper.dns_map()
-                
-                results = {
-                    'domain': domain,
-                    'dns_providers': mapped_dns_hosts,  
-                    'email_hosting': mx_records,       
-                    'it_workload': a_records,           
-                    'zero_trust': {
-                        'secure': secure_subdomains,
-                        'access': access_subdomains,
-                        'remote': remote_subdomains,
-                        'vpn': vpn_subdomains
-                    },
-                    'api_domains': api_subdomains,
-                    'all_subdomains': all_subdomains,
-                    'security_trails_error': security_trails_error,
-                    'success': True
-                }
+                result = map_domain(domain, refresh, trace=trace)
                 
-                logger.info(f"Successfully processed DNS mapping for {domain}")
-                
-                # Schedule a cleanup for this domain's file in 1 minute
-                threading.Timer(60, lambda: cleanup_domain_file(domain)).start()
-                
-                # If it's an AJAX request, return JSON
+                # If it's an AJAX request, stream the JSON rather than building it in memory
                 if request.is_json or request.headers.get('X-Requested-With') == 'XMLHttpRequest':
-                    return jsonify(results)
+                    return Response(stream_with_context(result.iter_json()), mimetype='application/json')
                 
                 # Otherwise render the template with the results
-                return render_template('dns_map.html', results=results)
+                return render_template('dns_map.html', results=result.to_dict())
                 
             except Exception as e:
                 error_msg = f"Error processing DNS mapping for {domain}: {str(e)}"
                 logger.error(error_msg)
+                PROGRESS_STORE.set(domain, {'status': error_msg, 'percent': 0, 'error': True, 'finished': True},
+                                   ttl=COMPLETED_PROGRESS_TTL)
                 if request.is_json or request.headers.get('X-Requested-With') == 'XMLHttpRequest':
                     return jsonify({'error': error_msg, 'success': False}), 500
                 else:
@@ -96,38 +88,210 @@ def dns_mapping():
     
     return render_template('dns_map.html')
 
+def map_domain(domain, refresh=False, cancel_event=None, trace=False):
+    """
+    Return the DNS map of domain, from the result cache when possible.
+
+    Concurrent requests for the same domain share one run; maps degraded by a
+    Security Trails failure are shared but not cached. With trace, the run's
+    timings are attached as 'trace' when this request actually ran the map.
+
+    Setting cancel_event stops this caller with DNSMapCancelled; the shared run
+    itself only stops once every caller waiting on it has cancelled.
+    
+    Returns a DNSMapResult of this response: its own copy of the shared map,
+    with cached and trace set.
+    """
+    timings = {}
+    
+    def compute(shared_cancel_event):
+        result = run_dns_map(domain, shared_cancel_event, refresh, trace)
+        # Timings describe this run only, so they stay out of the shared cache
+        timings.update(result.trace or {})
+        result.trace = None
+        return result
+    
+    try:
+        result, cached = RESULT_CACHE.get_or_compute(domain.lower(), compute, refresh=refresh,
+                                                     cacheable=is_cacheable, cancel_event=cancel_event)
+    except ComputeCancelled as e:
+        raise DNSMapCancelled(str(e)) from None
+    return result.with_response(cached, timings)
+
+def is_cacheable(result):
+    """Maps degraded by a Security Trails failure are shared with waiters but not cached."""
+    return not result.security_trails_error
+
+def run_dns_map(domain, cancel_event=None, refresh=False, trace=False, resolver_mode='thread'):
+    """
+    Run a full DNS map for domain as the DNSMapResult behind the JSON returned to the UI.
+
+    Only the single-flight leader calls this; everyone else waits for its result.
+    A refresh also bypasses the subdomain inventory. The ASGI entry point passes
+    resolver_mode='async' so a run resolves on one event loop instead of a thread pool.
+    """
+    # Drop a finished previous run's entry so new viewers don't see it as this run's end
+    PROGRESS_STORE.delete(domain)
+    
+    inventory_ages = {'subdomain_list_max_age': 0, 'resolution_max_age': 0} if refresh else {}
+    dns_mapper = DNS_MAP(apex_domain=domain, security_trails_api_keys=SECURITY_TRAILS_API_KEYS,
+                         cancel_event=cancel_event, trace=trace, resolver_mode=resolver_mode, **inventory_ages)
+    
+    result = dns_mapper.map_result()
+    # A refresh replaces the cached map, which responses and jobs may still hold; share its name strings
+    previous = RESULT_CACHE.get(domain.lower())
+    if previous is not None:
+        result.subdomains.share_names(previous.subdomains)
+    if dns_mapper.trace is not None:
+        result.trace = dns_mapper.trace.to_dict()
+    
+    logger.info(f"Successfully processed DNS mapping for {domain}")
+    
+    # Let this domain's progress entry expire in 1 minute
+    PROGRESS_STORE.expire(domain, COMPLETED_PROGRESS_TTL)
+    return result
+
+def run_job(job):
+    """Execute a queued DNS mapping job; published progress is ended if it gets cancelled."""
+    try:
+        return map_domain(job.domain, job.params.get('refresh', False), job.cancel_event,
+                          job.params.get('trace', False))
+    except DNSMapCancelled:
+        PROGRESS_STORE.set(job.domain, {'status': 'DNS mapping cancelled', 'percent': 0, 'finished': True},
+                           ttl=COMPLETED_PROGRESS_TTL)
+        raise
+
+# DNS_MAP runs submitted through /dns/jobs, executed off the request threads
+JOB_QUEUE = JobQueue(run_job, cancelled_errors=(DNSMapCancelled,))
+
+@METRICS.collector
+def collect_app_metrics():
+    """Turn the caches' and the job queue's stats() into Prometheus samples at scrape time."""
+    dns = DNS_CACHE.stats()
+    lookups = counter('dns_map_dns_cache_lookups_total', 'DNS answer cache lookups by result')
+    for result, key in (('hit', 'hits'), ('negative_hit', 'negative_hits'), ('miss', 'misses')):
+        lookups.add(dns[key], result=result)
+    yield lookups
+    yield gauge('dns_map_dns_cache_hit_ratio', 'Share of DNS answer cache lookups served from cache', dns['hit_ratio'])
+    yield gauge('dns_map_dns_cache_entries', 'Answers held by the DNS answer cache', dns['entries'])
+    yield counter('dns_map_dns_cache_evictions_total', 'DNS answers evicted to stay under max_bytes', dns['evictions'])
+    
+    index = load_ip_org_index().stats()
+    org_lookups = index['hits'] + index['misses']
+    yield counter('dns_map_ip_org_index_lookups_total', 'IP organization index lookups by result') \
+        .add(index['hits'], result='hit').add(index['misses'], result='miss')
+    yield gauge('dns_map_ip_org_index_hit_ratio', 'Share of IPs attributed from known ranges',
+                round(index['hits'] / org_lookups, 4) if org_lookups else 0.0)
+    yield gauge('dns_map_ip_org_index_ranges', 'Network ranges in the IP organization index', index['ranges'])
+    
+    cache = RESULT_CACHE.stats()
+    result_lookups = cache['hits'] + cache['misses']
+    yield counter('dns_map_result_cache_lookups_total', 'Finished map lookups by result') \
+        .add(cache['hits'], result='hit').add(cache['misses'], result='miss').add(cache['shared'], result='shared')
+    yield gauge('dns_map_result_cache_hit_ratio', 'Share of map requests served from the result cache',
+                round(cache['hits'] / result_lookups, 4) if result_lookups else 0.0)
+    yield gauge('dns_map_result_cache_in_flight', 'DNS maps being computed', cache['in_flight'])
+    yield gauge('dns_map_result_cache_entries', 'Finished maps held by the result cache', cache['entries'])
+    
+    jobs = JOB_QUEUE.stats()
+    states = gauge('dns_map_jobs', 'DNS mapping jobs by state')
+    for state, count in jobs['jobs'].items():
+        states.add(count, state=state)
+    yield states
+    yield counter('dns_map_jobs_rejected_total', 'Jobs rejected because the queue was full', jobs['rejected'])
+    
+    scheduler = SCHEDULER.stats()
+    pending = gauge('dns_map_scheduled_expirations', 'Expirations waiting on the scheduler thread by kind')
+    for kind, count in scheduler['pending'].items():
+        pending.add(count, kind=kind)
+    yield pending
+    yield counter('dns_map_scheduled_expirations_fired_total', 'Expirations the scheduler has run', scheduler['fired'])
+    
+    upstreams = upstream_stats()
+    if upstreams:
+        latency = gauge('dns_map_dns_upstream_latency_seconds', 'Moving average latency of each DNS upstream')
+        queries = counter('dns_map_dns_upstream_queries_total', 'Queries sent to each DNS upstream')
+        failures = counter('dns_map_dns_upstream_failures_total', 'Failed or timed out queries per DNS upstream')
+        for address, stats in upstreams.items():
+            if stats['latency_ms'] is not None:
+                latency.add(stats['latency_ms'] / 1000, upstream=address, transport=stats['transport'])
+            queries.add(stats['queries'], upstream=address, transport=stats['transport'])
+            failures.add(stats['failures'], upstream=address, transport=stats['transport'])
+        yield from (latency, queries, failures)
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus scrape endpoint: stage/lookup latency histograms, cache hit ratios and queue depths"""
+    return Response(METRICS.render(), content_type=CONTENT_TYPE)
+
+@app.route('/dns/jobs', methods=['POST'])
+def submit_job():
+    """
+    Queue a DNS mapping run and return its job id right away.
+
+    Accepts domain, priority (higher starts sooner), refresh and trace as JSON or
+    form fields. Answers 202 with the job, or 429 when the queue is full.
+    """
+    data = request.get_json(silent=True) or request.values
+    domain = data.get('domain', '')
+    if not validate_apex_domain(domain):
+        error_msg = f"Invalid domain format: {domain}. Please enter a valid apex domain (e.g., example.com)."
+        return jsonify({'error': error_msg, 'success': False}), 400
+    
+    try:
+        priority = int(data.get('priority', 0))
+    except (TypeError, ValueError):
+        return jsonify({'error': f"Invalid priority: {data.get('priority')}", 'success': False}), 400
+    
+    try:
+        job = JOB_QUEUE.submit(domain, priority, refresh=is_true(data.get('refresh')),
+                               trace=is_true(data.get('trace')))
+    except QueueFull as e:
+        logger.warning(f"Rejecting DNS mapping job for {domain}: {str(e)}")
+        response = jsonify({'error': 'Too many DNS mapping jobs queued, try again later', 'success': False})
+        response.headers['Retry-After'] = '30'
+        return response, 429
+    
+    response = jsonify(dict(job.to_dict(), success=True))
+    response.headers['Location'] = url_for('job_status', job_id=job.id)
+    return response, 202
+
+@app.route('/dns/jobs', methods=['GET'])
+def job_queue_stats():
+    return jsonify(JOB_QUEUE.stats())
+
+@app.route('/dns/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """Status of a job; includes live progress while running and the results once succeeded."""
+    job = JOB_QUEUE.get(job_id)
+    if job is None:
+        return jsonify({'error': f"Unknown job: {job_id}", 'success': False}), 404
+    
+    body = job.to_dict()
+    if job.status == 'running':
+        body['progress'] = PROGRESS_STORE.get(job.domain)
+    # A succeeded job's result is a DNSMapResult, encoded as it streams out
+    return Response(stream_with_context(iter_json(body)), mimetype='application/json')
+
+@app.route('/dns/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    """Cancel a queued job, or ask a running one to stop at its next step."""
+    job = JOB_QUEUE.cancel(job_id)
+    if job is None:
+        return jsonify({'error': f"Unknown job: {job_id}", 'success': False}), 404
+    return jsonify(job.to_dict(include_result=False)), 202 if job.status == 'running' else 200
+
 @app.route('/dns/progress/<domain>', methods=['GET'])
 def dns_progress(domain):
     try:
-        # Clean domain input to prevent path traversal
+        # Clean domain input
         domain = re.sub(r'[^\w\.-]', '', domain)
         
-        # Read progress from temporary file
-        progress_file = f'temp/progress_{domain}.json'
+        # Expired entries (finished runs, abandoned runs) are dropped by the store itself
+        progress = PROGRESS_STORE.get(domain)
         
-        if os.path.exists(progress_file):
-            with open(progress_file, 'r') as f:
-                try:
-                    progress = json.load(f)
-                    
-                    # Check if completed and it's time to delete the file
-                    if progress.get('completed') and 'timestamp' in progress:
-                        completion_time = progress.get('timestamp', 0)
-                        # If completed more than 60 seconds ago, clean up the file
-                        if time.time() - completion_time > 60:
-                            try:
-                                os.remove(progress_file)
-                                logger.info(f"Cleaned up completed progress file for {domain}")
-                            except Exception as e:
-                                logger.warning(f"Could not remove progress file for {domain}: {str(e)}")
-                    
-                    return jsonify(progress)
-                except json.JSONDecodeError as e:
-                    logger.error(f"Error decoding progress file for {domain}: {str(e)}")
-                    return jsonify({
-                        'status': 'Error reading progress data',
-                        'percent': 0
-                    })
+        if progress is not None:
+            return jsonify(progress)
         else:
             return jsonify({
                 'status': 'No progress information available',
@@ -141,6 +305,65 @@ def dns_progress(domain):
             'percent': 0
         }), 500
 
+@app.route('/dns/progress/<domain>/stream', methods=['GET'])
+def dns_progress_stream(domain):
+    """
+    Push progress updates as Server-Sent Events instead of having the UI poll.
+
+    Each stream blocks on the progress store until the mapping run publishes a
+    newer update, so any number of viewers share the one producer. The stream
+    ends once the run reports it has finished.
+    """
+    domain = re.sub(r'[^\w\.-]', '', domain)
+
+    # EventSource sends the last id it saw when it reconnects, so no update is replayed
+    last_event_id = request.headers.get('Last-Event-ID', '')
+    start_version = int(last_event_id) if last_event_id.isdigit() else 0
+
+    def events():
+        version = start_version
+        last_update = time.time()
+        # Tell EventSource to wait a little before reconnecting after the stream closes
+        yield "retry: 2000\n\n"
+        while True:
+            try:
+                version, progress = PROGRESS_STORE.wait(domain, version, PROGRESS_STREAM_HEARTBEAT)
+            except Exception as e:
+                logger.error(f"Error reading progress: {str(e)}")
+                return
+            if progress is None:
+                if time.time() - last_update > PROGRESS_STREAM_IDLE_TIMEOUT:
+                    return
+                yield ": keep-alive\n\n"
+                continue
+            last_update = time.time()
+            yield f"id: {version}\ndata: {json.dumps(progress)}\n\n"
+            if progress.get('finished'):
+                yield "event: finished\ndata: {}\n\n"
+                return
+
+    return Response(stream_with_context(events()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+@app.route('/dns/cache', methods=['GET'])
+def dns_cache_stats():
+    """Expose hit/miss counters of the shared DNS answer, IP organization and result caches"""
+    inventory = load_subdomain_inventory()
+    return jsonify({
+        'dns_answers': DNS_CACHE.stats(),
+        'dns_upstreams': upstream_stats(),
+        'ip_organizations': load_ip_org_index().stats(),
+        'results': RESULT_CACHE.stats(),
+        'scheduler': SCHEDULER.stats(),
+        'subdomain_inventory': inventory.stats() if inventory is not None else None
+    })
+
+def is_true(value):
+    """Interpret a JSON/form option such as refresh=1 or "trace": true."""
+    return str(value).lower() in ('1', 'true', 'yes')
+
 def validate_apex_domain(domain):
     if not domain:
         return False
@@ -153,71 +376,6 @@ def validate_apex_domain(domain):
         
     return bool(re.match(pattern, domain))
 
-def cleanup_domain_file(domain):
-    """Clean up a specific domain's progress file"""
-    try:
-        # Clean domain input to prevent path traversal
-        domain = re.sub(r'[^\w\.-]', '', domain)
-        progress_file = f'temp/progress_{domain}.json'
-        
-        if os.path.exists(progress_file):
-            os.remove(progress_file)
-            logger.info(f"Cleaned up progress file for {domain} after results were shown")
-    except Exception as e:
-        logger.warning(f"Error cleaning up progress file for {domain}: {str(e)}")
-
-def cleanup_temp_files():
-    """Clean up old progress files periodically"""
-    try:
-        temp_dir = 'temp'
-        if os.path.exists(temp_dir):
-            count = 0
-            for filename in os.listdir(temp_dir):
-                if filename.startswith('progress_') and filename.endswith('.json'):
-                    file_path = os.path.join(temp_dir, filename)
-                    try:
-                        # Check if file is older than 30 minutes (1800 seconds)
-                        if time.time() - os.path.getmtime(file_path) > 1800:
-                            os.remove(file_path)
-                            count += 1
-                        # If file is marked completed and older than 1 minute, also clean up
-                        else:
-                            try:
-                                with open(file_path, 'r') as f:
-                                    data = json.load(f)
-                                    if data.get('completed') and 'timestamp' in data:
-                                        if time.time() - data['timestamp'] > 60:
-                                            os.remove(file_path)
-                                            count += 1
-                            except:
-                                # If we can't read the file, check if it's older than 10 minutes (600 seconds)
-                                if time.time() - os.path.getmtime(file_path) > 600:
-                                    os.remove(file_path)
-                                    count += 1
-                    except Exception as e:
-                        logger.warning(f"Could not process file {filename}: {str(e)}")
-            
-            if count > 0:
-                logger.info(f"Cleaned up {count} old progress files")
-    except Exception as e:
-        logger.warning(f"Error cleaning up temp files: {str(e)}")
-    
-    # Schedule the next cleanup
-    global cleanup_thread
-    cleanup_thread = threading.Timer(CLEANUP_INTERVAL, cleanup_temp_files)
-    cleanup_thread.daemon = True
-    cleanup_thread.start()
-
-# Clean up on startup and start the periodic cleanup
-cleanup_temp_files()
-
-@app.teardown_appcontext
-def cleanup_on_shutdown(exception=None):
-    """Clean up the cleanup thread when the application shuts down"""
-    global cleanup_thread
-    if cleanup_thread is not None:
-        cleanup_thread.cancel()
-
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=5000, debug=False)
 
@@ -0,0 +1,167 @@
+"""
+ASGI entry point: uvicorn asgi:app --host 0.0.0.0 --port 5000
+
+Serves the mapping route and the progress routes natively on the event loop,
+so waiting requests, pollers and SSE streams hold no thread. DNS_MAP runs go
+to a bounded pool of MAP_WORKERS threads and resolve subdomains with the
+asyncio resolver. Every other route (the UI, /dns/jobs, /dns/cache, /metrics)
+is served by the unchanged Flask app on a bounded WSGI thread pool.
+"""
+import asyncio
+import json
+import logging
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Mount, Route
+
+from app import (COMPLETED_PROGRESS_TTL, PROGRESS_STREAM_HEARTBEAT, PROGRESS_STREAM_IDLE_TIMEOUT, app as flask_app,
+                 is_cacheable, is_true, run_dns_map, validate_apex_domain)
+from progress_store import PROGRESS_STORE
+from result_cache import RESULT_CACHE
+from scheduler import SCHEDULER
+
+logger = logging.getLogger('dns_app')
+
+# DNS_MAP runs executing at once; further requests wait on the event loop, not on a thread
+MAP_WORKERS = int(os.environ.get('ASGI_MAP_WORKERS', 8))
+# Threads serving the Flask routes that have no native ASGI version
+WSGI_WORKERS = int(os.environ.get('ASGI_WSGI_WORKERS', 16))
+
+MAP_EXECUTOR = ThreadPoolExecutor(max_workers=MAP_WORKERS, thread_name_prefix='dns-map')
+FLASK = WSGIMiddleware(flask_app, workers=WSGI_WORKERS)
+
+
+async def map_domain_async(domain, refresh=False, trace=False):
+    """
+    Return the DNS map of domain like app.map_domain(), awaiting instead of blocking.
+
+    Requests for the same domain share one run through the result cache, and
+    only its leader takes a MAP_EXECUTOR thread.
+    """
+    loop = asyncio.get_running_loop()
+    timings = {}
+
+    async def compute(shared_cancel_event):
+        result = await loop.run_in_executor(
+            MAP_EXECUTOR, lambda: run_dns_map(domain, shared_cancel_event, refresh, trace, resolver_mode='async'))
+        # Timings describe this run only, so they stay out of the shared cache
+        timings.update(result.trace or {})
+        result.trace = None
+        return result
+
+    result, cached = await RESULT_CACHE.get_or_compute_async(
+        domain.lower(), compute, refresh=refresh, cacheable=is_cacheable)
+    return result.with_response(cached, timings)
+
+
+class DNSMapping:
+    """
+    POST / for JSON clients; form posts (rendered as HTML) go to the Flask route.
+
+    A raw ASGI app rather than a request/response function, so it can hand the
+    untouched request over to Flask.
+    """
+
+    async def __call__(self, scope, receive, send):
+        request = Request(scope, receive)
+        content_type = request.headers.get('content-type', '').split(';')[0].strip()
+        if content_type != 'application/json' and not content_type.endswith('+json'):
+            await FLASK(scope, receive, send)
+            return
+        response = await self.map(request)
+        await response(scope, receive, send)
+
+    async def map(self, request):
+        try:
+            data = await request.json()
+            domain = data.get('domain', '')
+            logger.info(f"Processing DNS mapping request for domain: {domain}")
+
+            if not validate_apex_domain(domain):
+                error_msg = f"Invalid domain format: {domain}. Please enter a valid apex domain (e.g., example.com)."
+                logger.warning(error_msg)
+                return JSONResponse({'error': error_msg, 'success': False}, status_code=400)
+
+            try:
+                result = await map_domain_async(domain, is_true(data.get('refresh')), is_true(data.get('trace')))
+                return StreamingResponse(result.iter_json(), media_type='application/json')
+            except Exception as e:
+                error_msg = f"Error processing DNS mapping for {domain}: {str(e)}"
+                logger.error(error_msg)
+                PROGRESS_STORE.set(domain, {'status': error_msg, 'percent': 0, 'error': True, 'finished': True},
+                                   ttl=COMPLETED_PROGRESS_TTL)
+                return JSONResponse({'error': error_msg, 'success': False}, status_code=500)
+        except Exception as e:
+            logger.error(f"Unhandled exception in dns_mapping route: {str(e)}")
+            return JSONResponse({'error': f"An unexpected error occurred: {str(e)}", 'success': False},
+                                status_code=500)
+
+
+async def dns_progress(request):
+    try:
+        domain = re.sub(r'[^\w\.-]', '', request.path_params['domain'])
+        progress = PROGRESS_STORE.get(domain)
+        if progress is not None:
+            return JSONResponse(progress)
+        return JSONResponse({'status': 'No progress information available', 'percent': 0})
+    except Exception as e:
+        logger.error(f"Error reading progress: {str(e)}")
+        return JSONResponse({'status': 'Error reading progress', 'percent': 0}, status_code=500)
+
+
+async def dns_progress_stream(request):
+    """Server-Sent Events version of /dns/progress/<domain>, as in the Flask app, awaiting updates."""
+    domain = re.sub(r'[^\w\.-]', '', request.path_params['domain'])
+
+    # EventSource sends the last id it saw when it reconnects, so no update is replayed
+    last_event_id = request.headers.get('last-event-id', '')
+    start_version = int(last_event_id) if last_event_id.isdigit() else 0
+
+    async def events():
+        version = start_version
+        last_update = time.time()
+        yield "retry: 2000\n\n"
+        while True:
+            try:
+                version, progress = await PROGRESS_STORE.wait_async(domain, version, PROGRESS_STREAM_HEARTBEAT)
+            except Exception as e:
+                logger.error(f"Error reading progress: {str(e)}")
+                return
+            if progress is None:
+                if time.time() - last_update > PROGRESS_STREAM_IDLE_TIMEOUT:
+                    return
+                yield ": keep-alive\n\n"
+                continue
+            last_update = time.time()
+            yield f"id: {version}\ndata: {json.dumps(progress)}\n\n"
+            if progress.get('finished'):
+                yield "event: finished\ndata: {}\n\n"
+                return
+
+    return StreamingResponse(events(), media_type='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+
+@asynccontextmanager
+async def lifespan(app):
+    yield
+    MAP_EXECUTOR.shutdown(wait=False)
+    SCHEDULER.shutdown(timeout=5)
+
+
+app = Starlette(routes=[
+    Route('/', DNSMapping(), methods=['POST']),
+    Route('/dns/progress/{domain}', dns_progress, methods=['GET']),
+    Route('/dns/progress/{domain}/stream', dns_progress_stream, methods=['GET']),
+    Mount('/', FLASK),
+], lifespan=lifespan)
@@ -0,0 +1,168 @@
+import gzip
+import ipaddress
+import json
+import logging
+import os
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from atomic_files import atomic_write, file_lock
+
+logger = logging.getLogger('DNS_MAP')
+
+DEFAULT_ASN_DATABASE_PATH = os.environ.get('ASN_DATABASE_PATH', '')
+
+
+class ASNDatabase:
+    """
+    Offline IP range -> organization table built from an ip2asn-style TSV.
+
+    The TSV (range_start, range_end, AS number, country, AS description) is
+    compiled once into sorted .npy arrays next to the source file. Those are
+    opened memory-mapped, so every gunicorn worker reads the same page-cache
+    copy, and a whole batch of IPs is attributed with one vectorized binary
+    search per address family. IPv6 ranges are keyed on their upper 64 bits.
+    """
+
+    def __init__(self, base_path: str):
+        """
+        Open a compiled database.
+
+        Args:
+            base_path (str): Path prefix of the compiled .v4.npy/.v6.npy/.orgs.json files
+        """
+        self.base_path = base_path
+        # Rows: range starts, range ends, organization index
+        self.v4 = np.load(f"{base_path}.v4.npy", mmap_mode='r')
+        self.v6 = np.load(f"{base_path}.v6.npy", mmap_mode='r')
+        with open(f"{base_path}.orgs.json", 'r') as f:
+            self.organizations: List[str] = json.load(f)
+        logger.info(f"Opened ASN database {base_path}: {self.v4.shape[1]} IPv4 and {self.v6.shape[1]} IPv6 ranges")
+
+    @classmethod
+    def open(cls, source: str) -> 'ASNDatabase':
+        """
+        Open the database for a TSV source, compiling it first when missing or stale.
+
+        Args:
+            source (str): ip2asn TSV file (optionally .gz)
+
+        Returns:
+            ASNDatabase: The memory-mapped database
+        """
+        base_path = source[:-3] if source.endswith('.gz') else source
+        orgs_path = f"{base_path}.orgs.json"
+
+        def stale() -> bool:
+            return not os.path.exists(orgs_path) or os.path.getmtime(orgs_path) < os.path.getmtime(source)
+
+        if stale():
+            # Workers starting together compile once; the others wait and reuse the result
+            with file_lock(base_path):
+                if stale():
+                    cls.compile(source, base_path)
+        return cls(base_path)
+
+    @staticmethod
+    def compile(source: str, base_path: str) -> None:
+        """
+        Parse an ip2asn TSV into sorted range arrays.
+
+        Unrouted ranges (AS 0) are skipped. Files are written to per-writer
+        temporary names and renamed, the organizations file last, so concurrent
+        workers never open a half-written table.
+        """
+        opener = gzip.open if source.endswith('.gz') else open
+        org_ids: Dict[str, int] = {}
+        rows: Dict[int, List[Tuple[int, int, int]]] = {4: [], 6: []}
+
+        with opener(source, 'rt', encoding='utf-8', errors='replace') as f:
+            for line in f:
+                fields = line.rstrip('\n').split('\t')
+                if len(fields) < 5 or fields[2] in ('0', ''):
+                    continue
+                try:
+                    start = ipaddress.ip_address(fields[0])
+                    end = ipaddress.ip_address(fields[1])
+                except ValueError:
+                    continue
+
+                organization = fields[4].strip() or f"AS{fields[2]}"
+                org_id = org_ids.setdefault(organization, len(org_ids))
+                if start.version == 4:
+                    rows[4].append((int(start), int(end), org_id))
+                else:
+                    rows[6].append((int(start) >> 64, int(end) >> 64, org_id))
+
+        for version, dtype in ((4, np.uint32), (6, np.uint64)):
+            table = np.array(rows[version], dtype=dtype).reshape(-1, 3).T
+            table = np.ascontiguousarray(table[:, np.argsort(table[0], kind='stable')])
+            with atomic_write(f"{base_path}.v{version}.npy", 'wb') as f:
+                np.save(f, table)
+
+        with atomic_write(f"{base_path}.orgs.json") as f:
+            json.dump(list(org_ids), f)
+        logger.info(f"Compiled ASN database {source}: {len(rows[4])} IPv4, {len(rows[6])} IPv6 ranges")
+
+    def lookup_many(self, ips: Iterable[str]) -> Dict[str, Optional[str]]:
+        """
+        Attribute a batch of IPs.
+
+        Args:
+            ips (Iterable[str]): IP addresses, duplicates allowed
+
+        Returns:
+            Dict[str, Optional[str]]: Organization per distinct IP, None when no range covers it
+        """
+        keys: Dict[int, List[int]] = {4: [], 6: []}
+        names: Dict[int, List[str]] = {4: [], 6: []}
+        results: Dict[str, Optional[str]] = {}
+
+        for ip in set(ips):
+            try:
+                address = ipaddress.ip_address(ip)
+            except ValueError:
+                results[ip] = None
+                continue
+            keys[address.version].append(int(address) if address.version == 4 else int(address) >> 64)
+            names[address.version].append(ip)
+
+        for version, table in ((4, self.v4), (6, self.v6)):
+            if not names[version]:
+                continue
+            if table.shape[1] == 0:
+                results.update(dict.fromkeys(names[version]))
+                continue
+
+            batch = np.array(keys[version], dtype=table.dtype)
+            index = np.searchsorted(table[0], batch, side='right') - 1
+            clipped = np.maximum(index, 0)
+            found = (index >= 0) & (batch <= table[1][clipped])
+            org_ids = table[2][clipped]
+            for ip, hit, org_id in zip(names[version], found, org_ids):
+                results[ip] = self.organizations[int(org_id)] if hit else None
+
+        return results
+
+
+_databases: Dict[str, Optional[ASNDatabase]] = {}
+_databases_lock = threading.Lock()
+
+
+def load_asn_database(source: str) -> Optional[ASNDatabase]:
+    """
+    Open an ASN database once per process and share it between DNS_MAP instances.
+
+    Returns:
+        Optional[ASNDatabase]: The database, or None when it cannot be loaded
+    """
+    with _databases_lock:
+        if source not in _databases:
+            try:
+                _databases[source] = ASNDatabase.open(source)
+            except Exception as e:
+                logger.error(f"Error loading ASN database {source}: {str(e)}")
+                _databases[source] = None
+        return _databases[source]
@@ -0,0 +1,204 @@
+import asyncio
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Generator, List, Sequence, Tuple
+
+import dns.exception
+import dns.name
+import dns.rdatatype
+import dns.resolver
+
+from dns_cache import DNS_CACHE, DNSAnswerCache
+
+logger = logging.getLogger('DNS_MAP')
+
+# Record types fetched for every subdomain
+ADDRESS_TYPES = ('A', 'AAAA')
+
+# Longer chains are treated as a loop
+MAX_CHAIN_LENGTH = 16
+
+# Threads resolving a name's other address types while the caller resolves the first
+SIBLING_LOOKUP_WORKERS = int(os.environ.get('DNS_SIBLING_LOOKUP_WORKERS', 64))
+
+# Output prefixes of failures worth retrying (timeouts, SERVFAIL, ...), as opposed to negative answers
+TRANSIENT_ERRORS = ('DNS exception', 'Error resolving')
+
+# (CNAME targets walked, rdata of the final record set)
+ChainResult = Tuple[List[str], Tuple[Any, ...]]
+
+
+def _chain_steps(cache: DNSAnswerCache, name: str, rdtype: str) -> Generator[str, dns.resolver.Answer, ChainResult]:
+    """
+    Walk name's CNAME chain to records of rdtype, asking the driver only for what the cache lacks.
+
+    Yields each name that has to be queried and receives its answer (queried with
+    raise_on_no_answer=False). Every CNAME link seen in an answer is cached on its
+    own, so names sharing a target (e.g. many hosts on one CDN edge name) stop
+    at the first cached link and reuse the target's records; an authoritative
+    server that only returns the first hop costs one query per name, not per hop.
+    """
+    chain: List[str] = []
+    current = name
+    for _ in range(MAX_CHAIN_LENGTH):
+        target = cache.cname_target(current)
+        if target is not None:
+            chain.append(target.rstrip('.'))
+            current = target
+            continue
+
+        cached = cache._cached_or_raise(current, rdtype)
+        if cached is not None:
+            return chain, cached
+
+        answer = yield current
+        chaining = answer.response.resolve_chaining()
+        for rrset in chaining.cnames:
+            cache.put_records(rrset.name.to_text(), dns.rdatatype.CNAME, tuple(rrset), rrset.ttl)
+            chain.append(rrset[0].target.to_text().rstrip('.'))
+
+        if chaining.answer is not None:
+            return chain, cache.put_answer(chaining.canonical_name.to_text(), rdtype, answer)
+        if chaining.canonical_name != dns.name.from_text(current):
+            # The server stopped at a target outside its zones; continue from there
+            current = chaining.canonical_name.to_text()
+            continue
+
+        error = dns.resolver.NoAnswer(response=answer.response)
+        cache.put_negative(current, rdtype, error)
+        raise error
+
+    raise dns.exception.DNSException(f"CNAME chain of {name} is longer than {MAX_CHAIN_LENGTH} links")
+
+
+def _format(name: str, results: Sequence[Tuple[str, Any]]) -> Tuple[List[str], str]:
+    """Merge per-type (rdtype, ChainResult or exception) into (addresses, resolution output)."""
+    addresses: List[str] = []
+    lines: List[str] = []
+    errors: List[Exception] = []
+    chain_reported = False
+    for rdtype, result in results:
+        if isinstance(result, Exception):
+            errors.append(result)
+            continue
+        chain, records = result
+        if chain and not chain_reported:
+            lines.append(f"dnspython: CNAME {' -> '.join([name] + chain)}")
+            chain_reported = True
+        for rdata in records:
+            addresses.append(rdata.address)
+            lines.append(f"dnspython: {rdata.address}")
+
+    if addresses:
+        return addresses, "\n".join(lines)
+    # Transient failures win over negative answers so callers don't treat the name as settled
+    for error in errors:
+        if not isinstance(error, (dns.resolver.NoAnswer, dns.resolver.NXDOMAIN)):
+            if isinstance(error, dns.exception.DNSException):
+                return [], f"DNS exception: {str(error)}"
+            return [], f"Error resolving {name}: {str(error)}"
+    if errors:
+        return [], f"DNS resolution error: {str(errors[0])}"
+    return [], "No results found"
+
+
+def _ends_lookup(result: Any) -> bool:
+    """True when the first type's result settles the name: NXDOMAIN or a transient failure."""
+    return isinstance(result, Exception) and not isinstance(result, dns.resolver.NoAnswer)
+
+
+def _resolve_chain(resolver: dns.resolver.Resolver, cache: DNSAnswerCache, name: str, rdtype: str) -> Any:
+    """Return name's ChainResult for rdtype, or the exception that ended it."""
+    steps = _chain_steps(cache, name, rdtype)
+    try:
+        query = next(steps)
+        while True:
+            try:
+                answer = resolver.resolve(query, rdtype, raise_on_no_answer=False)
+            except dns.resolver.NXDOMAIN as e:
+                cache.put_negative(query, rdtype, e)
+                raise
+            query = steps.send(answer)
+    except StopIteration as done:
+        return done.value
+    except Exception as e:
+        return e
+
+
+async def _resolve_chain_async(resolver, cache: DNSAnswerCache, name: str, rdtype: str) -> Any:
+    """Same as _resolve_chain() for a dns.asyncresolver.Resolver."""
+    steps = _chain_steps(cache, name, rdtype)
+    try:
+        query = next(steps)
+        while True:
+            try:
+                answer = await resolver.resolve(query, rdtype, raise_on_no_answer=False)
+            except dns.resolver.NXDOMAIN as e:
+                cache.put_negative(query, rdtype, e)
+                raise
+            query = steps.send(answer)
+    except StopIteration as done:
+        return done.value
+    except Exception as e:
+        return e
+
+
+def resolve_addresses(resolver: dns.resolver.Resolver, name: str, record_types: Sequence[str] = ADDRESS_TYPES,
+                      cache: DNSAnswerCache = DNS_CACHE) -> Tuple[List[str], str]:
+    """
+    Resolve every address record of name, following and caching its CNAME chain.
+
+    All types are queried at once: the calling thread resolves the first while
+    the others run on a shared pool (or inline after it when the pool is busy).
+    If the first fails with NXDOMAIN or a transient error, the others are only
+    used if they already finished, so a timeout doesn't cost the name twice.
+
+    Args:
+        resolver (dns.resolver.Resolver): Blocking resolver to query
+        name (str): Name to resolve
+        record_types (Sequence[str]): Address types to fetch, in output order
+        cache (DNSAnswerCache): Answer cache holding records and CNAME links
+
+    Returns:
+        Tuple[List[str], str]: (all addresses, resolution output); no addresses on failure
+    """
+    if not record_types:
+        return _format(name, [])
+    siblings = [(rdtype, _SIBLING_POOL.submit(_resolve_chain, resolver, cache, name, rdtype))
+                for rdtype in record_types[1:]]
+    first = _resolve_chain(resolver, cache, name, record_types[0])
+    results = [(record_types[0], first)]
+    settled = _ends_lookup(first)
+    for rdtype, future in siblings:
+        if future.cancel():
+            # Still queued behind other names' lookups
+            if not settled:
+                results.append((rdtype, _resolve_chain(resolver, cache, name, rdtype)))
+        elif future.done() or not settled:
+            results.append((rdtype, future.result()))
+    return _format(name, results)
+
+
+async def resolve_addresses_async(resolver, name: str, record_types: Sequence[str] = ADDRESS_TYPES,
+                                  cache: DNSAnswerCache = DNS_CACHE) -> Tuple[List[str], str]:
+    """Same as resolve_addresses() for a dns.asyncresolver.Resolver; the types are queried concurrently."""
+    if not record_types:
+        return _format(name, [])
+    siblings = [(rdtype, asyncio.ensure_future(_resolve_chain_async(resolver, cache, name, rdtype)))
+                for rdtype in record_types[1:]]
+    try:
+        first = await _resolve_chain_async(resolver, cache, name, record_types[0])
+        results = [(record_types[0], first)]
+        settled = _ends_lookup(first)
+        for rdtype, task in siblings:
+            if task.done() or not settled:
+                results.append((rdtype, await task))
+    finally:
+        # Settled names and callers that gave up (e.g. wait_for timeouts) stop waiting on the rest
+        for _, task in siblings:
+            task.cancel()
+    return _format(name, results)
+
+
+_SIBLING_POOL = ThreadPoolExecutor(max_workers=SIBLING_LOOKUP_WORKERS, thread_name_prefix='dns-sibling')
@@ -0,0 +1,212 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+import dns.exception
+import dns.rdatatype
+import dns.resolver
+
+logger = logging.getLogger('DNS_MAP')
+
+# Rough per-entry bookkeeping cost (key tuple, entry tuple, OrderedDict node)
+ENTRY_OVERHEAD_BYTES = 200
+
+
+class DNSAnswerCache:
+    """
+    Process-wide DNS answer cache shared by every DNS_MAP instance.
+
+    Entries are keyed by (name, rdtype) and expire with the answer's TTL.
+    NXDOMAIN and NoAnswer results are cached negatively with their own TTL.
+    When the estimated size exceeds max_bytes the least recently used
+    entries are evicted.
+    """
+
+    def __init__(self, max_bytes: int = 16 * 1024 * 1024, negative_ttl: int = 60, min_ttl: int = 0):
+        """
+        Initialize the cache.
+
+        Args:
+            max_bytes (int): Approximate memory cap for cached answers
+            negative_ttl (int): Upper bound in seconds for NXDOMAIN/NoAnswer entries
+            min_ttl (int): Floor applied to positive TTLs
+        """
+        self.max_bytes = max_bytes
+        self.negative_ttl = negative_ttl
+        self.min_ttl = min_ttl
+        self._entries: "OrderedDict[Tuple[str, int], Tuple[float, Any, bool, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _key(name: str, rdtype) -> Tuple[str, int]:
+        return str(name).lower().rstrip('.'), int(dns.rdatatype.RdataType.make(rdtype))
+
+    def get(self, name: str, rdtype) -> Optional[Tuple[bool, Any]]:
+        """
+        Look up a cached answer.
+
+        Args:
+            name (str): Query name
+            rdtype: Record type, e.g. 'A' or dns.rdatatype.MX
+
+        Returns:
+            Optional[Tuple[bool, Any]]: (negative, value) or None on a miss. value is a
+            tuple of rdata for positive entries and the original exception for negative ones.
+        """
+        key = self._key(name, rdtype)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            expires_at, value, negative, size = entry
+            if expires_at <= time.time():
+                self._remove(key)
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            if negative:
+                self.negative_hits += 1
+            else:
+                self.hits += 1
+            return negative, value
+
+    def put_answer(self, name: str, rdtype, answer: dns.resolver.Answer) -> Tuple[Any, ...]:
+        """
+        Cache a positive answer until its expiration.
+
+        Returns:
+            Tuple: The cached rdata
+        """
+        records = tuple(answer) if answer.rrset is not None else ()
+        ttl = max(answer.expiration - time.time(), self.min_ttl)
+        size = ENTRY_OVERHEAD_BYTES + sum(len(rdata.to_text()) for rdata in records)
+        self._store(self._key(name, rdtype), time.time() + ttl, records, False, size)
+        return records
+
+    def put_records(self, name: str, rdtype, records: Tuple[Any, ...], ttl: float) -> None:
+        """Cache rdata learned outside a direct query, e.g. the CNAME links of an answer's chain."""
+        size = ENTRY_OVERHEAD_BYTES + sum(len(rdata.to_text()) for rdata in records)
+        self._store(self._key(name, rdtype), time.time() + max(ttl, self.min_ttl), tuple(records), False, size)
+
+    def cname_target(self, name: str) -> Optional[str]:
+        """
+        Return the cached CNAME target of name, if any.
+
+        Not counted in the hit/miss statistics: it is probed for every name a chain walk visits.
+        """
+        key = self._key(name, dns.rdatatype.CNAME)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[2] or entry[0] <= time.time() or not entry[1]:
+                return None
+            return entry[1][0].target.to_text()
+
+    def put_negative(self, name: str, rdtype, error: dns.exception.DNSException) -> None:
+        """Cache an NXDOMAIN or NoAnswer result."""
+        ttl = self._negative_ttl(error)
+        self._store(self._key(name, rdtype), time.time() + ttl, error, True, ENTRY_OVERHEAD_BYTES)
+
+    def resolve(self, resolver: dns.resolver.Resolver, name: str, rdtype) -> Tuple[Any, ...]:
+        """
+        Resolve through the cache with a blocking resolver.
+
+        Returns:
+            Tuple: rdata of the answer
+
+        Raises:
+            dns.resolver.NXDOMAIN, dns.resolver.NoAnswer: Live or cached negative result
+            dns.exception.DNSException: Any other resolution failure (never cached)
+        """
+        cached = self._cached_or_raise(name, rdtype)
+        if cached is not None:
+            return cached
+        try:
+            answer = resolver.resolve(name, rdtype)
+        except (dns.resolver.NXDOMAIN, dns.resolver.NoAnswer) as e:
+            self.put_negative(name, rdtype, e)
+            raise
+        return self.put_answer(name, rdtype, answer)
+
+    async def resolve_async(self, resolver, name: str, rdtype) -> Tuple[Any, ...]:
+        """Same as resolve() for a dns.asyncresolver.Resolver."""
+        cached = self._cached_or_raise(name, rdtype)
+        if cached is not None:
+            return cached
+        try:
+            answer = await resolver.resolve(name, rdtype)
+        except (dns.resolver.NXDOMAIN, dns.resolver.NoAnswer) as e:
+            self.put_negative(name, rdtype, e)
+            raise
+        return self.put_answer(name, rdtype, answer)
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and current occupancy."""
+        with self._lock:
+            lookups = self.hits + self.negative_hits + self.misses
+            return {
+                'hits': self.hits,
+                'negative_hits': self.negative_hits,
+                'misses': self.misses,
+                'hit_ratio': round((self.hits + self.negative_hits) / lookups, 4) if lookups else 0.0,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'evictions': self.evictions,
+            }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _cached_or_raise(self, name: str, rdtype) -> Optional[Tuple[Any, ...]]:
+        cached = self.get(name, rdtype)
+        if cached is None:
+            return None
+        negative, value = cached
+        if negative:
+            raise value.with_traceback(None)
+        return value
+
+    def _negative_ttl(self, error: dns.exception.DNSException) -> int:
+        """Use the SOA minimum from the authority section when present, capped at negative_ttl."""
+        try:
+            if isinstance(error, dns.resolver.NXDOMAIN):
+                response = error.response(error.qnames()[0])
+            else:
+                response = error.kwargs.get('response')
+            for rrset in response.authority:
+                if rrset.rdtype == dns.rdatatype.SOA:
+                    return min(rrset.ttl, rrset[0].minimum, self.negative_ttl)
+        except Exception:
+            pass
+        return self.negative_ttl
+
+    def _store(self, key: Tuple[str, int], expires_at: float, value: Any, negative: bool, size: int) -> None:
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (expires_at, value, negative, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes and self._entries:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def _remove(self, key: Tuple[str, int]) -> None:
+        _, _, _, size = self._entries.pop(key)
+        self._bytes -= size
+
+
+# Shared by all DNS_MAP instances in this process
+DNS_CACHE = DNSAnswerCache()
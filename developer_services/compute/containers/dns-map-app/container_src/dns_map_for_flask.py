@@ -1,19 +1,177 @@
-import re, requests, os
-from typing import List, Tuple, Optional, Dict, Any
-from collections import Counter, defaultdict
+import re
+from typing import List, Tuple, Optional, Dict, Any, Iterable, Iterator
+from collections import defaultdict, deque
 import dns.resolver
 import dns.exception
 import logging
 import ipaddress
-import json
 import time
+from concurrent.futures import ThreadPoolExecutor
 from ipwhois import IPWhois
 from ipwhois.exceptions import IPDefinedError, HTTPLookupError, ASNRegistryError
+from resolver_engine import ResolutionEngine, SubdomainFeed, build_resolver
+from dns_cache import DNS_CACHE
+from batch_resolver import TRANSIENT_ERRORS, resolve_addresses
+from dns_transport import TRANSPORTS, DEFAULT_DNS_TRANSPORT, DEFAULT_DNS_UPSTREAMS
+from ip_org_index import load_ip_org_index, rdap_cidrs
+from asn_database import DEFAULT_ASN_DATABASE_PATH, load_asn_database
+from rdap_pipeline import RDAPPipeline
+from progress_store import PROGRESS_STORE
+from result_model import DNSMapResult, SubdomainSet
+from subdomain_inventory import DEFAULT_LIST_MAX_AGE, DEFAULT_RESOLUTION_MAX_AGE, load_subdomain_inventory
+from keyword_matcher import ProviderMatcher, SubdomainClassifier
+from metrics import ORGANIZATION_LOOKUP_SECONDS, STAGE_SECONDS, RequestTrace
+from security_trails import (SECURITY_TRAILS_BASE_URL, DEFAULT_TIMEOUT as SECURITY_TRAILS_TIMEOUT,
+                             SecurityTrailsClient, SecurityTrailsError, SecurityTrailsTruncated)
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger('DNS_MAP')
 
+# DNS provider mapping dictionary
+MAPPED_DNS_PROVIDERS = {
+    "CLOUDFLARENET": "Cloudflare",
+    "AMAZON-02": "Route53",
+    "AMAZON-AES": "Route53",
+    "SECURITYSERVICES": "UltraDNS",
+    "DIGITALOCEAN-ASN": "DigitalOcean",
+    "DNSIMPLE": "dnsimple",
+    "MICROSOFT-CORP-MSN-AS-BLOCK": "Azure",
+    "NSONE": "NS1",
+    "AKAMAI-ASN2": "Akamai",
+    "GODADDY-DNS": "GoDaddy",
+    "GOOGLE": "Google",
+    "EDGECAST": "Edgecast",
+    "RACKSPACE-LON": "Rackspace",
+    "RMH-14": "Rackspace",
+    "RACKSPACE": "Rackspace",
+    "LUMEN-LEGACY-L3-": "Lumen Technologies",
+    "DEFENSE-NET": "Defense.Net (F5)",
+    "EDNS": "EasyDNS",
+    "RCODEZERO-ANYCAST-SEC1-TLD RcodeZero Anycast DNS": "RcodeZero",
+    "RCODEZERO-ANYCAST-SEC2 RcodeZero Anycast DNS": "RcodeZero",
+    "TIGEE" : "DNSMadeEasy"
+}
+
+# Email hosting provider mapping
+EMAIL_PROVIDERS = {
+    "google": "Google Workspace",
+    "googlemail": "Google Workspace",
+    "gmail": "Google Workspace",
+    "outlook": "Microsoft 365",
+    "hotmail": "Microsoft 365",
+    "office365": "Microsoft 365",
+    "microsoft": "Microsoft 365",
+    "live.com": "Microsoft 365",
+    "mimecast": "Mimecast",
+    "proofpoint": "Proofpoint",
+    "pphosted": "Proofpoint",
+    "protection.outlook.com": "Microsoft 365",
+    "mx.protection.outlook.com": "Microsoft 365",
+    "messagelabs": "Symantec",
+    "zoho": "Zoho Mail",
+    "amazonses": "Amazon SES",
+    "mailgun": "Mailgun",
+    "sendgrid": "SendGrid",
+    "postmarkapp": "Postmark",
+    "aspmx.l.google.com": "Google Workspace",
+    "mx.yandex": "Yandex Mail",
+    "mail.ru": "Mail.ru",
+    "yahoodns": "Yahoo Mail",
+    "mx.mail.yahoo.com": "Yahoo Mail",
+    "mx1.ovh": "OVH",
+    "gmx": "GMX",
+    "mailhostbox": "Hostbox",
+    "mx.zoho": "Zoho Mail",
+    "barracuda": "Barracuda",
+    "spamexperts": "SpamExperts",
+    "kaspersky": "Kaspersky",
+    "hostedemail": "Rackspace Email",
+    "exchangelabs": "Microsoft 365",
+    "emailsrvr": "Rackspace Email",
+    "mxroute": "MXroute",
+    "fastmail": "FastMail"
+}
+
+# Common hosting providers for backup matching of IP organizations
+HOSTING_PROVIDERS = {
+    "amazon": "Amazon AWS",
+    "aws": "Amazon AWS",
+    "amazon web services": "Amazon AWS",
+    "azure": "Microsoft Azure",
+    "microsoft": "Microsoft",
+    "google": "Google Cloud",
+    "googlecloud": "Google Cloud",
+    "cloudflare": "Cloudflare",
+    "digitalocean": "DigitalOcean",
+    "linode": "Linode",
+    "ovh": "OVH",
+    "rackspace": "Rackspace",
+    "vultr": "Vultr",
+    "hetzner": "Hetzner",
+    "godaddy": "GoDaddy",
+    "hostgator": "HostGator",
+    "namecheap": "Namecheap",
+    "gandi": "Gandi",
+    "ionos": "IONOS",
+    "dreamhost": "DreamHost",
+    "bluehost": "Bluehost"
+}
+
+# Fallback for NS servers that match no MAPPED_DNS_PROVIDERS key
+COMMON_DNS_PROVIDERS = {
+    "cloudflare": "Cloudflare",
+    "awsdns": "Amazon Route53",
+    "amazon": "Amazon Route53",
+    "azure": "Microsoft Azure",
+    "microsoft": "Microsoft Azure",
+    "google": "Google Cloud DNS",
+    "googledomains": "Google Domains",
+    "godaddy": "GoDaddy",
+    "domaincontrol": "GoDaddy",
+    "ns1": "NS1",
+    "ns2": "NS1",
+    "dnsmadeeasy": "DNS Made Easy",
+    "dnsimple": "DNSimple",
+    "cloudns": "ClouDNS",
+    "namecheap": "Namecheap",
+    "hostgator": "HostGator",
+    "digitalocean": "DigitalOcean",
+    "linode": "Linode",
+    "dyn": "Oracle Dyn",
+    "nsone": "NS1",
+    "akamai": "Akamai",
+    "ultradns": "UltraDNS",
+    "rackspace": "Rackspace",
+    "zonomi": "Zonomi",
+    "easydns": "EasyDNS",
+    "hover": "Hover",
+    "rage4": "Rage4",
+    "constellix": "Constellix",
+    "rcodezero": "RcodeZero"
+}
+
+# Compiled once: each lookup is a single regex scan instead of one substring test per key.
+# NS server names are upper-cased before matching MAPPED_DNS_PROVIDERS, so its keys match case-sensitively.
+DNS_PROVIDER_MATCHER = ProviderMatcher(MAPPED_DNS_PROVIDERS, ignore_case=False)
+COMMON_DNS_PROVIDER_MATCHER = ProviderMatcher(COMMON_DNS_PROVIDERS)
+EMAIL_PROVIDER_MATCHER = ProviderMatcher(EMAIL_PROVIDERS)
+HOSTING_PROVIDER_MATCHER = ProviderMatcher(HOSTING_PROVIDERS)
+
+# Special subdomain types: (keywords that select a name, keywords that exclude it)
+SUBDOMAIN_CATEGORIES = {
+    'secure': (["secure"], []),
+    'access': (["access"], []),
+    'remote': (["remote"], []),
+    # For API subdomains, exclude some false positives
+    'api': (["api"], ["capital", "rapid", "capitol"]),
+    'vpn': (["vpn"], []),
+}
+SUBDOMAIN_CLASSIFIER = SubdomainClassifier(SUBDOMAIN_CATEGORIES)
+
+class DNSMapCancelled(Exception):
+    """Raised by DNS_MAP.dns_map() when its cancel_event is set mid-run."""
+
 class DNS_MAP:
     """
     A class to map DNS information for a given apex domain, including
@@ -28,6 +186,28 @@ class DNS_MAP:
         Args:
             apex_domain (str): The apex domain to analyze (e.g., example.com)
             security_trails_api_keys (List[str], optional): List of API keys for Security Trails
+            security_trails_base_url (str, optional): Security Trails API root (default: the public API)
+            security_trails_timeout (Tuple[float, float], optional): (connect, read) timeouts for Security Trails
+            resolver_mode (str, optional): 'thread' or 'async' subdomain resolution (default: 'thread')
+            max_in_flight (int, optional): Maximum concurrent subdomain lookups (default: 32)
+            query_timeout (float, optional): Per-query deadline in seconds (default: 10)
+            nameservers (List[str], optional): Upstream DNS servers (DoH URLs for the 'doh' transport);
+                DNS_UPSTREAMS environment variable, then the system resolver, when omitted
+            dns_port (int, optional): Port of the upstream DNS servers (default: 53)
+            dns_transport (str, optional): 'udp', pipelined 'tcp' or 'doh' (default: DNS_TRANSPORT
+                environment variable, else 'udp'); tcp/doh route each query to the fastest upstream
+            asn_database_path (str, optional): ip2asn-style TSV enabling offline batch attribution
+                (default: ASN_DATABASE_PATH environment variable)
+            rdap_mode (str, optional): 'async' RDAP pipeline or 'serial' per-IP lookups (default: 'async')
+            rdap_concurrency (int, optional): Maximum RDAP requests in flight (default: 16)
+            rdap_bootstrap_urls (Dict[int, str], optional): RDAP bootstrap URL per IP version
+            progress_store (ProgressStore, optional): Where progress is published (default: PROGRESS_STORE)
+            cancel_event (threading.Event, optional): Set to abort a running dns_map() between steps
+            inventory (SubdomainInventory, optional): Stored subdomain lists and answers
+                (default: the process-wide one from load_subdomain_inventory(); None disables it)
+            subdomain_list_max_age (float, optional): Seconds a stored subdomain list is reused (default: 1 day)
+            resolution_max_age (float, optional): Seconds a stored address answer is reused (default: 6 hours)
+            trace (bool, optional): Keep per-stage and per-lookup timings in self.trace (default: False)
         """
         self.a_records = []
         self.ns_records = []
@@ -35,77 +215,62 @@ class DNS_MAP:
         self.apex_domain = kwargs.get('apex_domain', '')
         self.security_trails_api_keys = kwargs.get('security_trails_api_keys', [])
         self.security_trails_error = None
+        self.subdomains_fallback = False
+        self.security_trails_base_url = kwargs.get('security_trails_base_url', SECURITY_TRAILS_BASE_URL)
+        self.security_trails_timeout = kwargs.get('security_trails_timeout', SECURITY_TRAILS_TIMEOUT)
+        self.stage_timings = {}
+        self.query_timeout = kwargs.get('query_timeout', 10)
+        self.nameservers = kwargs.get('nameservers') or DEFAULT_DNS_UPSTREAMS or None
+        self.dns_port = kwargs.get('dns_port', 53)
+        self.dns_transport = kwargs.get('dns_transport', DEFAULT_DNS_TRANSPORT)
+        self.asn_database_path = kwargs.get('asn_database_path', DEFAULT_ASN_DATABASE_PATH)
+        self.rdap_mode = kwargs.get('rdap_mode', 'async')
+        self.rdap_concurrency = kwargs.get('rdap_concurrency', 16)
+        self.rdap_bootstrap_urls = kwargs.get('rdap_bootstrap_urls')
+        self.progress_store = kwargs.get('progress_store', PROGRESS_STORE)
+        self.cancel_event = kwargs.get('cancel_event')
+        self.inventory = kwargs['inventory'] if 'inventory' in kwargs else load_subdomain_inventory()
+        self.ip_org_index = load_ip_org_index()
+        self.subdomain_list_max_age = kwargs.get('subdomain_list_max_age', DEFAULT_LIST_MAX_AGE)
+        self.resolution_max_age = kwargs.get('resolution_max_age', DEFAULT_RESOLUTION_MAX_AGE)
+        # Process-wide histograms are always fed; a trace is only kept when asked for
+        self.trace = RequestTrace() if kwargs.get('trace') else None
         
         # Validate the apex domain
         if not self._validate_apex_domain(self.apex_domain):
             raise ValueError(f"Invalid apex domain format: {self.apex_domain}")
+        
+        if self.rdap_mode not in ('async', 'serial'):
+            raise ValueError(f"Invalid RDAP mode: {self.rdap_mode}. Expected 'async' or 'serial'")
+        
+        if self.dns_transport not in TRANSPORTS:
+            raise ValueError(f"Invalid DNS transport: {self.dns_transport}. Expected one of {', '.join(TRANSPORTS)}")
             
         logger.info(f"Initializing DNS_MAP for domain: {self.apex_domain}")
 
-        # DNS provider mapping dictionary
-        self.mapped_DNS_providers = {
-            "CLOUDFLARENET": "Cloudflare",
-            "AMAZON-02": "Route53",
-            "AMAZON-AES": "Route53",
-            "SECURITYSERVICES": "UltraDNS",
-            "DIGITALOCEAN-ASN": "DigitalOcean",
-            "DNSIMPLE": "dnsimple",
-            "MICROSOFT-CORP-MSN-AS-BLOCK": "Azure",
-            "NSONE": "NS1",
-            "AKAMAI-ASN2": "Akamai",
-            "GODADDY-DNS": "GoDaddy",
-            "GOOGLE": "Google",
-            "EDGECAST": "Edgecast",
-            "RACKSPACE-LON": "Rackspace",
-            "RMH-14": "Rackspace",
-            "RACKSPACE": "Rackspace",
-            "LUMEN-LEGACY-L3-": "Lumen Technologies",
-            "DEFENSE-NET": "Defense.Net (F5)",
-            "EDNS": "EasyDNS",
-            "RCODEZERO-ANYCAST-SEC1-TLD RcodeZero Anycast DNS": "RcodeZero",
-            "RCODEZERO-ANYCAST-SEC2 RcodeZero Anycast DNS": "RcodeZero",
-            "TIGEE" : "DNSMadeEasy"
-        }
-        
-        # Email hosting provider mapping
-        self.email_providers = {
-            "google": "Google Workspace",
-            "googlemail": "Google Workspace",
-            "gmail": "Google Workspace",
-            "outlook": "Microsoft 365",
-            "hotmail": "Microsoft 365",
-            "office365": "Microsoft 365",
-            "microsoft": "Microsoft 365",
-            "live.com": "Microsoft 365",
-            "mimecast": "Mimecast",
-            "proofpoint": "Proofpoint",
-            "pphosted": "Proofpoint",
-            "protection.outlook.com": "Microsoft 365",
-            "mx.protection.outlook.com": "Microsoft 365",
-            "messagelabs": "Symantec",
-            "zoho": "Zoho Mail",
-            "amazonses": "Amazon SES",
-            "mailgun": "Mailgun",
-            "sendgrid": "SendGrid",
-            "postmarkapp": "Postmark",
-            "aspmx.l.google.com": "Google Workspace",
-            "mx.yandex": "Yandex Mail",
-            "mail.ru": "Mail.ru",
-            "yahoodns": "Yahoo Mail",
-            "mx.mail.yahoo.com": "Yahoo Mail",
-            "mx1.ovh": "OVH",
-            "gmx": "GMX",
-            "mailhostbox": "Hostbox",
-            "mx.zoho": "Zoho Mail",
-            "barracuda": "Barracuda",
-            "spamexperts": "SpamExperts",
-            "kaspersky": "Kaspersky",
-            "hostedemail": "Rackspace Email",
-            "exchangelabs": "Microsoft 365",
-            "emailsrvr": "Rackspace Email",
-            "mxroute": "MXroute",
-            "fastmail": "FastMail"
-        }
+        # One resolver per instance; answers are shared process-wide through DNS_CACHE
+        self.resolver = build_resolver(self.query_timeout, self.nameservers, self.dns_port,
+                                       transport=self.dns_transport)
+
+        # Offline IP -> organization table, shared (memory-mapped) by all workers
+        self.asn_database = load_asn_database(self.asn_database_path) if self.asn_database_path else None
+
+        # Bounded-concurrency engine used by _dig_all_subdomains
+        self.resolution_engine = ResolutionEngine(
+            mode=kwargs.get('resolver_mode', 'thread'),
+            max_in_flight=kwargs.get('max_in_flight', 32),
+            query_timeout=self.query_timeout,
+            lookup=self._dig_addresses,
+            nameservers=self.nameservers,
+            port=self.dns_port,
+            transport=self.dns_transport,
+            trace=self.trace,
+        )
+
+        # Provider tables are module-level so their matchers are compiled once at import
+        self.mapped_DNS_providers = MAPPED_DNS_PROVIDERS
+        self.email_providers = EMAIL_PROVIDERS
+        self.hosting_providers = HOSTING_PROVIDERS
 
     def _validate_apex_domain(self, domain: str) -> bool:
         """
@@ -137,87 +302,87 @@ class DNS_MAP:
             Tuple of lists containing different types of subdomains:
             (secure_subdomains, access_subdomains, remote_subdomains, api_subdomains, vpn_subdomains, all_subdomains)
         """
+        all_subdomains = [subdomain for page in self.iter_subdomain_pages() for subdomain in page]
+        return self._classify_subdomains(all_subdomains) + (all_subdomains,)
+
+    def iter_subdomain_pages(self) -> Iterator[List[str]]:
+        """
+        Fetch subdomains from Security Trails API, yielding them page by page as they arrive.
+        A listing stored in the inventory within subdomain_list_max_age is reused instead.
+        If every API key fails, security_trails_error is set and a basic fallback page is yielded.
+        
+        Yields:
+            List[str]: Fully qualified subdomains
+        """
+        if self.inventory is not None:
+            stored = self._inventory_call('listing', self.apex_domain, self.subdomain_list_max_age)
+            if stored:
+                logger.info(f"Using {len(stored)} stored subdomains for {self.apex_domain}")
+                for start in range(0, len(stored), 500):
+                    yield stored[start:start + 500]
+                return
+        
         logger.info(f"Fetching subdomains for {self.apex_domain} from Security Trails API")
         
         if not self.security_trails_api_keys:
             logger.warning("No Security Trails API keys provided")
             self.security_trails_error = "No Security Trails API keys provided"
+            self.subdomains_fallback = True
             # If no API keys, create some basic subdomain entries for the main domain
-            all_subdomains = [self.apex_domain, f"www.{self.apex_domain}", f"mail.{self.apex_domain}"]
-            return [], [], [], [], [], all_subdomains
+            yield [self.apex_domain, f"www.{self.apex_domain}", f"mail.{self.apex_domain}"]
+            return
         
-        # Try each API key in sequence
-        for i, api_key in enumerate(self.security_trails_api_keys):
-            try:
-                logger.info(f"Trying Security Trails API key {i+1}/{len(self.security_trails_api_keys)}")
-                
-                # API endpoint
-                url = f"https://api.securitytrails.com/v1/domain/{self.apex_domain}/subdomains?children_only=false"
-                
-                # Set headers with API key
-                headers = {
-                    "accept": "application/json", 
-                    "apikey": api_key
-                }
-                
-                # Make the API request
-                response = requests.get(url, headers=headers)
-                
-                # Check if the request was successful
-                if response.status_code == 200:
-                    # Parse JSON response
-                    data = response.json()
-                    
-                    # Extract subdomains
-                    subdomain_list = data.get('subdomains', [])
-                    
-                    # Convert to fully qualified domain names
-                    all_subdomains = [f"{s}.{self.apex_domain}" for s in subdomain_list]
-                    
-                    # Filter for special subdomain types
-                    secure_subdomains = [s for s in all_subdomains if any(keyword in s.lower() for keyword in ["secure"])]
-                    access_subdomains = [s for s in all_subdomains if any(keyword in s.lower() for keyword in ["access"])]
-                    remote_subdomains = [s for s in all_subdomains if any(keyword in s.lower() for keyword in ["remote"])]
-                    
-                    # For API subdomains, exclude some false positives
-                    api_subdomains_raw = [s for s in all_subdomains if any(keyword in s.lower() for keyword in ["api"])]
-                    api_subdomains = [s for s in api_subdomains_raw if "capital" not in s.lower() and "rapid" not in s.lower() and "capitol" not in s.lower()]
-                    
-                    vpn_subdomains = [s for s in all_subdomains if any(keyword in s.lower() for keyword in ["vpn"])]
-                    
-                    logger.info(f"Found {len(all_subdomains)} subdomains for {self.apex_domain}")
-                    
-                    return secure_subdomains, access_subdomains, remote_subdomains, api_subdomains, vpn_subdomains, all_subdomains
-                
-                # Handle specific error codes
-                elif response.status_code == 401:
-                    # Authentication error - try next API key
-                    logger.warning(f"API key {i+1} unauthorized, trying next key if available")
-                    continue
-                    
-                elif response.status_code == 429:
-                    # Rate limit exceeded - try next API key
-                    logger.warning(f"API key {i+1} rate limit exceeded, trying next key if available")
-                    continue
-                    
-                else:
-                    # Other error - log and try next key
-                    logger.warning(f"API key {i+1} returned status code {response.status_code}: {response.text}")
-                    continue
-                    
-            except Exception as e:
-                # Exception with this API key - try next one
-                logger.warning(f"Error with API key {i+1}: {str(e)}")
-                continue
+        client = SecurityTrailsClient(self.security_trails_api_keys, base_url=self.security_trails_base_url,
+                                      timeout=self.security_trails_timeout)
+        fetched = []
+        try:
+            for page in client.iter_subdomains(self.apex_domain):
+                # Convert to fully qualified domain names
+                page = [f"{s}.{self.apex_domain}" for s in page]
+                fetched.extend(page)
+                yield page
+            if self.inventory is not None:
+                self._inventory_call('record_listing', self.apex_domain, fetched)
+            return
+        except SecurityTrailsTruncated as e:
+            # Keep what arrived, but flag the map as incomplete
+            logger.error(str(e))
+            self.security_trails_error = f"{str(e)}. Results are partial."
+            return
+        except SecurityTrailsError as e:
+            error_msg = str(e)
         
         # If we've tried all keys without success, report the error
-        error_msg = "All Security Trails API keys failed. Please check your API keys and try again."
         logger.error(error_msg)
         self.security_trails_error = error_msg
+        self.subdomains_fallback = True
         
         # If all API calls fail, create some basic subdomain entries for the main domain
-        all_subdomains = [self.apex_domain, f"www.{self.apex_domain}", f"mail.{self.apex_domain}"]
-        return [], [], [], [], [], all_subdomains
+        yield [self.apex_domain, f"www.{self.apex_domain}", f"mail.{self.apex_domain}"]
+
+    def _classify_subdomains(self, all_subdomains: List[str]) -> Tuple[List[str], List[str], List[str], List[str], List[str]]:
+        """
+        Pick out the special subdomain types.
+        
+        Args:
+            all_subdomains (List[str]): Fully qualified subdomains
+            
+        Returns:
+            Tuple of (secure_subdomains, access_subdomains, remote_subdomains, api_subdomains, vpn_subdomains),
+            all empty when the list is only the fallback used after a Security Trails failure
+        """
+        if self.subdomains_fallback:
+            return [], [], [], [], []
+        
+        # Filter for special subdomain types in one pass over the list
+        classified = SUBDOMAIN_CLASSIFIER.classify(all_subdomains)
+        secure_subdomains = classified['secure']
+        access_subdomains = classified['access']
+        remote_subdomains = classified['remote']
+        api_subdomains = classified['api']
+        vpn_subdomains = classified['vpn']
+        
+        return secure_subdomains, access_subdomains, remote_subdomains, api_subdomains, vpn_subdomains
 
     def dns_map(self) -> Tuple[List[str], List[str], List[str], List[str], List[str], List[str], List[str], List[str], List[str], Optional[str]]:
         """
@@ -228,44 +393,114 @@ class DNS_MAP:
             (mapped_dns_hosts, mx_records, a_records, secure_subdomains, access_subdomains, 
              remote_subdomains, api_subdomains, vpn_subdomains, all_subdomains, security_trails_error)
         """
+        return self.map_result().as_tuple()
+
+    def map_result(self) -> DNSMapResult:
+        """
+        Generate a comprehensive DNS map for the apex domain, in its compact form.
+        
+        The stages overlap: NS/MX lookups run alongside the Security Trails fetch,
+        A-record resolution consumes subdomains as pages arrive, and organization
+        attribution consumes resolved IPs from the RDAP pipeline. Per-stage wall
+        times are recorded in self.stage_timings.
+        
+        Returns:
+            DNSMapResult: Subdomains stored once, with categories as index arrays into them
+        """
         logger.info(f"Generating DNS map for {self.apex_domain}")
+        self.stage_timings = {}
+        started = time.perf_counter()
         
         try:
-            # Get subdomains
-            secure_subdomains, access_subdomains, remote_subdomains, api_subdomains, vpn_subdomains, all_subdomains = self.get_all_subdomains()
-            
-            # Parse NS & MX records
-            self.mx_records, self.ns_records = self._get_dns_records()
+            with ThreadPoolExecutor(max_workers=2, thread_name_prefix='dns-map-stage') as stages:
+                # Parse NS & MX records while subdomains are being fetched
+                records_future = stages.submit(self._timed_stage, 'dns_records', self._get_dns_records)
+                
+                # Get subdomains, handing each page to the resolver as soon as it arrives
+                feed = SubdomainFeed()
+                subdomains_future = stages.submit(self._timed_stage, 'subdomains', self._produce_subdomains, feed)
+                
+                # Parse A records by digging all subdomains
+                company_to_ips = self._timed_stage('resolution', self._dig_all_subdomains, feed)
+                
+                all_subdomains = subdomains_future.result()
+                self.mx_records, self.ns_records = records_future.result()
             
-            # Parse A records by digging all subdomains
-            company_to_ips = self._dig_all_subdomains(all_subdomains)
+            # Categories index into the subdomain list rather than copying names out of it
+            categories = {} if self.subdomains_fallback else SUBDOMAIN_CLASSIFIER.classify_indices(all_subdomains)
             
             # Transform company-to-IPs mapping into formatted A records
             self.a_records = self._format_company_ips(company_to_ips)
             
             # Map DNS providers
-            mapped_dns_hosts = self._map_dns_providers()
+            mapped_dns_hosts = self._timed_stage('dns_providers', self._map_dns_providers)
             
             # Map email providers
-            self.mx_records = self._map_email_providers(self.mx_records)
+            self.mx_records = self._timed_stage('email_providers', self._map_email_providers, self.mx_records)
+            
+            self.stage_timings['total'] = round(time.perf_counter() - started, 3)
+            STAGE_SECONDS.observe(self.stage_timings['total'], stage='total')
+            logger.info(f"Stage timings for {self.apex_domain}: {self.stage_timings}")
             
-            return (
+            self._check_cancelled()
+            return DNSMapResult(
+                self.apex_domain,
                 mapped_dns_hosts,
                 self.mx_records,
                 self.a_records,
-                secure_subdomains, 
-                access_subdomains, 
-                remote_subdomains, 
-                api_subdomains, 
-                vpn_subdomains, 
-                all_subdomains,
+                SubdomainSet(all_subdomains, categories),
                 self.security_trails_error
             )
             
+        except DNSMapCancelled:
+            logger.info(f"DNS map for {self.apex_domain} cancelled")
+            raise
         except Exception as e:
             logger.error(f"Error generating DNS map: {str(e)}")
             raise RuntimeError(f"Failed to generate DNS map: {str(e)}")
 
+    def _produce_subdomains(self, feed: SubdomainFeed) -> List[str]:
+        """
+        Push Security Trails pages into the feed consumed by _dig_all_subdomains.
+        
+        Args:
+            feed (SubdomainFeed): Feed to fill; always closed, even on error
+            
+        Returns:
+            List[str]: Every subdomain received
+        """
+        all_subdomains = []
+        try:
+            for page in self.iter_subdomain_pages():
+                # Stop paging; closing the feed lets the resolution stage wind down too
+                if self._is_cancelled():
+                    break
+                all_subdomains.extend(page)
+                feed.extend(page)
+        finally:
+            feed.close()
+        return all_subdomains
+
+    def _is_cancelled(self) -> bool:
+        return self.cancel_event is not None and self.cancel_event.is_set()
+
+    def _check_cancelled(self) -> None:
+        """Raise DNSMapCancelled if the caller asked for this run to stop."""
+        if self._is_cancelled():
+            raise DNSMapCancelled(f"DNS map for {self.apex_domain} was cancelled")
+
+    def _timed_stage(self, stage: str, func, *args):
+        """Run one pipeline stage and record its wall time in self.stage_timings, the metrics and the trace."""
+        start = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            seconds = time.perf_counter() - start
+            self.stage_timings[stage] = round(seconds, 3)
+            STAGE_SECONDS.observe(seconds, stage=stage)
+            if self.trace is not None:
+                self.trace.span(stage, start, seconds)
+
     def _get_dns_records(self) -> Tuple[List[str], List[str]]:
         """
         Get MX and NS records for the domain.
@@ -281,7 +516,7 @@ class DNS_MAP:
         try:
             # Get MX records
             try:
-                mx_answers = dns.resolver.resolve(self.apex_domain, 'MX')
+                mx_answers = DNS_CACHE.resolve(self.resolver, self.apex_domain, 'MX')
                 for rdata in mx_answers:
                     priority = rdata.preference
                     exchange = rdata.exchange.to_text().rstrip('.')
@@ -291,7 +526,7 @@ class DNS_MAP:
             
             # Get NS records
             try:
-                ns_answers = dns.resolver.resolve(self.apex_domain, 'NS')
+                ns_answers = DNS_CACHE.resolve(self.resolver, self.apex_domain, 'NS')
                 for rdata in ns_answers:
                     ns_server = rdata.to_text().rstrip('.')
                     ns_records.append(f"Name Server: {ns_server}")
@@ -317,18 +552,8 @@ class DNS_MAP:
         providers = set()
         
         for record in mx_records:
-            provider_found = False
-            
-            # Check if the record matches any known email provider
-            for provider_key, provider_name in self.email_providers.items():
-                if provider_key.lower() in record.lower():
-                    providers.add(provider_name)
-                    provider_found = True
-                    break
-            
-            # If no provider match found, add generic provider
-            if not provider_found:
-                providers.add("Custom Email Server")
+            # Known email provider, or a generic provider if none matches
+            providers.add(EMAIL_PROVIDER_MATCHER.match(record, "Custom Email Server"))
         
         # Convert set to list
         provider_list = list(providers)
@@ -339,54 +564,36 @@ class DNS_MAP:
             
         return provider_list
 
-    def _dig_ip(self, subdomain: str) -> Tuple[Optional[str], str]:
+    def _dig_addresses(self, subdomain: str) -> Tuple[List[str], str]:
         """
-        Use dnspython to resolve the IP address for a subdomain.
-        Completely replaced the 'dig' command with pure Python implementation.
+        Use dnspython to resolve every IPv4 and IPv6 address of a subdomain.
+        
+        CNAME links are cached on their own, so names pointing at the same CDN
+        target share its records instead of resolving the chain again.
         
         Args:
             subdomain (str): The subdomain to query
             
         Returns:
-            Tuple[Optional[str], str]: The IP address if found and the full output
+            Tuple[List[str], str]: The addresses found (empty on failure) and the full output
         """
         try:
-            # Configure resolver with longer timeout
-            resolver = dns.resolver.Resolver()
-            resolver.timeout = 10
-            resolver.lifetime = 10
-            
-            answers = resolver.resolve(subdomain, 'A')
-            dns_python_output = []
-            
-            # Get the first IP address (we can only return one)
-            for rdata in answers:
-                ip = rdata.address
-                dns_python_output.append(f"dnspython: {ip}")
-                # Return the first IP address and the full output
-                return ip, "\n".join(dns_python_output)
-                
-            return None, "No results found"
-            
-        except (dns.resolver.NoAnswer, dns.resolver.NXDOMAIN) as e:
-            return None, f"DNS resolution error: {str(e)}"
-        except dns.exception.DNSException as e:
-            return None, f"DNS exception: {str(e)}"
+            return resolve_addresses(self.resolver, subdomain)
         except Exception as e:
-            return None, f"Error resolving {subdomain}: {str(e)}"
+            return [], f"Error resolving {subdomain}: {str(e)}"
 
-    def _dig_all_subdomains(self, subdomains: List[str]) -> Dict[str, List[str]]:
+    def _dig_all_subdomains(self, subdomains: Iterable[str]) -> Dict[str, List[str]]:
         """
         Resolve all subdomains to get IPs and organize by company.
         
         Args:
-            subdomains (List[str]): List of subdomains to resolve
+            subdomains (Iterable[str]): List of subdomains, or a SubdomainFeed still being filled
             
         Returns:
             Dict[str, List[str]]: A mapping of company names to lists of IP addresses
         """
         total_subdomains = len(subdomains)
-        logger.info(f"Resolving {total_subdomains} subdomains for IP information. This may take some time.")
+        logger.info(f"Resolving {total_subdomains or 'incoming'} subdomains for IP information. This may take some time.")
         
         # Dictionary to store company -> IPs mapping
         company_to_ips = defaultdict(list)
@@ -404,59 +611,218 @@ class DNS_MAP:
         # Save initial progress to a file for UI to read
         self._save_progress(progress)
         
-        # Process all subdomains without limitation
-        for i, subdomain in enumerate(subdomains):
-            try:
-                # Update progress
-                progress['current'] = i + 1
-                progress['percent'] = round((i + 1) / total_subdomains * 100, 1)
-                progress['last_domain'] = subdomain
-                progress['status'] = f"Resolving {i+1}/{total_subdomains} ({progress['percent']}%)"
-                
-                # Get IP address and full dig output for subdomain
-                ip, resolution_output = self._dig_ip(subdomain)
-                
-                
-                if ip:
-                    # Get company name for this IP
-                    company = self._get_organization_for_ip(ip)
+        # IPs awaiting batch attribution when the offline ASN database is enabled
+        resolved_ips = []
+        
+        # Cache misses are attributed asynchronously and streamed back into company_to_ips
+        rdap_pipeline = self._create_rdap_pipeline()
+        
+        try:
+            # Resolve concurrently; results arrive in completion order
+            for i, (subdomain, addresses, resolution_output) in enumerate(self._resolve_subdomains(subdomains)):
+                # Leaving the loop stops the engine from starting further lookups
+                self._check_cancelled()
+                try:
+                    # A feed grows while subdomain pages are still arriving
+                    total_subdomains = max(len(subdomains), i + 1)
+                    progress['total'] = total_subdomains
+                    
+                    # Update progress
+                    progress['current'] = i + 1
+                    progress['percent'] = round((i + 1) / total_subdomains * 100, 1)
+                    progress['last_domain'] = subdomain
+                    progress['status'] = f"Resolving {i+1}/{total_subdomains} ({progress['percent']}%)"
+                    company = None
                     
+                    for ip in addresses:
+                        if self.asn_database is not None:
+                            # Attributed in one batch once every subdomain is resolved
+                            resolved_ips.append(ip)
+                        elif rdap_pipeline is not None:
+                            rdap_pipeline.submit(ip)
+                        else:
+                            # Get company name for this IP
+                            company = self._get_organization_for_ip(ip)
+                            
+                            # Add IP to the company's list
+                            company_to_ips[company].append(ip)
                     
-                    # Add IP to the company's list
-                    company_to_ips[company].append(ip)
+                    # Fold in organizations the RDAP stage finished meanwhile
+                    if rdap_pipeline is not None:
+                        for _, found in self._collect_organizations(rdap_pipeline.completed(), company_to_ips):
+                            company = found
                     
                     # Update companies found count
                     progress['companies_found'] = len(company_to_ips)
                     
-                    # Update progress with latest company found
-                    if i % 5 == 0 or i == total_subdomains - 1:
-                        progress['status'] = f"Resolving {i+1}/{total_subdomains} ({progress['percent']}%) - Found {company}"
-                        logger.info(progress['status'])
-                        self._save_progress(progress)
-                else:
-                    # Update progress periodically even if no IP found
+                    # Update progress periodically, with the latest company found if any
                     if i % 5 == 0 or i == total_subdomains - 1:
+                        if company:
+                            progress['status'] = f"Resolving {i+1}/{total_subdomains} ({progress['percent']}%) - Found {company}"
                         logger.info(progress['status'])
                         self._save_progress(progress)
-                
-            except Exception as e:
-                logger.warning(f"Error resolving subdomain {subdomain}: {str(e)}")
-                # Log the error
+                    
+                except Exception as e:
+                    logger.warning(f"Error resolving subdomain {subdomain}: {str(e)}")
+                    # Log the error
+                    self._save_progress(progress)
+                    continue
+            
+            self._check_cancelled()
+            if resolved_ips:
+                progress['status'] = f"Attributing {len(resolved_ips)} IPs from the ASN database"
                 self._save_progress(progress)
-                continue
+                self._attribute_ips_offline(resolved_ips, company_to_ips, rdap_pipeline)
+            
+            if rdap_pipeline is not None:
+                progress['status'] = "Waiting for remaining organization lookups..."
+                self._save_progress(progress)
+                for _ in self._collect_organizations(rdap_pipeline.finish(), company_to_ips):
+                    progress['companies_found'] = len(company_to_ips)
+                logger.info(f"RDAP pipeline stats: {rdap_pipeline.stats}")
+        finally:
+            if rdap_pipeline is not None:
+                rdap_pipeline.close()
+        
+        progress['companies_found'] = len(company_to_ips)
+        
+        # Persist newly learned IP ranges for the next container start
+        self.ip_org_index.save()
         
         # Final progress update
+        total_subdomains = len(subdomains)
+        progress['total'] = total_subdomains
         progress['status'] = f"Completed resolving {total_subdomains} subdomains. Found {len(company_to_ips)} companies."
         progress['percent'] = 100
+        # Tells /dns/progress/<domain>/stream viewers to close their stream
+        progress['finished'] = True
         self._save_progress(progress)
                 
         logger.info(f"Found IPs belonging to {len(company_to_ips)} different companies")
         return company_to_ips
 
+    def _resolve_subdomains(self, subdomains: Iterable[str]) -> Iterator[Tuple[str, List[str], str]]:
+        """
+        Resolve subdomains through the engine, reusing answers the inventory holds.
+        
+        Names with an answer younger than resolution_max_age are diverted before they
+        reach the engine and yielded from the store; new definitive answers are written
+        back in batches.
+        
+        Yields:
+            Tuple: (subdomain, addresses, resolution output)
+        """
+        if self.inventory is None:
+            yield from self.resolution_engine.resolve(subdomains)
+            return
+        
+        stored = self._inventory_call('resolutions', self.apex_domain, self.resolution_max_age) or {}
+        # Filled by whichever thread pulls names into the engine; deque appends are thread-safe
+        reused = deque()
+        
+        def stale():
+            for subdomain in subdomains:
+                if subdomain in stored:
+                    reused.append((subdomain,) + stored[subdomain])
+                else:
+                    yield subdomain
+        
+        resolved = []
+        reused_count = 0
+        try:
+            for result in self.resolution_engine.resolve(stale()):
+                while reused:
+                    reused_count += 1
+                    yield reused.popleft()
+                # Timeouts and other transient failures are retried next time
+                if result[1] or not result[2].startswith(TRANSIENT_ERRORS):
+                    resolved.append(result)
+                    if len(resolved) >= 500:
+                        self._inventory_call('record_resolutions', self.apex_domain, resolved)
+                        resolved = []
+                yield result
+            while reused:
+                reused_count += 1
+                yield reused.popleft()
+        finally:
+            if resolved:
+                self._inventory_call('record_resolutions', self.apex_domain, resolved)
+        logger.info(f"Reused {reused_count} stored answers for {self.apex_domain}")
+
+    def _inventory_call(self, method: str, *args):
+        """Call a SubdomainInventory method; the inventory is an optimization, so errors are only logged."""
+        try:
+            return getattr(self.inventory, method)(*args)
+        except Exception as e:
+            logger.warning(f"Subdomain inventory {method} failed: {str(e)}")
+            return None
+
+    def _create_rdap_pipeline(self) -> Optional[RDAPPipeline]:
+        """
+        Start the asynchronous RDAP stage unless serial lookups were requested.
+        
+        Returns:
+            Optional[RDAPPipeline]: A running pipeline, or None in serial mode
+        """
+        if self.rdap_mode != 'async':
+            return None
+        return RDAPPipeline(
+            organization_from_rdap=self._organization_from_rdap,
+            fallback=self._get_organization_for_ip,
+            max_concurrency=self.rdap_concurrency,
+            bootstrap_urls=self.rdap_bootstrap_urls,
+            index=self.ip_org_index,
+            trace=self.trace,
+        ).start()
+
+    def _collect_organizations(self, results, company_to_ips: Dict[str, List[str]]):
+        """
+        Add streamed (ip, company) results to the company-to-IPs mapping.
+        
+        Args:
+            results (Iterable[Tuple[str, str]]): Results from the RDAP pipeline
+            company_to_ips (Dict[str, List[str]]): Mapping updated in place
+            
+        Yields:
+            Tuple[str, str]: Each (ip, company) pair once it has been recorded
+        """
+        for ip, company in results:
+            company_to_ips[company].append(ip)
+            yield ip, company
+
+    def _attribute_ips_offline(self, ips: List[str], company_to_ips: Dict[str, List[str]],
+                               rdap_pipeline: Optional[RDAPPipeline] = None) -> None:
+        """
+        Attribute a batch of IPs with the offline ASN database, falling back to
+        RDAP for addresses the database does not cover.
+        
+        Args:
+            ips (List[str]): Resolved IPs, one entry per subdomain
+            company_to_ips (Dict[str, List[str]]): Mapping updated in place
+            rdap_pipeline (RDAPPipeline, optional): Receives the misses; serial lookups otherwise
+        """
+        organizations = self.asn_database.lookup_many(ips)
+        misses = 0
+        
+        for ip in ips:
+            company = organizations.get(ip)
+            if company is not None:
+                company_to_ips[company].append(ip)
+                continue
+            
+            misses += 1
+            if rdap_pipeline is not None:
+                rdap_pipeline.submit(ip)
+            else:
+                company_to_ips[self._get_organization_for_ip(ip)].append(ip)
+        
+        logger.info(f"Attributed {len(ips)} IPs offline, {misses} fell back to RDAP")
+
     def _get_organization_for_ip(self, ip: str) -> str:
         """
         Get organization information for an IP address using ipwhois library.
         Completely replaced the 'whois' command with pure Python implementation.
+        IPs inside a range learned from an earlier RDAP answer are resolved locally.
         
         Args:
             ip (str): The IP address
@@ -464,93 +830,95 @@ class DNS_MAP:
         Returns:
             str: The organization name or "Unknown Company"
         """
+        start = time.perf_counter()
+        company, source = self._lookup_organization(ip)
+        seconds = time.perf_counter() - start
+        ORGANIZATION_LOOKUP_SECONDS.observe(seconds, source=source)
+        if self.trace is not None:
+            self.trace.observe('organization_lookup', ip, seconds)
+        return company
+
+    def _lookup_organization(self, ip: str) -> Tuple[str, str]:
+        """
+        Attribute an IP, reporting where the answer came from.
+        
+        Returns:
+            Tuple[str, str]: (organization, source), source being 'index', 'whois', 'invalid' or 'error'
+        """
         try:
             # Validate IP address format
             ipaddress.ip_address(ip)
             
-            # Define a list of common hosting providers for backup matching
-            hosting_providers = {
-                "amazon": "Amazon AWS",
-                "aws": "Amazon AWS",
-                "amazon web services": "Amazon AWS",
-                "azure": "Microsoft Azure",
-                "microsoft": "Microsoft",
-                "google": "Google Cloud",
-                "googlecloud": "Google Cloud",
-                "cloudflare": "Cloudflare",
-                "digitalocean": "DigitalOcean",
-                "linode": "Linode",
-                "ovh": "OVH",
-                "rackspace": "Rackspace",
-                "vultr": "Vultr",
-                "hetzner": "Hetzner",
-                "godaddy": "GoDaddy",
-                "hostgator": "HostGator",
-                "namecheap": "Namecheap",
-                "gandi": "Gandi",
-                "ionos": "IONOS",
-                "dreamhost": "DreamHost",
-                "bluehost": "Bluehost"
-            }
+            # Answer from the prefix index when a known range covers this IP
+            cached_company = self.ip_org_index.lookup(ip)
+            if cached_company is not None:
+                return cached_company, 'index'
             
             # Use IPWhois to get organization information
             try:
                 obj = IPWhois(ip)
                 results = obj.lookup_rdap(depth=1, retry_count=2, asn_methods=['whois', 'http'])
                 
-                # Try to extract organization name from different fields
-                if results.get('network', {}).get('name'):
-                    return results['network']['name']
-                elif results.get('asn_description'):
-                    return results['asn_description']
-                elif results.get('network', {}).get('remarks'):
-                    remarks = ' '.join(results['network']['remarks'])
-                    for provider, name in hosting_providers.items():
-                        if provider.lower() in remarks.lower():
-                            return name
-                    return remarks[:50]  # Truncate to 50 chars if too long
-                elif results.get('objects'):
-                    # Try to extract from objects
-                    for obj_key, obj_data in results['objects'].items():
-                        if obj_data.get('contact', {}).get('name'):
-                            return obj_data['contact']['name']
+                company = self._organization_from_rdap(results)
                 
-                # Fall back to ASN information
-                if results.get('asn_registry') and results.get('asn'):
-                    return f"{results['asn_registry']} ASN {results['asn']}"
-                
-                # Check if any common provider is in the raw results
-                raw_data = str(results)
-                for provider, name in hosting_providers.items():
-                    if provider.lower() in raw_data.lower():
-                        return name
-                
-                return "Unknown Company"
+                # Remember the whole network block so neighbouring IPs skip RDAP
+                self.ip_org_index.insert_many(rdap_cidrs(results), company)
+                return company, 'whois'
                 
             except (IPDefinedError, HTTPLookupError, ASNRegistryError) as e:
                 # If IPWhois lookup fails, try to extract common hosting provider from error message
-                error_str = str(e)
-                for provider, name in hosting_providers.items():
-                    if provider.lower() in error_str.lower():
-                        return name
+                name = HOSTING_PROVIDER_MATCHER.match(str(e))
+                if name:
+                    return name, 'whois'
                 
                 # Try a fallback approach just based on IP range
                 if ip.startswith('13.') or ip.startswith('52.') or ip.startswith('54.'):
-                    return "Amazon AWS"
+                    return "Amazon AWS", 'whois'
                 elif ip.startswith('35.') or ip.startswith('34.'):
-                    return "Google Cloud"
+                    return "Google Cloud", 'whois'
                 elif ip.startswith('40.') or ip.startswith('20.'):
-                    return "Microsoft Azure"
+                    return "Microsoft Azure", 'whois'
                 elif ip.startswith('104.16.') or ip.startswith('104.17.'):
-                    return "Cloudflare"
+                    return "Cloudflare", 'whois'
                 
-                return "Unknown Company"
+                return "Unknown Company", 'whois'
                 
         except ValueError:
-            return "Invalid IP Format"
+            return "Invalid IP Format", 'invalid'
         except Exception as e:
             logger.error(f"Error getting organization for IP {ip}: {str(e)}")
-            return "Error in IP Lookup"
+            return "Error in IP Lookup", 'error'
+
+    def _organization_from_rdap(self, results: Dict[str, Any]) -> str:
+        """
+        Pick the most descriptive organization name out of an RDAP answer.
+        
+        Args:
+            results (Dict): Result of IPWhois.lookup_rdap
+            
+        Returns:
+            str: The organization name or "Unknown Company"
+        """
+        # Try to extract organization name from different fields
+        if results.get('network', {}).get('name'):
+            return results['network']['name']
+        elif results.get('asn_description'):
+            return results['asn_description']
+        elif results.get('network', {}).get('remarks'):
+            remarks = ' '.join(results['network']['remarks'])
+            return HOSTING_PROVIDER_MATCHER.match(remarks) or remarks[:50]  # Truncate to 50 chars if too long
+        elif results.get('objects'):
+            # Try to extract from objects
+            for obj_key, obj_data in results['objects'].items():
+                if obj_data.get('contact', {}).get('name'):
+                    return obj_data['contact']['name']
+        
+        # Fall back to ASN information
+        if results.get('asn_registry') and results.get('asn'):
+            return f"{results['asn_registry']} ASN {results['asn']}"
+        
+        # Check if any common provider is in the raw results
+        return HOSTING_PROVIDER_MATCHER.match(str(results), "Unknown Company")
 
     def _format_company_ips(self, company_to_ips: Dict[str, List[str]]) -> List[str]:
         """
@@ -588,70 +956,21 @@ class DNS_MAP:
             if len(parts) > 1:
                 server = parts[1].strip()
                 
-                # First check for exact matches in our mapping dictionary
-                for key, provider in self.mapped_DNS_providers.items():
-                    if key in server.upper():
-                        dns_hosts.add(provider)
-                        break
-                else:
-                    # If no exact match, check for common DNS providers in the server name
-                    common_providers = {
-                        "cloudflare": "Cloudflare",
-                        "awsdns": "Amazon Route53",
-                        "amazon": "Amazon Route53",
-                        "azure": "Microsoft Azure",
-                        "microsoft": "Microsoft Azure",
-                        "google": "Google Cloud DNS",
-                        "googledomains": "Google Domains",
-                        "godaddy": "GoDaddy",
-                        "domaincontrol": "GoDaddy",
-                        "ns1": "NS1",
-                        "ns2": "NS1",
-                        "dnsmadeeasy": "DNS Made Easy",
-                        "dnsimple": "DNSimple",
-                        "cloudns": "ClouDNS",
-                        "namecheap": "Namecheap",
-                        "hostgator": "HostGator",
-                        "digitalocean": "DigitalOcean",
-                        "linode": "Linode",
-                        "dyn": "Oracle Dyn",
-                        "nsone": "NS1",
-                        "akamai": "Akamai",
-                        "ultradns": "UltraDNS",
-                        "rackspace": "Rackspace",
-                        "zonomi": "Zonomi",
-                        "easydns": "EasyDNS",
-                        "hover": "Hover",
-                        "rage4": "Rage4",
-                        "constellix": "Constellix",
-                        "rcodezero": "RcodeZero"
-                    }
-                    
-                    for provider_key, provider_name in common_providers.items():
-                        if provider_key.lower() in server.lower():
-                            dns_hosts.add(provider_name)
-                            break
-                    else:
-                        # If still no match, use the server domain
-                        dns_hosts.add(server.split()[0])
+                # First check for exact matches in our mapping dictionary, then for
+                # common DNS providers in the server name, else use the server domain
+                provider = DNS_PROVIDER_MATCHER.match(server.upper()) or COMMON_DNS_PROVIDER_MATCHER.match(server)
+                dns_hosts.add(provider or server.split()[0])
                     
         return list(dns_hosts)
         
     def _save_progress(self, progress: Dict[str, Any]) -> None:
         """
-        Save progress information to a temporary file for the UI to read.
+        Publish progress information to the progress store for the UI to read.
         
         Args:
             progress (Dict): Dictionary containing progress information
         """
         try:
-            # Create a temporary directory if it doesn't exist
-            os.makedirs('temp', exist_ok=True)
-            
-            # Save progress to a JSON file
-            with open(f'temp/progress_{self.apex_domain}.json', 'w') as f:
-                json.dump(progress, f)
-                
+            self.progress_store.set(self.apex_domain, progress)
         except Exception as e:
             logger.warning(f"Error saving progress: {str(e)}")
-            pass
\ No newline at end of file
@@ -0,0 +1,527 @@
+import asyncio
+import logging
+import os
+import random
+import socket
+import struct
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import dns.exception
+import dns.message
+import dns.name
+import dns.rcode
+import dns.rdataclass
+import dns.rdatatype
+import dns.resolver
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import httpx
+except ImportError:  # DoH falls back to HTTP/1.1 keep-alive over requests
+    httpx = None
+
+logger = logging.getLogger('DNS_MAP')
+
+# 'udp' keeps dnspython's stock resolver; 'tcp' and 'doh' go through an UpstreamRouter
+TRANSPORTS = ('udp', 'tcp', 'doh')
+
+DEFAULT_DNS_TRANSPORT = os.environ.get('DNS_TRANSPORT', 'udp')
+# Comma separated; host[:port] for udp/tcp, URLs for doh
+DEFAULT_DNS_UPSTREAMS = [u.strip() for u in os.environ.get('DNS_UPSTREAMS', '').split(',') if u.strip()]
+DEFAULT_DOH_UPSTREAMS = ['https://cloudflare-dns.com/dns-query', 'https://dns.google/dns-query']
+
+# Weight of the newest sample in an upstream's latency average
+LATENCY_EWMA_ALPHA = 0.2
+# Share of queries led by a non-fastest upstream, so a recovered upstream gets re-measured
+EXPLORE_RATIO = 0.05
+# Queries pipelined on one TCP connection before another connection is opened
+TCP_PIPELINE_DEPTH = 64
+TCP_MAX_CONNECTIONS = 4
+DOH_MAX_CONNECTIONS = 4
+DOH_HEADERS = {'content-type': 'application/dns-message', 'accept': 'application/dns-message'}
+
+
+class UpstreamError(dns.exception.DNSException):
+    """Raised when no upstream answered a query before its deadline."""
+
+
+class _ServerFailure(Exception):
+    """An upstream answered SERVFAIL/REFUSED; another upstream may still answer."""
+
+
+def _settle(future: Future, result: Any = None, error: Optional[BaseException] = None) -> None:
+    # The caller may have cancelled the future after its deadline
+    if future.done():
+        return
+    try:
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+    except Exception:
+        pass
+
+
+class Upstream:
+    """
+    One DNS upstream with a running latency estimate.
+
+    Subclasses implement submit(), which sends a query and returns a Future
+    of the response without blocking, so any number of queries can share
+    the upstream's few connections.
+    """
+
+    transport = ''
+
+    def __init__(self, address: str):
+        self.address = address
+        self.latency: Optional[float] = None
+        self.queries = 0
+        self.failures = 0
+        self._lock = threading.Lock()
+
+    def submit(self, query: dns.message.Message) -> Future:
+        raise NotImplementedError
+
+    def record(self, elapsed: float, ok: bool, penalty: float = 0.0) -> None:
+        """Fold one query into the latency average; a failure counts as taking at least penalty seconds."""
+        sample = elapsed if ok else max(elapsed, penalty)
+        with self._lock:
+            self.queries += 1
+            if not ok:
+                self.failures += 1
+            self.latency = sample if self.latency is None else self.latency + LATENCY_EWMA_ALPHA * (sample - self.latency)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'transport': self.transport,
+                'queries': self.queries,
+                'failures': self.failures,
+                'latency_ms': round(self.latency * 1000, 2) if self.latency is not None else None,
+            }
+
+    def close(self) -> None:
+        pass
+
+
+class _TCPConnection:
+    """One TCP connection carrying many outstanding queries, matched to responses by message id."""
+
+    def __init__(self, host: str, port: int, connect_timeout: float):
+        self.sock = socket.create_connection((host, port), timeout=connect_timeout)
+        self.sock.settimeout(None)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.closed = False
+        self._pending: Dict[int, Tuple[Future, dns.message.Message]] = {}
+        self._lock = threading.Lock()
+        self._reader = threading.Thread(target=self._read_loop, name=f'dns-tcp-{host}', daemon=True)
+        self._reader.start()
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._pending)
+
+    def send(self, query: dns.message.Message) -> Future:
+        future: Future = Future()
+        with self._lock:
+            if self.closed:
+                raise ConnectionError("DNS TCP connection is closed")
+            if len(self._pending) >= 65536:
+                raise ConnectionError("No free DNS message ids on this connection")
+            query.id = random.getrandbits(16)
+            while query.id in self._pending:
+                query.id = random.getrandbits(16)
+            self._pending[query.id] = (future, query)
+            wire = query.to_wire()
+            try:
+                # Written under the lock so frames of concurrent senders never interleave
+                self.sock.sendall(struct.pack('!H', len(wire)) + wire)
+            except OSError:
+                del self._pending[query.id]
+                raise
+        future.add_done_callback(lambda f, query_id=query.id: self._forget(query_id, f))
+        return future
+
+    def _forget(self, query_id: int, future: Future) -> None:
+        # Drop ids whose caller gave up, so a server that never answers doesn't leak them
+        if future.cancelled():
+            with self._lock:
+                entry = self._pending.get(query_id)
+                if entry is not None and entry[0] is future:
+                    del self._pending[query_id]
+
+    def _recv_exactly(self, size: int) -> bytes:
+        data = b''
+        while len(data) < size:
+            chunk = self.sock.recv(size - len(data))
+            if not chunk:
+                raise ConnectionError("DNS TCP connection closed by upstream")
+            data += chunk
+        return data
+
+    def _read_loop(self) -> None:
+        error: Exception = ConnectionError("DNS TCP connection closed")
+        try:
+            while True:
+                (length,) = struct.unpack('!H', self._recv_exactly(2))
+                wire = self._recv_exactly(length)
+                (query_id,) = struct.unpack('!H', wire[:2])
+                with self._lock:
+                    entry = self._pending.pop(query_id, None)
+                if entry is None:
+                    continue
+                future, query = entry
+                try:
+                    response = dns.message.from_wire(wire)
+                    if not query.is_response(response):
+                        raise dns.exception.FormError("Response does not match the query")
+                except Exception as e:
+                    _settle(future, error=e)
+                    continue
+                _settle(future, response)
+        except Exception as e:
+            error = e
+        finally:
+            self.close(error)
+
+    def close(self, error: Optional[Exception] = None) -> None:
+        with self._lock:
+            self.closed = True
+            pending = list(self._pending.values())
+            self._pending.clear()
+        try:
+            # shutdown() wakes the reader thread if it is blocked in recv()
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+        for future, _ in pending:
+            _settle(future, error=error or ConnectionError("DNS TCP connection closed"))
+
+
+class PipelinedTCPUpstream(Upstream):
+    """
+    DNS over TCP with queries pipelined on a few persistent connections (RFC 7766).
+
+    Queries go to the least busy open connection; another is opened only when
+    every connection already has pipeline_depth queries outstanding. Responses
+    may arrive in any order. Connections the server closes are reopened on demand.
+    """
+
+    transport = 'tcp'
+
+    def __init__(self, host: str, port: int = 53, max_connections: int = TCP_MAX_CONNECTIONS,
+                 pipeline_depth: int = TCP_PIPELINE_DEPTH, connect_timeout: float = 5):
+        super().__init__(f"{host}:{port}")
+        self.host = host
+        self.port = port
+        self.max_connections = max_connections
+        self.pipeline_depth = pipeline_depth
+        self.connect_timeout = connect_timeout
+        self.connections_opened = 0
+        self._connections: List[_TCPConnection] = []
+        self._connect_lock = threading.Lock()
+
+    def submit(self, query: dns.message.Message) -> Future:
+        return self._connection().send(query)
+
+    def _connection(self) -> _TCPConnection:
+        with self._connect_lock:
+            self._connections = [c for c in self._connections if not c.closed]
+            if self._connections:
+                connection = min(self._connections, key=lambda c: c.in_flight)
+                if connection.in_flight < self.pipeline_depth or len(self._connections) >= self.max_connections:
+                    return connection
+            connection = _TCPConnection(self.host, self.port, self.connect_timeout)
+            self._connections.append(connection)
+            self.connections_opened += 1
+            return connection
+
+    def stats(self) -> Dict[str, Any]:
+        stats = super().stats()
+        with self._connect_lock:
+            open_connections = [c for c in self._connections if not c.closed]
+        stats.update(connections=len(open_connections), connections_opened=self.connections_opened,
+                     in_flight=sum(c.in_flight for c in open_connections))
+        return stats
+
+    def close(self) -> None:
+        with self._connect_lock:
+            connections, self._connections = self._connections, []
+        for connection in connections:
+            connection.close()
+
+
+class DoHUpstream(Upstream):
+    """
+    DNS over HTTPS (RFC 8484) through a keep-alive connection pool.
+
+    With httpx installed, queries are multiplexed as HTTP/2 streams over a
+    few connections by an AsyncClient on the upstream's own event loop thread
+    (plain http:// URLs, e.g. a local proxy, use HTTP/2 with prior knowledge).
+    Without it, a pooled requests session is used over HTTP/1.1.
+    """
+
+    transport = 'doh'
+
+    def __init__(self, url: str, max_in_flight: int = 64, max_connections: int = DOH_MAX_CONNECTIONS,
+                 timeout: float = 10):
+        super().__init__(url)
+        self.url = url
+        self.timeout = timeout
+        self.http2 = httpx is not None
+        if self.http2:
+            # One loop serializes frame writes; httpx's sync client can't share an HTTP/2 connection across threads
+            self._loop = asyncio.new_event_loop()
+            threading.Thread(target=self._loop.run_forever, name='dns-doh', daemon=True).start()
+            self.client = httpx.AsyncClient(
+                http1=not url.startswith('http://'), http2=True, timeout=timeout,
+                limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections))
+        else:
+            self.client = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_in_flight)
+            self.client.mount('https://', adapter)
+            self.client.mount('http://', adapter)
+            self._executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix='dns-doh')
+
+    def submit(self, query: dns.message.Message) -> Future:
+        # id 0 keeps identical queries cacheable by HTTP caches (RFC 8484 section 4.1)
+        query.id = 0
+        if self.http2:
+            return asyncio.run_coroutine_threadsafe(self._post_async(query), self._loop)
+        return self._executor.submit(self._post, query)
+
+    async def _post_async(self, query: dns.message.Message) -> dns.message.Message:
+        response = await self.client.post(self.url, content=query.to_wire(), headers=DOH_HEADERS)
+        return self._parse(query, response.status_code, response.content)
+
+    def _post(self, query: dns.message.Message) -> dns.message.Message:
+        response = self.client.post(self.url, data=query.to_wire(), headers=DOH_HEADERS, timeout=self.timeout)
+        return self._parse(query, response.status_code, response.content)
+
+    @staticmethod
+    def _parse(query: dns.message.Message, status_code: int, content: bytes) -> dns.message.Message:
+        if status_code != 200:
+            raise UpstreamError(f"DoH upstream returned HTTP {status_code}")
+        message = dns.message.from_wire(content)
+        if not query.is_response(message):
+            raise dns.exception.FormError("Response does not match the query")
+        return message
+
+    def stats(self) -> Dict[str, Any]:
+        stats = super().stats()
+        stats['http2'] = self.http2
+        return stats
+
+    def close(self) -> None:
+        if self.http2:
+            asyncio.run_coroutine_threadsafe(self.client.aclose(), self._loop).result(self.timeout)
+            self._loop.call_soon_threadsafe(self._loop.stop)
+        else:
+            self._executor.shutdown(wait=False)
+            self.client.close()
+
+
+def split_host_port(address: str, default_port: int) -> Tuple[str, int]:
+    """Parse "host", "host:port" or "[v6]:port"."""
+    if address.startswith('['):
+        host, _, rest = address[1:].partition(']')
+        return host, int(rest[1:]) if rest.startswith(':') else default_port
+    if address.count(':') == 1:
+        host, port = address.split(':')
+        return host, int(port)
+    return address, default_port
+
+
+# Upstreams (and their connections and latency history) are shared by every router in the process
+_UPSTREAMS: Dict[Tuple[str, str], Upstream] = {}
+_UPSTREAMS_LOCK = threading.Lock()
+
+
+def get_upstream(transport: str, address: str, port: int = 53) -> Upstream:
+    """Return the process-wide Upstream for a tcp address or DoH URL, creating it on first use."""
+    if transport == 'tcp':
+        host, port = split_host_port(address, port)
+        key = (transport, f"{host}:{port}")
+    else:
+        key = (transport, address)
+    with _UPSTREAMS_LOCK:
+        upstream = _UPSTREAMS.get(key)
+        if upstream is None:
+            upstream = PipelinedTCPUpstream(host, port) if transport == 'tcp' else DoHUpstream(address)
+            _UPSTREAMS[key] = upstream
+        return upstream
+
+
+def upstream_stats() -> Dict[str, Dict[str, Any]]:
+    """Latency and connection statistics of every upstream used so far, for the cache endpoint."""
+    with _UPSTREAMS_LOCK:
+        upstreams = list(_UPSTREAMS.values())
+    return {upstream.address: upstream.stats() for upstream in upstreams}
+
+
+class UpstreamRouter:
+    """
+    Resolver sending each query to the upstream with the lowest latency average.
+
+    Exposes the part of dns.resolver.Resolver's interface DNS_MAP uses, so
+    DNS_CACHE and the batch resolver work with it unchanged. A timed out or
+    failed query is retried on the next fastest upstream within the same
+    deadline and counts against the failing upstream's average.
+    """
+
+    def __init__(self, upstreams: Sequence[Upstream], timeout: float = 10):
+        """
+        Initialize the router.
+
+        Args:
+            upstreams (Sequence[Upstream]): Upstreams to choose from
+            timeout (float): Deadline in seconds per query, failover included
+        """
+        if not upstreams:
+            raise ValueError("At least one DNS upstream is required")
+        self.upstreams = list(upstreams)
+        self.timeout = timeout
+
+    def _attempts(self) -> List[Upstream]:
+        # Never-measured upstreams sort first so each gets a latency sample
+        ranked = sorted(self.upstreams, key=lambda u: -1.0 if u.latency is None else u.latency)
+        if len(ranked) > 1 and random.random() < EXPLORE_RATIO:
+            ranked.insert(0, ranked.pop(random.randrange(1, len(ranked))))
+        # A lone upstream gets a second try, e.g. when the server closed an idle connection mid-send
+        return ranked if len(ranked) > 1 else ranked * 2
+
+    def exchange(self, qname: dns.name.Name, rdtype, rdclass=dns.rdataclass.IN,
+                 lifetime: Optional[float] = None) -> dns.message.Message:
+        """
+        Send a query, failing over between upstreams until one answers.
+
+        Raises:
+            UpstreamError: When no upstream answered within the deadline
+        """
+        deadline = time.monotonic() + (lifetime or self.timeout)
+        errors = []
+        for upstream in self._attempts():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            start = time.monotonic()
+            future = None
+            try:
+                future = upstream.submit(dns.message.make_query(qname, rdtype, rdclass))
+                response = future.result(remaining)
+            except Exception as e:
+                if future is not None:
+                    future.cancel()
+                upstream.record(time.monotonic() - start, False, self.timeout)
+                errors.append(self._describe(upstream, e))
+                continue
+            upstream.record(time.monotonic() - start, True)
+            if response.rcode() in (dns.rcode.SERVFAIL, dns.rcode.REFUSED):
+                errors.append(self._describe(upstream, _ServerFailure(dns.rcode.to_text(response.rcode()))))
+                continue
+            return response
+        raise UpstreamError(f"No DNS upstream answered {qname} {dns.rdatatype.to_text(rdtype)}: "
+                            f"{'; '.join(errors) or 'deadline exceeded'}")
+
+    async def exchange_async(self, qname: dns.name.Name, rdtype, rdclass=dns.rdataclass.IN,
+                             lifetime: Optional[float] = None) -> dns.message.Message:
+        """Same as exchange(), awaiting the upstream's Future instead of blocking a thread."""
+        deadline = time.monotonic() + (lifetime or self.timeout)
+        errors = []
+        for upstream in self._attempts():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            start = time.monotonic()
+            try:
+                future = upstream.submit(dns.message.make_query(qname, rdtype, rdclass))
+                # Cancelling the wrapper on timeout also cancels the upstream's Future
+                response = await asyncio.wait_for(asyncio.wrap_future(future), remaining)
+            except Exception as e:
+                upstream.record(time.monotonic() - start, False, self.timeout)
+                errors.append(self._describe(upstream, e))
+                continue
+            upstream.record(time.monotonic() - start, True)
+            if response.rcode() in (dns.rcode.SERVFAIL, dns.rcode.REFUSED):
+                errors.append(self._describe(upstream, _ServerFailure(dns.rcode.to_text(response.rcode()))))
+                continue
+            return response
+        raise UpstreamError(f"No DNS upstream answered {qname} {dns.rdatatype.to_text(rdtype)}: "
+                            f"{'; '.join(errors) or 'deadline exceeded'}")
+
+    def resolve(self, qname, rdtype='A', rdclass='IN', raise_on_no_answer: bool = True,
+                lifetime: Optional[float] = None, **kwargs) -> dns.resolver.Answer:
+        """Resolve like dns.resolver.Resolver.resolve(); search lists and other options are not supported."""
+        qname, rdtype, rdclass = self._normalize(qname, rdtype, rdclass)
+        response = self.exchange(qname, rdtype, rdclass, lifetime)
+        return self._answer(qname, rdtype, rdclass, response, raise_on_no_answer)
+
+    async def resolve_async(self, qname, rdtype='A', rdclass='IN', raise_on_no_answer: bool = True,
+                            lifetime: Optional[float] = None, **kwargs) -> dns.resolver.Answer:
+        qname, rdtype, rdclass = self._normalize(qname, rdtype, rdclass)
+        response = await self.exchange_async(qname, rdtype, rdclass, lifetime)
+        return self._answer(qname, rdtype, rdclass, response, raise_on_no_answer)
+
+    def async_resolver(self) -> 'AsyncUpstreamRouter':
+        """View of this router matching dns.asyncresolver.Resolver, for the async resolution engine."""
+        return AsyncUpstreamRouter(self)
+
+    @staticmethod
+    def _normalize(qname, rdtype, rdclass):
+        if isinstance(qname, str):
+            qname = dns.name.from_text(qname)
+        return qname, dns.rdatatype.RdataType.make(rdtype), dns.rdataclass.RdataClass.make(rdclass)
+
+    @staticmethod
+    def _answer(qname, rdtype, rdclass, response: dns.message.Message, raise_on_no_answer: bool) -> dns.resolver.Answer:
+        if response.rcode() == dns.rcode.NXDOMAIN:
+            raise dns.resolver.NXDOMAIN(qnames=[qname], responses={qname: response})
+        answer = dns.resolver.Answer(qname, rdtype, rdclass, response)
+        if answer.rrset is None and raise_on_no_answer:
+            raise dns.resolver.NoAnswer(response=response)
+        return answer
+
+    @staticmethod
+    def _describe(upstream: Upstream, error: Exception) -> str:
+        if isinstance(error, (FutureTimeout, asyncio.TimeoutError)):
+            return f"{upstream.address}: timed out"
+        return f"{upstream.address}: {str(error) or type(error).__name__}"
+
+
+class AsyncUpstreamRouter:
+    """Awaitable resolve() over an UpstreamRouter."""
+
+    def __init__(self, router: UpstreamRouter):
+        self.router = router
+
+    async def resolve(self, qname, rdtype='A', rdclass='IN', raise_on_no_answer: bool = True,
+                      lifetime: Optional[float] = None, **kwargs) -> dns.resolver.Answer:
+        return await self.router.resolve_async(qname, rdtype, rdclass, raise_on_no_answer, lifetime)
+
+
+def build_router(transport: str, upstreams: Optional[Sequence[str]] = None, port: int = 53,
+                 timeout: float = 10) -> UpstreamRouter:
+    """
+    Build a router over the process-wide upstreams for transport.
+
+    Args:
+        transport (str): 'tcp' or 'doh'
+        upstreams (Sequence[str], optional): host[:port] addresses for tcp, URLs for doh.
+            Defaults to the system resolv.conf servers for tcp and public resolvers for doh.
+        port (int): Default port of tcp upstreams
+        timeout (float): Per-query deadline in seconds
+
+    Returns:
+        UpstreamRouter: Router routing each query to the fastest upstream
+    """
+    if transport not in ('tcp', 'doh'):
+        raise ValueError(f"Unknown DNS transport: {transport}. Expected 'tcp' or 'doh'")
+    if not upstreams:
+        upstreams = dns.resolver.Resolver().nameservers if transport == 'tcp' else DEFAULT_DOH_UPSTREAMS
+    return UpstreamRouter([get_upstream(transport, address, port) for address in upstreams], timeout)
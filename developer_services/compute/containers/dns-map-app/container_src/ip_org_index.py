@@ -0,0 +1,192 @@
+import ipaddress
+import json
+import logging
+import os
+import threading
+from typing import Dict, Iterable, List, Optional
+
+from atomic_files import atomic_write, file_lock
+
+logger = logging.getLogger('DNS_MAP')
+
+# Registry answers broader than this (e.g. a whole RIR /8) say nothing about the hoster
+MIN_PREFIXLEN = {4: 8, 6: 16}
+ADDRESS_BITS = {4: 32, 6: 128}
+
+DEFAULT_INDEX_PATH = os.environ.get('IP_ORG_INDEX_PATH', '/app/data/ip_org_index.json')
+
+
+class PrefixIndex:
+    """
+    Longest-prefix-match index from CIDR ranges to organization names.
+
+    Each IP version keeps one hash table per prefix length, so a lookup probes
+    only the lengths actually present, longest first. Ranges come from the
+    network CIDRs of RDAP answers; any later IP inside a known range is
+    answered without a network call.
+    """
+
+    def __init__(self, path: Optional[str] = None, min_prefixlen: Optional[Dict[int, int]] = None):
+        """
+        Initialize the index.
+
+        Args:
+            path (str, optional): JSON file used by load() and save()
+            min_prefixlen (Dict[int, int], optional): Broadest accepted prefix per IP version
+        """
+        self.path = path
+        self.min_prefixlen = min_prefixlen or MIN_PREFIXLEN
+        self._tables: Dict[int, Dict[int, Dict[int, str]]] = {4: {}, 6: {}}
+        self._lengths: Dict[int, List[int]] = {4: [], 6: []}
+        self._lock = threading.Lock()
+        self._dirty = False
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return sum(len(table) for tables in self._tables.values() for table in tables.values())
+
+    def lookup(self, ip: str) -> Optional[str]:
+        """
+        Find the organization of the most specific known range containing ip.
+
+        Args:
+            ip (str): IPv4 or IPv6 address
+
+        Returns:
+            Optional[str]: Organization name, or None when no range matches
+        """
+        address = ipaddress.ip_address(ip)
+        value = int(address)
+        bits = ADDRESS_BITS[address.version]
+        with self._lock:
+            tables = self._tables[address.version]
+            for prefixlen in self._lengths[address.version]:
+                organization = tables[prefixlen].get(value >> (bits - prefixlen))
+                if organization is not None:
+                    self.hits += 1
+                    return organization
+            self.misses += 1
+        return None
+
+    def insert(self, cidr: str, organization: str) -> bool:
+        """
+        Record that every address in cidr belongs to organization.
+
+        Returns:
+            bool: False when the range is invalid or too broad to be useful
+        """
+        try:
+            network = ipaddress.ip_network(cidr.strip(), strict=False)
+        except ValueError:
+            return False
+        if network.prefixlen < self.min_prefixlen[network.version]:
+            return False
+
+        bits = ADDRESS_BITS[network.version]
+        key = int(network.network_address) >> (bits - network.prefixlen)
+        with self._lock:
+            tables = self._tables[network.version]
+            if network.prefixlen not in tables:
+                tables[network.prefixlen] = {}
+                self._lengths[network.version] = sorted(tables, reverse=True)
+            if tables[network.prefixlen].get(key) != organization:
+                tables[network.prefixlen][key] = organization
+                self._dirty = True
+        return True
+
+    def insert_many(self, cidrs: Iterable[str], organization: str) -> int:
+        """Insert several ranges for one organization, returning how many were accepted."""
+        return sum(1 for cidr in cidrs if self.insert(cidr, organization))
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'ranges': len(self)}
+
+    def save(self, path: Optional[str] = None) -> None:
+        """
+        Atomically write the index to disk if it changed since the last load/save.
+
+        Workers share the file, so the write merges with what is already on
+        disk under a file lock; this process's ranges win on conflict.
+        """
+        path = path or self.path
+        if not path or not self._dirty:
+            return
+
+        with self._lock:
+            ranges = {}
+            for version, tables in self._tables.items():
+                bits = ADDRESS_BITS[version]
+                address_class = ipaddress.IPv4Address if version == 4 else ipaddress.IPv6Address
+                for prefixlen, table in tables.items():
+                    for key, organization in table.items():
+                        network = address_class(key << (bits - prefixlen))
+                        ranges[f"{network}/{prefixlen}"] = organization
+            self._dirty = False
+
+        try:
+            with file_lock(path):
+                try:
+                    merged = dict(self._read(path))
+                except ValueError:
+                    logger.warning(f"Replacing unreadable IP organization index at {path}")
+                    merged = {}
+                merged.update(ranges)
+                with atomic_write(path) as f:
+                    json.dump({'ranges': [[cidr, organization] for cidr, organization in merged.items()]}, f)
+            logger.info(f"Saved {len(merged)} IP organization ranges to {path}")
+        except Exception as e:
+            logger.warning(f"Error saving IP organization index: {str(e)}")
+            self._dirty = True
+
+    @staticmethod
+    def _read(path: str) -> List[List[str]]:
+        """Return the [cidr, organization] pairs stored at path, or none when it doesn't exist."""
+        if not os.path.exists(path):
+            return []
+        with open(path, 'r') as f:
+            return json.load(f).get('ranges', [])
+
+    def load(self, path: Optional[str] = None) -> 'PrefixIndex':
+        """Warm the index from disk; a missing or unreadable file leaves it empty."""
+        path = path or self.path
+        if not path or not os.path.exists(path):
+            return self
+        try:
+            for cidr, organization in self._read(path):
+                self.insert(cidr, organization)
+            self._dirty = False
+            logger.info(f"Loaded {len(self)} IP organization ranges from {path}")
+        except Exception as e:
+            logger.warning(f"Error loading IP organization index from {path}: {str(e)}")
+        return self
+
+
+def rdap_cidrs(results: Dict) -> List[str]:
+    """
+    Extract the CIDR ranges an RDAP answer covers.
+
+    Prefers the registry network block and falls back to the announced ASN prefix.
+    """
+    cidr = (results.get('network') or {}).get('cidr') or results.get('asn_cidr') or ''
+    if cidr == 'NA':
+        return []
+    return [c.strip() for c in cidr.split(',') if c.strip()]
+
+
+_indexes: Dict[str, PrefixIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def load_ip_org_index(path: str = DEFAULT_INDEX_PATH) -> PrefixIndex:
+    """
+    Warm-load the index at path on first use, once per process, and share it between DNS_MAP instances.
+
+    Nothing is read until a map needs it, so importing the app doesn't touch
+    the data directory. IP_ORG_INDEX_PATH= (empty) keeps the index in memory only.
+    """
+    with _indexes_lock:
+        if path not in _indexes:
+            _indexes[path] = PrefixIndex(path or None).load()
+        return _indexes[path]
@@ -0,0 +1,232 @@
+import heapq
+import itertools
+import logging
+import os
+import threading
+import time
+import uuid
+from functools import partial
+from typing import Any, Callable, Dict, List, Optional
+
+from scheduler import SCHEDULER, ExpiryScheduler
+
+logger = logging.getLogger('DNS_MAP')
+
+DEFAULT_JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+DEFAULT_JOB_QUEUE_SIZE = int(os.environ.get('JOB_QUEUE_SIZE', 32))
+# Finished jobs (and their results) stay fetchable this long
+DEFAULT_JOB_TTL = float(os.environ.get('JOB_TTL', 1800))
+
+JOB_STATES = ('queued', 'running', 'succeeded', 'failed', 'cancelled')
+
+
+class QueueFull(Exception):
+    """Raised by JobQueue.submit() when max_queued jobs are already waiting."""
+
+
+class Job:
+    """One DNS mapping run submitted to a JobQueue."""
+
+    def __init__(self, domain: str, priority: int = 0, params: Optional[Dict[str, Any]] = None):
+        self.id = uuid.uuid4().hex
+        self.domain = domain
+        self.priority = priority
+        self.params = params or {}
+        self.status = 'queued'
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.submitted_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        # Checked by the running DNS_MAP between steps
+        self.cancel_event = threading.Event()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ('succeeded', 'failed', 'cancelled')
+
+    def to_dict(self, include_result: bool = True) -> Dict[str, Any]:
+        job = {
+            'job_id': self.id,
+            'domain': self.domain,
+            'priority': self.priority,
+            'status': self.status,
+            'submitted_at': self.submitted_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'cancel_requested': self.cancel_event.is_set(),
+        }
+        if self.error:
+            job['error'] = self.error
+        if include_result and self.status == 'succeeded':
+            job['result'] = self.result
+        return job
+
+
+class JobQueue:
+    """
+    Bounded priority queue of DNS mapping jobs executed by a fixed pool of worker threads.
+
+    DNS_MAP runs are network bound, so threads are enough; the pool size caps how
+    many run at once. Higher priority jobs start first, FIFO within a priority.
+    submit() raises QueueFull instead of growing without bound, and cancel()
+    either drops a queued job or signals a running one to stop.
+    """
+
+    def __init__(self, run: Callable[[Job], Any], workers: int = DEFAULT_JOB_WORKERS,
+                 max_queued: int = DEFAULT_JOB_QUEUE_SIZE, job_ttl: float = DEFAULT_JOB_TTL,
+                 cancelled_errors: tuple = (), scheduler: ExpiryScheduler = SCHEDULER):
+        """
+        Initialize the queue. Worker threads start with the first submitted job.
+
+        Args:
+            run (Callable[[Job], Any]): Executes a job and returns its result
+            workers (int): Maximum jobs running at once
+            max_queued (int): Maximum jobs waiting to start before submit() raises QueueFull
+            job_ttl (float): Seconds a finished job stays fetchable
+            cancelled_errors (tuple): Exception types run() raises when a job honoured its cancellation
+            scheduler (ExpiryScheduler): Forgets finished jobs after job_ttl (default: process-wide SCHEDULER)
+        """
+        self.run = run
+        self.workers = workers
+        self.max_queued = max_queued
+        self.job_ttl = job_ttl
+        self.cancelled_errors = cancelled_errors
+        self.scheduler = scheduler
+        self._jobs: Dict[str, Job] = {}
+        self._heap: List[tuple] = []
+        self._sequence = itertools.count()
+        self._queued = 0
+        self._running = 0
+        self._condition = threading.Condition()
+        self._threads: List[threading.Thread] = []
+        self._shutdown = False
+        self.rejected = 0
+
+    def submit(self, domain: str, priority: int = 0, **params) -> Job:
+        """
+        Queue a DNS mapping run.
+
+        Args:
+            domain (str): Apex domain to map
+            priority (int): Higher values start sooner
+            **params: Extra options passed through to run() on job.params
+
+        Returns:
+            Job: The queued job; poll it with get(job.id)
+
+        Raises:
+            QueueFull: When max_queued jobs are already waiting
+        """
+        with self._condition:
+            if self._shutdown:
+                raise RuntimeError("Job queue is shut down")
+            if self._queued >= self.max_queued:
+                self.rejected += 1
+                raise QueueFull(f"{self._queued} DNS mapping jobs already queued")
+            job = Job(domain, priority, params)
+            self._jobs[job.id] = job
+            heapq.heappush(self._heap, (-priority, next(self._sequence), job))
+            self._queued += 1
+            self._start_workers()
+            self._condition.notify()
+        logger.info(f"Queued DNS mapping job {job.id} for {domain} (priority {priority})")
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._condition:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        """
+        Cancel a job: a queued one never starts, a running one is asked to stop.
+
+        Returns:
+            Optional[Job]: The job, or None if the id is unknown
+        """
+        with self._condition:
+            job = self._jobs.get(job_id)
+            if job is None or job.finished:
+                return job
+            job.cancel_event.set()
+            if job.status == 'queued':
+                # Left in the heap; the worker that pops it skips it
+                self._queued -= 1
+                job.status = 'cancelled'
+                job.finished_at = time.time()
+                self._schedule_expiry(job)
+        logger.info(f"Cancellation requested for DNS mapping job {job_id}")
+        return job
+
+    def stats(self) -> Dict[str, Any]:
+        with self._condition:
+            counts = {state: 0 for state in JOB_STATES}
+            for job in self._jobs.values():
+                counts[job.status] += 1
+            return {
+                'jobs': counts,
+                'workers': self.workers,
+                'max_queued': self.max_queued,
+                'rejected': self.rejected,
+            }
+
+    def shutdown(self, cancel_running: bool = True, timeout: Optional[float] = None) -> None:
+        """Stop accepting jobs, cancel queued (and optionally running) ones, and join the workers."""
+        with self._condition:
+            self._shutdown = True
+            jobs = [job for job in self._jobs.values() if not job.finished]
+            self._condition.notify_all()
+        for job in jobs:
+            if cancel_running or job.status == 'queued':
+                self.cancel(job.id)
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def _start_workers(self) -> None:
+        # Started lazily so gunicorn's pre-fork import doesn't leave dead threads behind
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(target=self._worker, name=f'dns-map-job-{len(self._threads)}', daemon=True)
+            self._threads.append(thread)
+            thread.start()
+
+    def _schedule_expiry(self, job: Job) -> None:
+        self.scheduler.call_at(job.finished_at + self.job_ttl, partial(self._expire, job.id), 'job', job.id)
+
+    def _expire(self, job_id: str) -> None:
+        with self._condition:
+            self._jobs.pop(job_id, None)
+
+    def _next_job(self) -> Optional[Job]:
+        with self._condition:
+            while True:
+                while self._heap:
+                    _, _, job = heapq.heappop(self._heap)
+                    if job.status == 'queued':
+                        self._queued -= 1
+                        self._running += 1
+                        job.status = 'running'
+                        job.started_at = time.time()
+                        return job
+                if self._shutdown:
+                    return None
+                self._condition.wait()
+
+    def _worker(self) -> None:
+        while True:
+            job = self._next_job()
+            if job is None:
+                return
+            status, result, error = 'succeeded', None, None
+            try:
+                result = self.run(job)
+            except self.cancelled_errors:
+                status = 'cancelled'
+            except Exception as e:
+                logger.error(f"DNS mapping job {job.id} for {job.domain} failed: {str(e)}")
+                status, error = 'failed', str(e)
+            with self._condition:
+                self._running -= 1
+                job.status, job.result, job.error = status, result, error
+                job.finished_at = time.time()
+                self._schedule_expiry(job)
+            logger.info(f"DNS mapping job {job.id} for {job.domain} {status}")
@@ -0,0 +1,152 @@
+from array import array
+import re
+from typing import Dict, FrozenSet, Iterable, List, Optional, Sequence, Set, Tuple
+
+
+class KeywordMatcher:
+    """
+    Find which of many keywords occur in a string with one compiled regex.
+
+    The keywords are joined into a single alternation. Each search resumes one
+    character after the previous match started, so overlapping occurrences are
+    reported too (e.g. "api" inside "rapid"). At each position the alternation
+    picks the lowest-index keyword; keywords that are prefixes or extensions
+    of it are checked explicitly so none is hidden.
+    """
+
+    def __init__(self, keywords: Iterable[str], ignore_case: bool = True):
+        """
+        Compile the matcher.
+
+        Args:
+            keywords (Iterable[str]): Substrings to look for; their order is their priority
+            ignore_case (bool): Compare lowercased text against lowercased keywords
+        """
+        self.ignore_case = ignore_case
+        self.keywords: List[str] = [k.lower() if ignore_case else k for k in keywords]
+        self._index: Dict[str, int] = {}
+        for i, keyword in enumerate(self.keywords):
+            self._index.setdefault(keyword, i)
+        alternation = '|'.join(re.escape(k) for k in self._index if k)
+        self._pattern = re.compile(alternation) if alternation else None
+        # Keyword -> keywords that can match at the same position, which the alternation shadows
+        self._overlapping: Dict[str, List[str]] = {}
+        for keyword in self._index:
+            overlapping = [k for k in self._index if k != keyword and (k.startswith(keyword) or keyword.startswith(k))]
+            if overlapping:
+                self._overlapping[keyword] = overlapping
+
+    def _scan(self, text: str) -> List[str]:
+        if self.ignore_case:
+            text = text.lower()
+        search = self._pattern.search
+        found = []
+        match = search(text)
+        while match is not None:
+            keyword = match.group()
+            found.append(keyword)
+            for other in self._overlapping.get(keyword, ()):
+                if text.startswith(other, match.start()):
+                    found.append(other)
+            match = search(text, match.start() + 1)
+        return found
+
+    def find_all(self, text: str) -> Set[str]:
+        """
+        Return every keyword occurring in text.
+        """
+        if self._pattern is None:
+            return set()
+        return set(self._scan(text))
+
+    def first(self, text: str) -> Optional[int]:
+        """
+        Return the lowest index of any keyword occurring in text, or None.
+
+        Same answer as looping over the keywords in order and stopping at the
+        first substring hit, without the per-keyword rescans.
+        """
+        if self._pattern is None:
+            return None
+        found = self._scan(text)
+        if not found:
+            return None
+        index = self._index
+        return min(index[keyword] for keyword in found)
+
+
+class ProviderMatcher:
+    """Map a string to the value of the first key (in dict order) it contains."""
+
+    def __init__(self, mapping: Dict[str, str], ignore_case: bool = True):
+        self.values: List[str] = list(mapping.values())
+        self.matcher = KeywordMatcher(mapping.keys(), ignore_case)
+
+    def match(self, text: str, default: Optional[str] = None) -> Optional[str]:
+        index = self.matcher.first(text)
+        return default if index is None else self.values[index]
+
+
+class SubdomainClassifier:
+    """
+    Sort subdomains into keyword categories in a single pass over the list.
+
+    Each category has keywords that put a name in it and keywords that keep it
+    out (e.g. "capital" for the "api" category). All of them are compiled
+    into one KeywordMatcher, so every name is lowercased and scanned once.
+    """
+
+    def __init__(self, categories: Dict[str, Tuple[Sequence[str], Sequence[str]]]):
+        """
+        Compile the classifier.
+
+        Args:
+            categories (Dict[str, Tuple]): Category name -> (include keywords, exclude keywords)
+        """
+        self.categories = list(categories)
+        keywords: List[str] = []
+        for include, exclude in categories.values():
+            keywords.extend(include)
+            keywords.extend(exclude)
+        self.matcher = KeywordMatcher(keywords)
+        self._rules = [
+            (name, {k.lower() for k in include}, {k.lower() for k in exclude})
+            for name, (include, exclude) in categories.items()
+        ]
+        # Keyword combinations seen so far -> the categories they select
+        self._decisions: Dict[FrozenSet[str], List[str]] = {}
+
+    def categorize(self, subdomain: str) -> List[str]:
+        """Return the categories subdomain belongs to."""
+        found = frozenset(self.matcher.find_all(subdomain))
+        if not found:
+            return []
+        decision = self._decisions.get(found)
+        if decision is None:
+            decision = [name for name, include, exclude in self._rules if found & include and not found & exclude]
+            self._decisions[found] = decision
+        return decision
+
+    def classify(self, subdomains: Iterable[str]) -> Dict[str, List[str]]:
+        """
+        Returns:
+            Dict[str, List[str]]: Category name -> matching subdomains, in input order
+        """
+        classified: Dict[str, List[str]] = {name: [] for name in self.categories}
+        categorize = self.categorize
+        for subdomain in subdomains:
+            for name in categorize(subdomain):
+                classified[name].append(subdomain)
+        return classified
+
+    def classify_indices(self, subdomains: Iterable[str]) -> Dict[str, array]:
+        """
+        Returns:
+            Dict[str, array]: Category name -> array('I') of the positions of matching subdomains
+        """
+        classified: Dict[str, array] = {name: array('I') for name in self.categories}
+        categorize = self.categorize
+        for i, subdomain in enumerate(subdomains):
+            for name in categorize(subdomain):
+                classified[name].append(i)
+        return classified
@@ -0,0 +1,250 @@
+import heapq
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+# Upper bounds (seconds) for whole pipeline stages and for single lookups
+STAGE_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+LOOKUP_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class MetricFamily:
+    """One metric (name, type, help) and its samples, ready to render."""
+
+    def __init__(self, name: str, kind: str, help_text: str):
+        self.name = name
+        self.kind = kind
+        self.help = help_text
+        self.samples: List[Tuple[str, Dict[str, str], float]] = []
+
+    def add(self, value: float, suffix: str = '', **labels) -> 'MetricFamily':
+        self.samples.append((self.name + suffix, labels, value))
+        return self
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for name, labels, value in self.samples:
+            if labels:
+                rendered = ','.join(f'{key}="{_escape(val)}"' for key, val in labels.items())
+                lines.append(f"{name}{{{rendered}}} {_format_value(value)}")
+            else:
+                lines.append(f"{name} {_format_value(value)}")
+        return lines
+
+
+def gauge(name: str, help_text: str, value: Optional[float] = None, **labels) -> MetricFamily:
+    family = MetricFamily(name, 'gauge', help_text)
+    return family.add(value, **labels) if value is not None else family
+
+
+def counter(name: str, help_text: str, value: Optional[float] = None, **labels) -> MetricFamily:
+    family = MetricFamily(name, 'counter', help_text)
+    return family.add(value, **labels) if value is not None else family
+
+
+class Histogram:
+    """
+    Thread-safe Prometheus histogram with optional labels.
+
+    observe() only bumps a few counters under a lock, so it is cheap enough to
+    call for every DNS and organization lookup.
+    """
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LOOKUP_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> ([count per bucket], sum, count)
+        self._series: Dict[LabelValues, List[Any]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float, **labels) -> None:
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            counts = series[0]
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    counts[i] += 1
+                    break
+            series[1] += seconds
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def collect(self) -> MetricFamily:
+        family = MetricFamily(self.name, 'histogram', self.help)
+        with self._lock:
+            series = [(key, list(counts), total, count) for key, (counts, total, count) in self._series.items()]
+        for key, counts, total, count in sorted(series):
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                family.add(cumulative, '_bucket', **labels, le=_format_value(float(bound)))
+            family.add(count, '_bucket', **labels, le='+Inf')
+            family.add(round(total, 6), '_sum', **labels)
+            family.add(count, '_count', **labels)
+        return family
+
+
+class Gauge:
+    """Process-wide level (e.g. lookups in flight) that callers move up and down."""
+
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help = help_text
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1) -> None:
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1) -> None:
+        with self._lock:
+            self.value -= amount
+
+    def collect(self) -> MetricFamily:
+        return gauge(self.name, self.help, self.value)
+
+
+class MetricsRegistry:
+    """
+    Metrics of this process, rendered in the Prometheus text format.
+
+    Histograms and gauges are updated as work happens; collectors are called
+    at scrape time to turn existing stats() dicts (caches, queues) into samples.
+    """
+
+    def __init__(self):
+        self._metrics: List[Any] = []
+        self._collectors: List[Callable[[], Iterable[MetricFamily]]] = []
+        self._lock = threading.Lock()
+
+    def histogram(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LOOKUP_BUCKETS) -> Histogram:
+        metric = Histogram(name, help_text, labelnames, buckets)
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def gauge(self, name: str, help_text: str) -> Gauge:
+        metric = Gauge(name, help_text)
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def collector(self, func: Callable[[], Iterable[MetricFamily]]) -> Callable[[], Iterable[MetricFamily]]:
+        """Register func (usable as a decorator) to contribute metric families at scrape time."""
+        with self._lock:
+            self._collectors.append(func)
+        return func
+
+    def render(self) -> str:
+        with self._lock:
+            metrics, collectors = list(self._metrics), list(self._collectors)
+        lines: List[str] = []
+        for metric in metrics:
+            lines.extend(metric.collect().render())
+        for collect in collectors:
+            for family in collect():
+                lines.extend(family.render())
+        return '\n'.join(lines) + '\n'
+
+
+class RequestTrace:
+    """
+    Timings of one DNS_MAP run, attached to its result when tracing is requested.
+
+    Stages are kept as spans (offset from the start and duration). Lookups are
+    too many to list, so each kind keeps a count, total, maximum and its
+    slowest few items.
+    """
+
+    def __init__(self, slowest: int = 5):
+        self.started = time.perf_counter()
+        self.slowest = slowest
+        self.spans: List[Dict[str, Any]] = []
+        self._operations: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def span(self, name: str, start: float, seconds: float) -> None:
+        """Record a stage that began at perf_counter() value start."""
+        with self._lock:
+            self.spans.append({'name': name, 'start': round(start - self.started, 4), 'seconds': round(seconds, 4)})
+
+    def observe(self, kind: str, item: str, seconds: float) -> None:
+        with self._lock:
+            operation = self._operations.get(kind)
+            if operation is None:
+                operation = self._operations[kind] = {'count': 0, 'seconds': 0.0, 'max': 0.0, 'slowest': []}
+            operation['count'] += 1
+            operation['seconds'] += seconds
+            operation['max'] = max(operation['max'], seconds)
+            # Min-heap of the slowest items seen so far
+            if len(operation['slowest']) < self.slowest:
+                heapq.heappush(operation['slowest'], (seconds, item))
+            elif seconds > operation['slowest'][0][0]:
+                heapq.heapreplace(operation['slowest'], (seconds, item))
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'total_seconds': round(time.perf_counter() - self.started, 4),
+                'stages': sorted(self.spans, key=lambda span: span['start']),
+                'operations': {
+                    kind: {
+                        'count': operation['count'],
+                        'total_seconds': round(operation['seconds'], 4),
+                        'mean_seconds': round(operation['seconds'] / operation['count'], 4),
+                        'max_seconds': round(operation['max'], 4),
+                        'slowest': [{'item': item, 'seconds': round(seconds, 4)}
+                                    for seconds, item in sorted(operation['slowest'], reverse=True)],
+                    }
+                    for kind, operation in self._operations.items()
+                },
+            }
+
+
+# Shared by every component of the process; exposed by app.py at /metrics
+METRICS = MetricsRegistry()
+
+STAGE_SECONDS = METRICS.histogram(
+    'dns_map_stage_seconds', 'Wall time of DNS_MAP pipeline stages', ['stage'], STAGE_BUCKETS)
+DNS_LOOKUP_SECONDS = METRICS.histogram(
+    'dns_map_dns_lookup_seconds', 'Time to resolve the addresses of one subdomain', ['outcome'])
+ORGANIZATION_LOOKUP_SECONDS = METRICS.histogram(
+    'dns_map_organization_lookup_seconds', 'Time to attribute one IP to an organization', ['source'])
+DNS_LOOKUPS_IN_FLIGHT = METRICS.gauge(
+    'dns_map_dns_lookups_in_flight', 'Subdomain lookups currently running')
+RDAP_PENDING = METRICS.gauge(
+    'dns_map_rdap_pending', 'IPs submitted to RDAP pipelines and not yet collected')
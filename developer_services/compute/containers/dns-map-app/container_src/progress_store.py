@@ -0,0 +1,305 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+from functools import partial
+from typing import Any, Dict, Optional, Set, Tuple
+
+from scheduler import SCHEDULER, ExpiryScheduler
+
+logger = logging.getLogger('DNS_MAP')
+
+# Entries are dropped this long after their last update (matches the old temp file sweep)
+DEFAULT_TTL = 1800
+
+# How often wait_async() re-checks stores that can't notify coroutines directly
+ASYNC_POLL_INTERVAL = 0.5
+
+
+class ProgressStore:
+    """
+    Where DNS_MAP publishes progress and /dns/progress/<domain> reads it.
+
+    Entries expire ttl seconds after their last write; expire() shortens the
+    lifetime of a finished run without touching its data.
+    """
+
+    def set(self, domain: str, progress: Dict[str, Any], ttl: Optional[float] = None) -> None:
+        raise NotImplementedError
+
+    def get(self, domain: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def expire(self, domain: str, seconds: float) -> None:
+        raise NotImplementedError
+
+    def delete(self, domain: str) -> None:
+        raise NotImplementedError
+
+    def purge(self) -> int:
+        """Drop expired entries, returning how many were removed."""
+        raise NotImplementedError
+
+    def wait(self, domain: str, after_version: int, timeout: float) -> Tuple[int, Optional[Dict[str, Any]]]:
+        """
+        Block until the domain's progress is newer than after_version, or timeout.
+
+        Every viewer of a domain waits on the same entry, so one producer serves
+        any number of streams; slow viewers skip straight to the latest snapshot.
+
+        Returns:
+            Tuple[int, Optional[Dict]]: (version, progress); progress is None on
+            timeout or when the domain has no live entry
+        """
+        raise NotImplementedError
+
+    async def wait_async(self, domain: str, after_version: int,
+                         timeout: float) -> Tuple[int, Optional[Dict[str, Any]]]:
+        """Same as wait() for coroutines; polls so the event loop is never blocked for long."""
+        deadline = time.time() + timeout
+        while True:
+            version, progress = self.wait(domain, after_version, 0)
+            remaining = deadline - time.time()
+            if progress is not None or remaining <= 0:
+                return version, progress
+            await asyncio.sleep(min(ASYNC_POLL_INTERVAL, remaining))
+
+
+class MemoryProgressStore(ProgressStore):
+    """
+    Per-process dict with TTL expiry. Reads and writes are O(1) and never touch the filesystem.
+
+    Each entry has one timer on the shared scheduler that drops it once it
+    expires, so no sweep scans the whole dict.
+    """
+
+    def __init__(self, ttl: float = DEFAULT_TTL, scheduler: ExpiryScheduler = SCHEDULER):
+        """
+        Initialize the store.
+
+        Args:
+            ttl (float): Default lifetime of an entry after its last write
+            scheduler (ExpiryScheduler): Runs the expirations (default: process-wide SCHEDULER)
+        """
+        self.ttl = ttl
+        self.scheduler = scheduler
+        self._entries: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+        self._updated: Dict[str, threading.Condition] = {}
+        # Threads blocked in wait() per domain; their condition must outlive the entry
+        self._waiting: Counter = Counter()
+        # domain -> (event loop, event) of coroutines in wait_async()
+        self._async_waiters: Dict[str, Set[Tuple[asyncio.AbstractEventLoop, asyncio.Event]]] = {}
+        self._version = 0
+
+    def set(self, domain: str, progress: Dict[str, Any], ttl: Optional[float] = None) -> None:
+        now = time.time()
+        with self._lock:
+            # Copy: the producer keeps mutating its progress dict
+            self._version += 1
+            expires_at = now + (ttl or self.ttl)
+            self._entries[domain] = (expires_at, dict(progress), self._version)
+            if domain in self._updated:
+                self._updated[domain].notify_all()
+            for loop, updated in self._async_waiters.get(domain, ()):
+                loop.call_soon_threadsafe(updated.set)
+        self._schedule_expiry(domain, expires_at)
+
+    def get(self, domain: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(domain)
+            if entry is None:
+                return None
+            expires_at, progress, _ = entry
+            if expires_at <= time.time():
+                del self._entries[domain]
+                return None
+            return dict(progress)
+
+    def wait(self, domain: str, after_version: int, timeout: float) -> Tuple[int, Optional[Dict[str, Any]]]:
+        deadline = time.time() + timeout
+        with self._lock:
+            updated = self._updated.setdefault(domain, threading.Condition(self._lock))
+            self._waiting[domain] += 1
+            try:
+                while True:
+                    entry = self._entries.get(domain)
+                    now = time.time()
+                    if entry is not None and entry[0] > now and entry[2] > after_version:
+                        return entry[2], dict(entry[1])
+                    if now >= deadline:
+                        return after_version, None
+                    updated.wait(deadline - now)
+            finally:
+                self._waiting[domain] -= 1
+                if not self._waiting[domain]:
+                    del self._waiting[domain]
+                    if domain not in self._entries:
+                        self._updated.pop(domain, None)
+
+    async def wait_async(self, domain: str, after_version: int,
+                         timeout: float) -> Tuple[int, Optional[Dict[str, Any]]]:
+        # set() wakes waiting coroutines through their loop, so no thread is parked per viewer
+        loop = asyncio.get_running_loop()
+        deadline = time.time() + timeout
+        while True:
+            updated = asyncio.Event()
+            waiter = (loop, updated)
+            with self._lock:
+                entry = self._entries.get(domain)
+                now = time.time()
+                if entry is not None and entry[0] > now and entry[2] > after_version:
+                    return entry[2], dict(entry[1])
+                if now >= deadline:
+                    return after_version, None
+                self._async_waiters.setdefault(domain, set()).add(waiter)
+            try:
+                await asyncio.wait_for(updated.wait(), deadline - now)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                with self._lock:
+                    waiters = self._async_waiters.get(domain)
+                    if waiters is not None:
+                        waiters.discard(waiter)
+                        if not waiters:
+                            del self._async_waiters[domain]
+
+    def expire(self, domain: str, seconds: float) -> None:
+        with self._lock:
+            entry = self._entries.get(domain)
+            if entry is None:
+                return
+            expires_at = min(entry[0], time.time() + seconds)
+            self._entries[domain] = (expires_at, entry[1], entry[2])
+        self._schedule_expiry(domain, expires_at)
+
+    def delete(self, domain: str) -> None:
+        with self._lock:
+            self._entries.pop(domain, None)
+        self.scheduler.cancel_key('progress', (id(self), domain))
+
+    def _schedule_expiry(self, domain: str, expires_at: float) -> None:
+        # An earlier pending timer is kept; _expire() reschedules if the entry was extended since
+        self.scheduler.call_at(expires_at, partial(self._expire, domain), 'progress', (id(self), domain))
+
+    def _expire(self, domain: str) -> None:
+        with self._lock:
+            entry = self._entries.get(domain)
+            if entry is None:
+                return
+            if entry[0] > time.time():
+                expires_at = entry[0]
+            else:
+                del self._entries[domain]
+                if domain not in self._waiting:
+                    self._updated.pop(domain, None)
+                return
+        self._schedule_expiry(domain, expires_at)
+
+    def purge(self) -> int:
+        now = time.time()
+        with self._lock:
+            expired = [domain for domain, (expires_at, _, _) in self._entries.items() if expires_at <= now]
+            for domain in expired:
+                del self._entries[domain]
+            # Drop conditions nobody is waiting on since their domain went away
+            for domain in [d for d in self._updated if d not in self._entries and d not in self._waiting]:
+                del self._updated[domain]
+        return len(expired)
+
+
+class SQLiteProgressStore(ProgressStore):
+    """
+    SQLite-backed store shared by several gunicorn workers.
+
+    Point it at a tmpfs path such as /dev/shm to keep it in shared memory.
+    Each thread gets its own connection; the database runs in WAL mode so
+    pollers never block the writer.
+    """
+
+    def __init__(self, path: str, ttl: float = DEFAULT_TTL, poll_interval: float = 0.5):
+        self.path = path
+        self.ttl = ttl
+        self.poll_interval = poll_interval
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        connection = self._connection()
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS progress (domain TEXT PRIMARY KEY, data TEXT NOT NULL, expires_at REAL NOT NULL, "
+            "version INTEGER NOT NULL DEFAULT 0)"
+        )
+        connection.execute("CREATE INDEX IF NOT EXISTS progress_expires_at ON progress (expires_at)")
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=OFF")
+            self._local.connection = connection
+        return connection
+
+    def set(self, domain: str, progress: Dict[str, Any], ttl: Optional[float] = None) -> None:
+        self._connection().execute(
+            "INSERT INTO progress (domain, data, expires_at, version) VALUES (?, ?, ?, 1) "
+            "ON CONFLICT(domain) DO UPDATE SET data = excluded.data, expires_at = excluded.expires_at, "
+            "version = progress.version + 1",
+            (domain, json.dumps(progress), time.time() + (ttl or self.ttl)),
+        )
+
+    def get(self, domain: str) -> Optional[Dict[str, Any]]:
+        row = self._connection().execute(
+            "SELECT data FROM progress WHERE domain = ? AND expires_at > ?", (domain, time.time())
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def wait(self, domain: str, after_version: int, timeout: float) -> Tuple[int, Optional[Dict[str, Any]]]:
+        # Producers may live in another worker process, so this polls the shared database
+        deadline = time.time() + timeout
+        while True:
+            row = self._connection().execute(
+                "SELECT version, data FROM progress WHERE domain = ? AND expires_at > ? AND version > ?",
+                (domain, time.time(), after_version),
+            ).fetchone()
+            if row:
+                return row[0], json.loads(row[1])
+            if time.time() >= deadline:
+                return after_version, None
+            time.sleep(min(self.poll_interval, max(deadline - time.time(), 0)))
+
+    def expire(self, domain: str, seconds: float) -> None:
+        self._connection().execute(
+            "UPDATE progress SET expires_at = MIN(expires_at, ?) WHERE domain = ?", (time.time() + seconds, domain)
+        )
+
+    def delete(self, domain: str) -> None:
+        self._connection().execute("DELETE FROM progress WHERE domain = ?", (domain,))
+
+    def purge(self) -> int:
+        return self._connection().execute("DELETE FROM progress WHERE expires_at <= ?", (time.time(),)).rowcount
+
+
+def create_progress_store(spec: str) -> ProgressStore:
+    """
+    Build a progress store from a spec string.
+
+    Args:
+        spec (str): 'memory' (default) or 'sqlite:///path/to/progress.db'
+
+    Returns:
+        ProgressStore: The configured backend
+    """
+    if spec.startswith('sqlite://'):
+        return SQLiteProgressStore(spec[len('sqlite://'):])
+    if spec not in ('', 'memory'):
+        logger.warning(f"Unknown progress store '{spec}', using in-memory store")
+    return MemoryProgressStore()
+
+
+# Shared by DNS_MAP and the Flask routes; PROGRESS_STORE=sqlite:////dev/shm/dns_map_progress.db for multi-worker setups
+PROGRESS_STORE = create_progress_store(os.environ.get('PROGRESS_STORE', 'memory'))
@@ -0,0 +1,420 @@
+import asyncio
+import ipaddress
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from ip_org_index import PrefixIndex, load_ip_org_index, rdap_cidrs
+from metrics import ORGANIZATION_LOOKUP_SECONDS, RDAP_PENDING, RequestTrace
+
+logger = logging.getLogger('DNS_MAP')
+
+# IANA RDAP bootstrap registries mapping address blocks to their RIR service
+BOOTSTRAP_BASE_URL = os.environ.get('RDAP_BOOTSTRAP_BASE_URL', 'https://data.iana.org/rdap').rstrip('/')
+BOOTSTRAP_URLS = {
+    4: f'{BOOTSTRAP_BASE_URL}/ipv4.json',
+    6: f'{BOOTSTRAP_BASE_URL}/ipv6.json',
+}
+
+# Sustained requests/second and burst per registry; 'default' covers anything else
+REGISTRY_RATES = {
+    'arin': (5.0, 10),
+    'ripe': (5.0, 10),
+    'apnic': (5.0, 10),
+    'lacnic': (2.0, 5),
+    'afrinic': (2.0, 5),
+    'default': (2.0, 5),
+}
+
+# IPs sharing this prefix wait for one lookup, whose answer usually covers them all
+COALESCE_PREFIXLEN = {4: 24, 6: 48}
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket.
+
+    reserve() takes a token immediately and returns how long the caller must
+    wait before using it, so buckets can be shared by several event loops.
+    """
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    async def acquire(self) -> None:
+        delay = self.reserve()
+        if delay:
+            await asyncio.sleep(delay)
+
+
+# Process-wide, so concurrent mapping runs share each registry's budget
+_buckets: Dict[str, TokenBucket] = {}
+_buckets_lock = threading.Lock()
+
+_bootstraps: Dict[Tuple[str, ...], PrefixIndex] = {}
+_bootstraps_lock = threading.Lock()
+
+
+def registry_bucket(registry: str, rates: Optional[Dict[str, Tuple[float, int]]] = None) -> TokenBucket:
+    """Return the shared token bucket of a registry."""
+    rates = rates or REGISTRY_RATES
+    with _buckets_lock:
+        if registry not in _buckets:
+            _buckets[registry] = TokenBucket(*rates.get(registry, rates['default']))
+        return _buckets[registry]
+
+
+def registry_name(base_url: str) -> str:
+    """Short registry name (arin, ripe, ...) for an RDAP service URL."""
+    for registry in ('arin', 'ripe', 'apnic', 'lacnic', 'afrinic'):
+        if registry in base_url.lower():
+            return registry
+    return 'default'
+
+
+def load_bootstrap(urls: Dict[int, str], session: requests.Session, timeout: float) -> PrefixIndex:
+    """
+    Fetch the RDAP bootstrap files once per process and index block -> service URL.
+
+    A failed fetch yields an empty index; every lookup then uses the fallback.
+    """
+    key = tuple(urls[version] for version in sorted(urls))
+    with _bootstraps_lock:
+        if key in _bootstraps:
+            return _bootstraps[key]
+
+        index = PrefixIndex(min_prefixlen={4: 0, 6: 0})
+        for version, url in urls.items():
+            try:
+                data = session.get(url, timeout=timeout).json()
+                for prefixes, services in data.get('services', []):
+                    base = services[0] if services[0].endswith('/') else f"{services[0]}/"
+                    for prefix in prefixes:
+                        index.insert(prefix, base)
+            except Exception as e:
+                logger.warning(f"Error loading RDAP bootstrap {url}: {str(e)}")
+        # Only a successful load is kept; an empty index is retried by the next pipeline
+        if len(index):
+            _bootstraps[key] = index
+        return index
+
+
+def rdap_to_results(data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Reshape a raw RDAP IP network object into the subset of IPWhois.lookup_rdap
+    output that DNS_MAP reads (network name/remarks/cidr and contact objects).
+    """
+    cidrs = []
+    for cidr in data.get('cidr0_cidrs') or []:
+        prefix = cidr.get('v4prefix') or cidr.get('v6prefix')
+        if prefix and cidr.get('length') is not None:
+            cidrs.append(f"{prefix}/{cidr['length']}")
+    if not cidrs and data.get('startAddress') and data.get('endAddress'):
+        try:
+            start = ipaddress.ip_address(data['startAddress'])
+            end = ipaddress.ip_address(data['endAddress'])
+            cidrs = [str(network) for network in ipaddress.summarize_address_range(start, end)]
+        except (ValueError, TypeError):
+            pass
+
+    remarks = [' '.join(remark.get('description') or []) for remark in data.get('remarks') or []]
+
+    objects = {}
+    for entity in data.get('entities') or []:
+        for field in (entity.get('vcardArray') or [None, []])[1]:
+            if field and field[0] == 'fn':
+                objects[entity.get('handle', field[3])] = {'contact': {'name': field[3]}}
+                break
+
+    return {
+        'network': {
+            'name': data.get('name'),
+            'handle': data.get('handle'),
+            'remarks': [remark for remark in remarks if remark] or None,
+            'cidr': ', '.join(cidrs),
+        },
+        'objects': objects,
+    }
+
+
+class RDAPPipeline:
+    """
+    Asynchronous IP -> organization stage for IPs that miss every local cache.
+
+    IPs are submitted from any thread and attributed on an asyncio loop running
+    on a helper thread. Duplicate in-flight lookups for the same IP, and IPs
+    sharing a coalescing prefix, wait on a single RDAP request. Requests are
+    throttled per registry (ARIN, RIPE, APNIC, ...) with token buckets, and
+    (ip, organization) pairs are streamed back as soon as each one is known.
+    """
+
+    def __init__(self, organization_from_rdap: Callable[[Dict[str, Any]], str],
+                 fallback: Callable[[str], str], max_concurrency: int = 16, timeout: float = 10,
+                 registry_rates: Optional[Dict[str, Tuple[float, int]]] = None,
+                 bootstrap_urls: Optional[Dict[int, str]] = None, index: Optional[PrefixIndex] = None,
+                 trace: Optional[RequestTrace] = None):
+        """
+        Initialize the pipeline.
+
+        Args:
+            organization_from_rdap (Callable): Picks an organization out of lookup_rdap-shaped results
+            fallback (Callable): Blocking lookup used when RDAP cannot answer (e.g. ipwhois)
+            max_concurrency (int): Maximum RDAP requests in flight
+            timeout (float): Per-request HTTP timeout in seconds
+            registry_rates (Dict, optional): registry -> (requests/second, burst)
+            bootstrap_urls (Dict, optional): IP version -> RDAP bootstrap URL
+            index (PrefixIndex, optional): Prefix cache consulted first and filled with every answer
+                (default: the process-wide one from load_ip_org_index())
+            trace (RequestTrace, optional): Also receives every RDAP request's duration
+        """
+        self.organization_from_rdap = organization_from_rdap
+        self.fallback = fallback
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.registry_rates = registry_rates or REGISTRY_RATES
+        self.bootstrap_urls = bootstrap_urls or BOOTSTRAP_URLS
+        self.index = index if index is not None else load_ip_org_index()
+        self.trace = trace
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=8, pool_maxsize=max_concurrency)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        self.stats = {'submitted': 0, 'index_hits': 0, 'coalesced': 0, 'rdap_requests': 0,
+                      'throttled': 0, 'fallbacks': 0}
+        self._results: queue.Queue = queue.Queue()
+        self._pending = 0
+        self._pending_lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        self._group_leaders: Dict[Tuple[int, int], asyncio.Future] = {}
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._bootstrap: Optional[PrefixIndex] = None
+        self._bootstrap_lock: Optional[asyncio.Lock] = None
+
+    def start(self) -> 'RDAPPipeline':
+        """Start the event loop thread."""
+        ready = threading.Event()
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix='rdap')
+
+        def run() -> None:
+            self._loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self._loop)
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._bootstrap_lock = asyncio.Lock()
+            ready.set()
+            self._loop.run_forever()
+            self._loop.close()
+
+        self._thread = threading.Thread(target=run, name='rdap-pipeline', daemon=True)
+        self._thread.start()
+        ready.wait()
+        return self
+
+    def close(self) -> None:
+        """Cancel lookups still in flight, stop the loop thread and release HTTP connections."""
+        if self._loop is not None:
+            try:
+                asyncio.run_coroutine_threadsafe(self._cancel_pending(), self._loop).result(timeout=5)
+            except Exception as e:
+                logger.warning(f"RDAP pipeline lookups still running at close: {str(e)}")
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(timeout=5)
+            self._loop = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+        with self._pending_lock:
+            # IPs abandoned by a cancelled or failed run no longer count as queued
+            RDAP_PENDING.dec(self._pending)
+            self._pending = 0
+        self.session.close()
+
+    async def _cancel_pending(self) -> None:
+        """Cancel and collect every unfinished lookup, so none is destroyed pending when the loop stops."""
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for future in self._in_flight.values():
+            future.cancel()
+
+    def __enter__(self) -> 'RDAPPipeline':
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def submit(self, ip: str) -> None:
+        """Queue an IP for attribution; safe to call from any thread."""
+        with self._pending_lock:
+            self._pending += 1
+            self.stats['submitted'] += 1
+        RDAP_PENDING.inc()
+        asyncio.run_coroutine_threadsafe(self._attribute(ip), self._loop)
+
+    def completed(self) -> Iterator[Tuple[str, str]]:
+        """Yield the (ip, organization) results available right now without blocking."""
+        while True:
+            try:
+                item = self._results.get_nowait()
+            except queue.Empty:
+                return
+            yield self._consume(item)
+
+    def finish(self) -> Iterator[Tuple[str, str]]:
+        """Yield every outstanding result, blocking until all submitted IPs are attributed."""
+        while True:
+            with self._pending_lock:
+                if self._pending == 0 and self._results.empty():
+                    return
+            yield self._consume(self._results.get())
+
+    def _consume(self, item: Tuple[str, str]) -> Tuple[str, str]:
+        with self._pending_lock:
+            self._pending -= 1
+        RDAP_PENDING.dec()
+        return item
+
+    async def _attribute(self, ip: str) -> None:
+        try:
+            organization = await self._organization(ip)
+        except Exception as e:
+            logger.error(f"RDAP pipeline failed for {ip}: {str(e)}")
+            organization = "Error in IP Lookup"
+        self._results.put((ip, organization))
+
+    async def _organization(self, ip: str) -> str:
+        cached = self.index.lookup(ip)
+        if cached is not None:
+            self.stats['index_hits'] += 1
+            return cached
+
+        in_flight = self._in_flight.get(ip)
+        if in_flight is not None:
+            self.stats['coalesced'] += 1
+            return await asyncio.shield(in_flight)
+
+        group = self._group_key(ip)
+        leader = self._group_leaders.get(group)
+        if leader is not None:
+            await asyncio.wait({leader})
+            cached = self.index.lookup(ip)
+            if cached is not None:
+                self.stats['coalesced'] += 1
+                return cached
+            in_flight = self._in_flight.get(ip)
+            if in_flight is not None:
+                self.stats['coalesced'] += 1
+                return await asyncio.shield(in_flight)
+
+        future = self._loop.create_future()
+        self._in_flight[ip] = future
+        self._group_leaders.setdefault(group, future)
+        try:
+            organization = await self._lookup(ip)
+            future.set_result(organization)
+            return organization
+        except Exception as e:
+            future.set_exception(e)
+            # Waiters re-raise it themselves; with none left, asyncio would log it as never retrieved
+            future.exception()
+            raise
+        finally:
+            del self._in_flight[ip]
+            if self._group_leaders.get(group) is future:
+                del self._group_leaders[group]
+
+    async def _lookup(self, ip: str) -> str:
+        loop = self._loop
+        base_url = await self._service_for(ip)
+        if base_url is None:
+            return await self._fallback(ip)
+
+        bucket = registry_bucket(registry_name(base_url), self.registry_rates)
+        async with self._semaphore:
+            # An answer that arrived while this request was queued may already cover the IP
+            cached = self.index.lookup(ip)
+            if cached is not None:
+                self.stats['index_hits'] += 1
+                return cached
+
+            response = None
+            for attempt in range(3):
+                await bucket.acquire()
+                self.stats['rdap_requests'] += 1
+                start = time.perf_counter()
+                try:
+                    response = await loop.run_in_executor(self._executor, partial(
+                        self.session.get, f"{base_url}ip/{ip}", timeout=self.timeout,
+                        headers={'accept': 'application/rdap+json'}))
+                except requests.RequestException as e:
+                    logger.warning(f"RDAP request for {ip} failed: {str(e)}")
+                    response = None
+                    break
+                finally:
+                    self._observe(ip, time.perf_counter() - start)
+                if response.status_code != 429:
+                    break
+                self.stats['throttled'] += 1
+                retry_after = response.headers.get('Retry-After', '')
+                await asyncio.sleep(float(retry_after) if retry_after.isdigit() else 2 ** attempt)
+
+        if response is None or response.status_code != 200:
+            return await self._fallback(ip)
+
+        try:
+            results = rdap_to_results(response.json())
+        except (ValueError, AttributeError, TypeError) as e:
+            # An HTML error page or other malformed body is a failed lookup like any other
+            logger.warning(f"Malformed RDAP response for {ip}: {str(e)}")
+            return await self._fallback(ip)
+        organization = self.organization_from_rdap(results)
+        self.index.insert_many(rdap_cidrs(results), organization)
+        return organization
+
+    def _observe(self, ip: str, seconds: float) -> None:
+        ORGANIZATION_LOOKUP_SECONDS.observe(seconds, source='rdap')
+        if self.trace is not None:
+            self.trace.observe('rdap_request', ip, seconds)
+
+    async def _fallback(self, ip: str) -> str:
+        self.stats['fallbacks'] += 1
+        return await self._loop.run_in_executor(self._executor, self.fallback, ip)
+
+    async def _service_for(self, ip: str) -> Optional[str]:
+        if self._bootstrap is None:
+            async with self._bootstrap_lock:
+                if self._bootstrap is None:
+                    self._bootstrap = await self._loop.run_in_executor(
+                        self._executor, load_bootstrap, self.bootstrap_urls, self.session, self.timeout)
+        return self._bootstrap.lookup(ip)
+
+    @staticmethod
+    def _group_key(ip: str) -> Tuple[int, int]:
+        address = ipaddress.ip_address(ip)
+        bits = 32 if address.version == 4 else 128
+        return address.version, int(address) >> (bits - COALESCE_PREFIXLEN[address.version])
@@ -0,0 +1,274 @@
+import asyncio
+import itertools
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+
+import dns.asyncresolver
+import dns.nameserver
+import dns.resolver
+
+from batch_resolver import TRANSIENT_ERRORS, resolve_addresses, resolve_addresses_async
+from dns_transport import build_router, split_host_port
+from metrics import DNS_LOOKUP_SECONDS, DNS_LOOKUPS_IN_FLIGHT, RequestTrace
+
+logger = logging.getLogger('DNS_MAP')
+
+# Supported execution strategies for the resolution engine
+RESOLVER_MODES = ('thread', 'async')
+
+# (subdomain, addresses, resolution_output) - same shape DNS_MAP._dig_addresses produces
+LookupResult = Tuple[str, List[str], str]
+
+
+def build_resolver(timeout: float = 10, nameservers: Optional[List[str]] = None, port: int = 53,
+                   resolver_class=dns.resolver.Resolver, transport: str = 'udp'):
+    """
+    Build a dnspython resolver with a per-query deadline.
+
+    Args:
+        timeout (float): Seconds allowed for a single query, retries included
+        nameservers (List[str], optional): Upstream servers ("host" or "host:port"); system resolv.conf
+            is used when omitted
+        port (int): Upstream port of nameservers given without one
+        resolver_class: dns.resolver.Resolver or dns.asyncresolver.Resolver
+        transport (str): 'udp' for dnspython's resolver, 'tcp' or 'doh' for a pipelined UpstreamRouter
+            (nameservers are then tcp addresses or DoH URLs)
+
+    Returns:
+        A configured resolver instance
+    """
+    if transport != 'udp':
+        router = build_router(transport, nameservers, port, timeout)
+        return router.async_resolver() if resolver_class is dns.asyncresolver.Resolver else router
+    resolver = resolver_class(configure=not nameservers)
+    if nameservers:
+        resolver.nameservers = [dns.nameserver.Do53Nameserver(*split_host_port(address, port))
+                                for address in nameservers]
+    resolver.timeout = timeout
+    resolver.lifetime = timeout
+    return resolver
+
+
+class ResolutionEngine:
+    """
+    Resolve many subdomains with a bounded number of queries in flight.
+
+    Two strategies are available: a thread pool running a blocking lookup
+    callable, or a single asyncio loop driving dnspython's async resolver.
+    Results are yielded as they complete, not in input order.
+    """
+
+    def __init__(self, mode: str = 'thread', max_in_flight: int = 32, query_timeout: float = 10,
+                 lookup: Optional[Callable[[str], Tuple[List[str], str]]] = None,
+                 nameservers: Optional[List[str]] = None, port: int = 53, transport: str = 'udp',
+                 trace: Optional[RequestTrace] = None):
+        """
+        Initialize the engine.
+
+        Args:
+            mode (str): 'thread' or 'async'
+            max_in_flight (int): Maximum number of concurrent queries
+            query_timeout (float): Per-query deadline in seconds
+            lookup (Callable, optional): Blocking lookup used in thread mode, returning (addresses, output).
+                Defaults to an A/AAAA lookup following CNAME chains.
+            nameservers (List[str], optional): Upstream servers, system resolver when omitted
+            port (int): Upstream port
+            transport (str): 'udp', 'tcp' (pipelined) or 'doh'
+            trace (RequestTrace, optional): Also receives every lookup's duration
+        """
+        if mode not in RESOLVER_MODES:
+            raise ValueError(f"Unknown resolver mode: {mode}. Expected one of {', '.join(RESOLVER_MODES)}")
+        if max_in_flight < 1:
+            raise ValueError(f"max_in_flight must be at least 1, got {max_in_flight}")
+
+        self.mode = mode
+        self.max_in_flight = max_in_flight
+        self.query_timeout = query_timeout
+        self.nameservers = nameservers
+        self.port = port
+        self.transport = transport
+        self.trace = trace
+        self.lookup = lookup or self._lookup_sync
+        self._resolver = None
+
+    def make_resolver(self) -> dns.resolver.Resolver:
+        """Build a blocking resolver using the engine's upstream and deadline settings."""
+        return build_resolver(self.query_timeout, self.nameservers, self.port, transport=self.transport)
+
+    @property
+    def resolver(self) -> dns.resolver.Resolver:
+        """Blocking resolver shared by all worker threads of this engine."""
+        if self._resolver is None:
+            self._resolver = self.make_resolver()
+        return self._resolver
+
+    def resolve(self, subdomains: Iterable[str]) -> Iterator[LookupResult]:
+        """
+        Resolve every subdomain, yielding results as they complete.
+
+        Args:
+            subdomains (Iterable[str]): Names to resolve
+
+        Yields:
+            LookupResult: (subdomain, addresses (empty on failure), resolution output)
+        """
+        if self.mode == 'async':
+            return self._resolve_async(subdomains)
+        return self._resolve_threaded(subdomains)
+
+    def _lookup_sync(self, subdomain: str) -> Tuple[List[str], str]:
+        """Default blocking lookup: every A/AAAA address of the subdomain, CNAME chain included."""
+        return resolve_addresses(self.resolver, subdomain)
+
+    async def _lookup_async(self, resolver: dns.asyncresolver.Resolver, subdomain: str) -> Tuple[List[str], str]:
+        """Async counterpart of the default lookup, with a hard deadline."""
+        try:
+            return await asyncio.wait_for(resolve_addresses_async(resolver, subdomain), self.query_timeout)
+        except asyncio.TimeoutError:
+            return [], f"DNS exception: query for {subdomain} exceeded {self.query_timeout}s deadline"
+
+    def _timed_lookup(self, subdomain: str) -> Tuple[List[str], str]:
+        """Run the blocking lookup, recording its duration and outcome."""
+        DNS_LOOKUPS_IN_FLIGHT.inc()
+        start = time.perf_counter()
+        try:
+            addresses, output = self.lookup(subdomain)
+        except Exception as e:
+            addresses, output = [], f"Error resolving {subdomain}: {str(e)}"
+        finally:
+            DNS_LOOKUPS_IN_FLIGHT.dec()
+        self._observe(subdomain, addresses, output, time.perf_counter() - start)
+        return addresses, output
+
+    def _observe(self, subdomain: str, addresses: List[str], output: str, seconds: float) -> None:
+        outcome = 'answer' if addresses else ('error' if output.startswith(TRANSIENT_ERRORS) else 'no_answer')
+        DNS_LOOKUP_SECONDS.observe(seconds, outcome=outcome)
+        if self.trace is not None:
+            self.trace.observe('dns_lookup', subdomain, seconds)
+
+    def _resolve_threaded(self, subdomains: Iterable[str]) -> Iterator[LookupResult]:
+        """Sliding window over a thread pool: never more than max_in_flight pending futures."""
+        names = iter(subdomains)
+        with ThreadPoolExecutor(max_workers=self.max_in_flight, thread_name_prefix='dns-resolve') as executor:
+            pending = {executor.submit(self._timed_lookup, name): name
+                       for name in itertools.islice(names, self.max_in_flight)}
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    subdomain = pending.pop(future)
+                    try:
+                        addresses, output = future.result()
+                    except Exception as e:
+                        addresses, output = [], f"Error resolving {subdomain}: {str(e)}"
+
+                    next_name = next(names, None)
+                    if next_name is not None:
+                        pending[executor.submit(self._timed_lookup, next_name)] = next_name
+
+                    yield subdomain, addresses, output
+
+    def _resolve_async(self, subdomains: Iterable[str]) -> Iterator[LookupResult]:
+        """Run an asyncio worker pool on a helper thread and hand results back through a queue."""
+        results: queue.Queue = queue.Queue()
+        finished = object()
+        stop = threading.Event()
+
+        async def worker(names: asyncio.Queue, resolver: dns.asyncresolver.Resolver) -> None:
+            # A fixed pool of workers keeps at most max_in_flight queries outstanding
+            while True:
+                subdomain = await names.get()
+                if subdomain is None:
+                    return
+                if stop.is_set():
+                    # Keep draining so the feeder never blocks on a full queue
+                    continue
+                DNS_LOOKUPS_IN_FLIGHT.inc()
+                start = time.perf_counter()
+                try:
+                    addresses, output = await self._lookup_async(resolver, subdomain)
+                except Exception as e:
+                    addresses, output = [], f"Error resolving {subdomain}: {str(e)}"
+                finally:
+                    DNS_LOOKUPS_IN_FLIGHT.dec()
+                self._observe(subdomain, addresses, output, time.perf_counter() - start)
+                results.put((subdomain, addresses, output))
+
+        def feed(loop: asyncio.AbstractEventLoop, names: asyncio.Queue) -> None:
+            # The input may block (e.g. a SubdomainFeed still being filled), so it is drained off-loop
+            try:
+                for subdomain in subdomains:
+                    if stop.is_set():
+                        break
+                    asyncio.run_coroutine_threadsafe(names.put(subdomain), loop).result()
+            finally:
+                for _ in range(self.max_in_flight):
+                    asyncio.run_coroutine_threadsafe(names.put(None), loop).result()
+
+        async def run() -> None:
+            resolver = build_resolver(self.query_timeout, self.nameservers, self.port,
+                                      resolver_class=dns.asyncresolver.Resolver, transport=self.transport)
+            loop = asyncio.get_running_loop()
+            names: asyncio.Queue = asyncio.Queue(maxsize=self.max_in_flight)
+            feeder = loop.run_in_executor(None, feed, loop, names)
+            await asyncio.gather(*(worker(names, resolver) for _ in range(self.max_in_flight)))
+            await feeder
+
+        def runner() -> None:
+            try:
+                asyncio.run(run())
+            except Exception as e:
+                logger.error(f"Async resolution loop failed: {str(e)}")
+            finally:
+                results.put(finished)
+
+        thread = threading.Thread(target=runner, name='dns-resolve-async', daemon=True)
+        thread.start()
+        try:
+            while True:
+                item = results.get()
+                if item is finished:
+                    break
+                yield item
+        finally:
+            stop.set()
+
+
+class SubdomainFeed:
+    """
+    Iterable of subdomains filled by a producer thread while a consumer iterates.
+
+    Lets resolution start on the first page of subdomains instead of waiting for
+    the full list. len() is the number of names received so far.
+    """
+
+    _closed = object()
+
+    def __init__(self):
+        self._queue: queue.Queue = queue.Queue()
+        self._count = 0
+        self.done = False
+
+    def __len__(self) -> int:
+        return self._count
+
+    def extend(self, subdomains: Iterable[str]) -> None:
+        """Make more subdomains available to the consumer."""
+        for subdomain in subdomains:
+            self._count += 1
+            self._queue.put(subdomain)
+
+    def close(self) -> None:
+        """Signal that no more subdomains will arrive."""
+        self.done = True
+        self._queue.put(self._closed)
+
+    def __iter__(self) -> Iterator[str]:
+        while True:
+            subdomain = self._queue.get()
+            if subdomain is self._closed:
+                return
+            yield subdomain
@@ -0,0 +1,309 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import partial
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from scheduler import SCHEDULER, ExpiryScheduler
+
+logger = logging.getLogger('DNS_MAP')
+
+DEFAULT_RESULT_TTL = float(os.environ.get('RESULT_CACHE_TTL', 3600))
+DEFAULT_MAX_RESULTS = int(os.environ.get('RESULT_CACHE_MAX_ENTRIES', 256))
+# How often a waiter with a cancel_event checks it while the flight runs
+CANCEL_POLL_INTERVAL = 0.1
+
+
+class ComputeCancelled(Exception):
+    """Raised by get_or_compute() in a caller whose cancel_event was set before it got a result."""
+
+
+class _FlightCancel:
+    """
+    The cancel event a flight's computation checks: set only once every caller sharing it has cancelled.
+
+    Callers without a cancel event can't cancel, so while one of them shares the
+    flight it keeps running. Quacks like threading.Event.is_set() for DNS_MAP.
+    """
+
+    def __init__(self):
+        self._events: List[Optional[threading.Event]] = []
+        self._lock = threading.Lock()
+        # True once the computation has been told to stop
+        self.observed = False
+
+    def add(self, event: Optional[threading.Event]) -> None:
+        with self._lock:
+            self._events.append(event)
+
+    def is_set(self) -> bool:
+        with self._lock:
+            cancelled = all(event is not None and event.is_set() for event in self._events)
+            self.observed = self.observed or cancelled
+            return cancelled
+
+
+class _Flight:
+    """One in-progress computation that concurrent callers for the same key wait on."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value: Any = None
+        self.error: Optional[BaseException] = None
+        self.cancel = _FlightCancel()
+        self._callbacks: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+
+    def add_done_callback(self, callback: Callable[[], None]) -> None:
+        """Call callback once the flight finishes (right away if it already has)."""
+        with self._lock:
+            if not self.done.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def finish(self) -> None:
+        with self._lock:
+            self.done.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback()
+
+    async def wait_async(self) -> None:
+        """Wait for the flight from a coroutine without tying up a thread."""
+        loop = asyncio.get_running_loop()
+        finished = loop.create_future()
+        self.add_done_callback(lambda: loop.call_soon_threadsafe(
+            lambda: finished.done() or finished.set_result(None)))
+        await finished
+
+
+class ResultCache:
+    """
+    TTL'd, size-bounded LRU cache of finished DNS maps with single-flight computation.
+
+    Concurrent get_or_compute() calls for the same key share one computation:
+    the first caller runs it and the others block until it finishes, then all
+    of them get the same result (or the same exception). Failures are never
+    cached.
+
+    A caller can pass a cancel_event to stop waiting: it leaves with
+    ComputeCancelled as soon as the event is set. The shared computation is
+    only cancelled once every caller sharing it has cancelled, so one caller's
+    cancellation never fails the others.
+    """
+
+    def __init__(self, ttl: float = DEFAULT_RESULT_TTL, max_entries: int = DEFAULT_MAX_RESULTS,
+                 scheduler: ExpiryScheduler = SCHEDULER):
+        """
+        Initialize the cache.
+
+        Args:
+            ttl (float): Seconds a finished result is served before it is recomputed
+            max_entries (int): Least recently used results are evicted beyond this many
+            scheduler (ExpiryScheduler): Drops results once their ttl passes, so memory of
+                maps nobody asks for again is freed (default: process-wide SCHEDULER)
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.scheduler = scheduler
+        self._entries: 'OrderedDict[str, Tuple[float, Any]]' = OrderedDict()
+        self._flights: Dict[str, _Flight] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.shared = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return the cached result for key, or None when missing or expired."""
+        with self._lock:
+            return self._get_locked(key)
+
+    def _get_locked(self, key: str) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.time():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    def put(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._put_locked(key, value)
+
+    def _put_locked(self, key: str, value: Any) -> None:
+        expires_at = time.time() + self.ttl
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        self._schedule_expiry(key, expires_at)
+        while len(self._entries) > self.max_entries:
+            evicted, _ = self._entries.popitem(last=False)
+            self.scheduler.cancel_key('result', (id(self), evicted))
+            self.evictions += 1
+
+    def invalidate(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+        self.scheduler.cancel_key('result', (id(self), key))
+
+    def _schedule_expiry(self, key: str, expires_at: float) -> None:
+        self.scheduler.call_at(expires_at, partial(self._expire, key), 'result', (id(self), key))
+
+    def _expire(self, key: str) -> None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+            if entry[0] <= time.time():
+                del self._entries[key]
+                return
+            # Recomputed since this timer was set
+            self._schedule_expiry(key, entry[0])
+
+    def get_or_compute(self, key: str, compute: Callable[[Any], Any], refresh: bool = False,
+                       cacheable: Optional[Callable[[Any], bool]] = None,
+                       cancel_event: Optional[threading.Event] = None) -> Tuple[Any, bool]:
+        """
+        Return the result for key, computing it at most once across concurrent callers.
+
+        Args:
+            key (str): Cache key, e.g. the apex domain
+            compute (Callable): Produces the result; only called by the leader of a flight, with
+                the flight's cancel event, which is set once every caller sharing it has cancelled
+            refresh (bool): Skip the cached result and compute a fresh one. A computation
+                already in flight is joined rather than duplicated, since it is fresh too.
+            cacheable (Callable, optional): Returns False for results that should be shared
+                with current waiters but not cached, e.g. degraded maps
+            cancel_event (threading.Event, optional): Set to stop waiting for the result. A
+                leader cancelled while others still wait finishes the computation for them.
+
+        Returns:
+            Tuple[Any, bool]: (result, cached) where cached is True when the result
+            came from the cache rather than a computation this call waited on
+
+        Raises:
+            ComputeCancelled: cancel_event was set before the result was ready
+            Exception: Whatever compute() raised, re-raised in every waiting caller
+        """
+        while True:
+            value, flight, leader = self._join_or_lead(key, refresh, cancel_event)
+            if flight is None:
+                return value, True
+
+            if leader:
+                try:
+                    flight.value = compute(flight.cancel)
+                except BaseException as e:
+                    flight.error = e
+                    raise
+                finally:
+                    self._land(key, flight, cacheable)
+                _check_cancelled(key, cancel_event)
+                return flight.value, False
+
+            logger.info(f"Joining in-flight DNS map for {key}")
+            if cancel_event is None:
+                flight.done.wait()
+            else:
+                while not flight.done.wait(CANCEL_POLL_INTERVAL):
+                    _check_cancelled(key, cancel_event)
+            if not self._rejoin(flight, cancel_event):
+                return flight.value, False
+
+    async def get_or_compute_async(self, key: str, compute: Callable[[Any], Awaitable[Any]], refresh: bool = False,
+                                   cacheable: Optional[Callable[[Any], bool]] = None) -> Tuple[Any, bool]:
+        """
+        Same as get_or_compute() for coroutines; compute returns an awaitable.
+
+        Waiters await the flight instead of blocking a thread, and share flights
+        with synchronous callers, so an ASGI request and a WSGI request or job for
+        the same domain still run the map once.
+        """
+        while True:
+            value, flight, leader = self._join_or_lead(key, refresh, None)
+            if flight is None:
+                return value, True
+
+            if leader:
+                try:
+                    flight.value = await compute(flight.cancel)
+                except BaseException as e:
+                    flight.error = e
+                    raise
+                finally:
+                    self._land(key, flight, cacheable)
+                return flight.value, False
+
+            logger.info(f"Joining in-flight DNS map for {key}")
+            await flight.wait_async()
+            if not self._rejoin(flight, None):
+                return flight.value, False
+
+    @staticmethod
+    def _rejoin(flight: _Flight, cancel_event: Optional[threading.Event]) -> bool:
+        """
+        After a flight a caller waited on finished: raise its error, or return True to start over.
+
+        A flight cancelled by everyone sharing it before this caller joined failed
+        for a cancellation that wasn't this caller's, so the caller computes anew.
+        """
+        if flight.error is None:
+            return False
+        if flight.cancel.observed and not (cancel_event is not None and cancel_event.is_set()):
+            return True
+        raise flight.error
+
+    def _join_or_lead(self, key: str, refresh: bool,
+                      cancel_event: Optional[threading.Event]) -> Tuple[Optional[Any], Optional[_Flight], bool]:
+        """Return (cached value, flight, leader); exactly one of value and flight is set."""
+        with self._lock:
+            if not refresh:
+                value = self._get_locked(key)
+                if value is not None:
+                    self.hits += 1
+                    return value, None, False
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self.misses += 1
+            else:
+                self.shared += 1
+            flight.cancel.add(cancel_event)
+            return None, flight, leader
+
+    def _land(self, key: str, flight: _Flight, cacheable: Optional[Callable[[Any], bool]]) -> None:
+        """Cache the leader's result if allowed and release everyone waiting on the flight."""
+        with self._lock:
+            if flight.error is None and (cacheable is None or cacheable(flight.value)):
+                self._put_locked(key, flight.value)
+            del self._flights[key]
+        flight.finish()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'shared': self.shared,
+                'in_flight': len(self._flights),
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'evictions': self.evictions,
+                'ttl': self.ttl
+            }
+
+
+def _check_cancelled(key: str, cancel_event: Optional[threading.Event]) -> None:
+    if cancel_event is not None and cancel_event.is_set():
+        raise ComputeCancelled(f"Stopped waiting for {key}: cancelled")
+
+
+# Finished maps keyed by apex domain, shared by every request in this worker process
+RESULT_CACHE = ResultCache()
@@ -0,0 +1,204 @@
+import copy
+import json
+from array import array
+from itertools import islice
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Categories of the zero_trust block, in response order; 'api' is reported as api_domains
+ZERO_TRUST_CATEGORIES = ('secure', 'access', 'remote', 'vpn')
+
+# Encoded text is handed to the server in pieces of about this many characters
+JSON_CHUNK_SIZE = 64 * 1024
+# Sequence items encoded per json.dumps() call
+SEQUENCE_BATCH = 1024
+
+_SCALARS = (str, int, float, bool, type(None))
+
+
+class SubdomainSet:
+    """
+    Every subdomain of a map stored once, with categories as index arrays into it.
+
+    A category costs 4 bytes per member instead of a list slot per name plus a
+    copy in every serialized form. share_names() lets a refreshed map reuse the
+    strings of the cached map it replaces.
+    """
+
+    __slots__ = ('names', 'categories')
+
+    def __init__(self, names: Sequence[str], categories: Optional[Dict[str, array]] = None):
+        """
+        Args:
+            names (Sequence[str]): Fully qualified subdomains, in Security Trails order; a list is kept as is
+            categories (Dict[str, array], optional): Category -> array('I') of indexes into names
+        """
+        self.names: List[str] = names if isinstance(names, list) else list(names)
+        self.categories: Dict[str, array] = categories or {}
+
+    def share_names(self, other: 'SubdomainSet') -> None:
+        """Use other's string objects for the names both sets contain, e.g. when refreshing a cached map."""
+        known = {name: name for name in other.names}
+        self.names = [known.get(name, name) for name in self.names]
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def category(self, name: str) -> 'CategoryView':
+        return CategoryView(self.names, self.categories.get(name, array('I')))
+
+
+class CategoryView:
+    """Lazy sequence of the names in one category; nothing is copied until it is iterated."""
+
+    __slots__ = ('_names', '_indexes')
+
+    def __init__(self, names: List[str], indexes: array):
+        self._names = names
+        self._indexes = indexes
+
+    def __len__(self) -> int:
+        return len(self._indexes)
+
+    def __iter__(self) -> Iterator[str]:
+        names = self._names
+        return (names[i] for i in self._indexes)
+
+    def to_list(self) -> List[str]:
+        return list(self)
+
+
+class DNSMapResult:
+    """
+    One finished DNS map, as cached and returned by the app.
+
+    to_dict() (and as_tuple() for DNS_MAP.dns_map() callers) produce the
+    original shapes; iter_json() encodes the same dict without building it.
+    cached and trace belong to one response, so with_response() gives each
+    request its own shallow copy of the shared result.
+    """
+
+    __slots__ = ('domain', 'dns_providers', 'email_hosting', 'it_workload', 'subdomains',
+                 'security_trails_error', 'cached', 'trace')
+
+    def __init__(self, domain: str, dns_providers: List[str], email_hosting: List[str], it_workload: List[str],
+                 subdomains: SubdomainSet, security_trails_error: Optional[str] = None):
+        self.domain = domain
+        self.dns_providers = dns_providers
+        self.email_hosting = email_hosting
+        self.it_workload = it_workload
+        self.subdomains = subdomains
+        self.security_trails_error = security_trails_error
+        self.cached: Optional[bool] = None
+        self.trace: Optional[Dict[str, Any]] = None
+
+    def with_response(self, cached: bool, trace: Optional[Dict[str, Any]] = None) -> 'DNSMapResult':
+        result = copy.copy(self)
+        result.cached = cached
+        result.trace = trace or None
+        return result
+
+    def json_shape(self, lazy: bool = True) -> Dict[str, Any]:
+        """The response dict; with lazy, subdomain lists are views over the shared arrays."""
+        def category(name):
+            view = self.subdomains.category(name)
+            return view if lazy else view.to_list()
+
+        shape = {
+            'domain': self.domain,
+            'dns_providers': self.dns_providers,
+            'email_hosting': self.email_hosting,
+            'it_workload': self.it_workload,
+            'zero_trust': {name: category(name) for name in ZERO_TRUST_CATEGORIES},
+            'api_domains': category('api'),
+            'all_subdomains': self.subdomains.names if lazy else list(self.subdomains.names),
+            'security_trails_error': self.security_trails_error,
+            'success': True,
+        }
+        if self.cached is not None:
+            shape['cached'] = self.cached
+        if self.trace is not None:
+            shape['trace'] = self.trace
+        return shape
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Compatibility path: the plain dict the app returned before results were compacted."""
+        return self.json_shape(lazy=False)
+
+    def as_tuple(self) -> Tuple:
+        """The 10-tuple DNS_MAP.dns_map() has always returned."""
+        category = self.subdomains.category
+        return (self.dns_providers, self.email_hosting, self.it_workload,
+                category('secure').to_list(), category('access').to_list(), category('remote').to_list(),
+                category('api').to_list(), category('vpn').to_list(), list(self.subdomains.names),
+                self.security_trails_error)
+
+    def iter_json(self) -> Iterator[str]:
+        return iter_json(self)
+
+
+class _Buffer:
+    """Pieces of encoded text not yet handed out."""
+
+    __slots__ = ('pieces', 'size')
+
+    def __init__(self):
+        self.pieces: List[str] = []
+        self.size = 0
+
+    def add(self, text: str) -> bool:
+        """Buffer text; True when the buffer should be flushed."""
+        self.pieces.append(text)
+        self.size += len(text)
+        return self.size >= JSON_CHUNK_SIZE
+
+    def flush(self) -> str:
+        text = ''.join(self.pieces)
+        self.pieces.clear()
+        self.size = 0
+        return text
+
+
+def _encode(value: Any, buffer: _Buffer) -> Iterator[str]:
+    if hasattr(value, 'json_shape'):
+        value = value.json_shape()
+    if isinstance(value, dict):
+        buffer.add('{')
+        for i, (key, item) in enumerate(value.items()):
+            buffer.add(f"{',' if i else ''}{json.dumps(str(key))}:")
+            yield from _encode(item, buffer)
+        buffer.add('}')
+    elif isinstance(value, (list, tuple, CategoryView)):
+        buffer.add('[')
+        items = iter(value)
+        separator = ''
+        while True:
+            batch = list(islice(items, SEQUENCE_BATCH))
+            if not batch:
+                break
+            if all(isinstance(item, _SCALARS) for item in batch):
+                # Runs of names are encoded by the C encoder rather than item by item
+                if buffer.add(separator + json.dumps(batch)[1:-1]):
+                    yield buffer.flush()
+                separator = ','
+                continue
+            for item in batch:
+                buffer.add(separator)
+                separator = ','
+                yield from _encode(item, buffer)
+        buffer.add(']')
+    elif buffer.add(json.dumps(value)):
+        yield buffer.flush()
+
+
+def iter_json(value: Any) -> Iterator[str]:
+    """
+    Encode value as JSON in chunks of about JSON_CHUNK_SIZE characters, for streaming responses.
+
+    Understands dicts, lists/tuples, CategoryViews, objects with json_shape()
+    (DNSMapResult) and JSON scalars, so a map of any size is sent without
+    holding its full text in memory.
+    """
+    buffer = _Buffer()
+    yield from _encode(value, buffer)
+    if buffer.pieces:
+        yield buffer.flush()
@@ -0,0 +1,195 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+from collections import Counter
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+logger = logging.getLogger('DNS_MAP')
+
+# Cancelled timers are left in the heap; it is rebuilt once they outnumber the live ones
+COMPACT_MIN_CANCELLED = 1024
+
+
+class Timer:
+    """Handle of one scheduled callback; cancel() is O(1), the heap entry is dropped lazily."""
+
+    __slots__ = ('deadline', 'callback', 'kind', 'key', 'cancelled', 'fired')
+
+    def __init__(self, deadline: float, callback: Callable[[], Any], kind: str, key: Optional[Hashable]):
+        self.deadline = deadline
+        self.callback = callback
+        self.kind = kind
+        self.key = key
+        self.cancelled = False
+        self.fired = False
+
+    @property
+    def done(self) -> bool:
+        """Fired or cancelled: no longer pending, so cancelling it again does nothing."""
+        return self.cancelled or self.fired
+
+
+class ExpiryScheduler:
+    """
+    One thread running every deferred expiration of the process from a heap.
+
+    Stores schedule a callback at an entry's deadline instead of sweeping or
+    starting a timer thread per entry. Scheduling and cancelling are O(log n)
+    and O(1). A key names "the" timer of an entry: scheduling the same key
+    again keeps the earlier deadline, so stores whose deadlines only move
+    later (progress updates, cooldowns) re-check in their callback and
+    reschedule rather than churning the heap on every write. Callbacks run on
+    the scheduler thread and must be short.
+    """
+
+    def __init__(self, name: str = 'expiry-scheduler'):
+        self.name = name
+        self._heap: List[Tuple[float, int, Timer]] = []
+        self._keyed: Dict[Tuple[str, Hashable], Timer] = {}
+        self._pending: Counter = Counter()
+        self._sequence = itertools.count()
+        self._cancelled = 0
+        self._condition = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._shutdown = False
+        self.fired = 0
+
+    def call_at(self, deadline: float, callback: Callable[[], Any], kind: str = 'other',
+                key: Optional[Hashable] = None) -> Optional[Timer]:
+        """
+        Run callback at time.time() >= deadline.
+
+        Args:
+            deadline (float): Wall clock time (time.time()) to run at
+            callback (Callable): Called without arguments on the scheduler thread
+            kind (str): Label the timer is counted under in stats()
+            key (Hashable, optional): Entry the timer belongs to, unique within kind. An
+                earlier pending timer of the same key is kept; a later one is replaced.
+
+        Returns:
+            Optional[Timer]: The pending timer, or None once the scheduler is shut down
+        """
+        with self._condition:
+            if self._shutdown:
+                return None
+            if key is not None:
+                existing = self._keyed.get((kind, key))
+                if existing is not None:
+                    if existing.deadline <= deadline:
+                        return existing
+                    self._cancel_locked(existing)
+            timer = Timer(deadline, callback, kind, key)
+            if key is not None:
+                self._keyed[(kind, key)] = timer
+            heapq.heappush(self._heap, (deadline, next(self._sequence), timer))
+            self._pending[kind] += 1
+            self._start()
+            # Only a new earliest deadline changes how long the thread sleeps
+            if self._heap[0][2] is timer:
+                self._condition.notify()
+            return timer
+
+    def call_later(self, delay: float, callback: Callable[[], Any], kind: str = 'other',
+                   key: Optional[Hashable] = None) -> Optional[Timer]:
+        return self.call_at(time.time() + delay, callback, kind, key)
+
+    def cancel(self, timer: Optional[Timer]) -> None:
+        """Cancel timer; a no-op for None and for timers that already fired or were cancelled."""
+        if timer is None:
+            return
+        with self._condition:
+            self._cancel_locked(timer)
+
+    def cancel_key(self, kind: str, key: Hashable) -> None:
+        with self._condition:
+            timer = self._keyed.get((kind, key))
+            if timer is not None:
+                self._cancel_locked(timer)
+
+    def pending(self, kind: Optional[str] = None) -> int:
+        """Timers waiting to fire, of one kind or in total."""
+        with self._condition:
+            return self._pending[kind] if kind is not None else sum(self._pending.values())
+
+    def stats(self) -> Dict[str, Any]:
+        with self._condition:
+            return {
+                'pending': {kind: count for kind, count in self._pending.items() if count},
+                'heap_size': len(self._heap),
+                'fired': self.fired,
+                'running': self._thread is not None and self._thread.is_alive(),
+            }
+
+    def shutdown(self, timeout: Optional[float] = None) -> None:
+        """Drop every pending timer and stop the thread; later call_at() calls are ignored."""
+        with self._condition:
+            self._shutdown = True
+            for _, _, timer in self._heap:
+                timer.cancelled = True
+            self._heap.clear()
+            self._keyed.clear()
+            self._pending.clear()
+            self._condition.notify()
+            thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout)
+
+    def _cancel_locked(self, timer: Timer) -> None:
+        if timer.done:
+            return
+        timer.cancelled = True
+        self._forget(timer)
+        self._cancelled += 1
+        if self._cancelled >= COMPACT_MIN_CANCELLED and self._cancelled * 2 > len(self._heap):
+            self._heap = [entry for entry in self._heap if not entry[2].cancelled]
+            heapq.heapify(self._heap)
+            self._cancelled = 0
+
+    def _forget(self, timer: Timer) -> None:
+        self._pending[timer.kind] -= 1
+        if timer.key is not None and self._keyed.get((timer.kind, timer.key)) is timer:
+            del self._keyed[(timer.kind, timer.key)]
+
+    def _start(self) -> None:
+        # Started lazily so gunicorn's pre-fork import doesn't leave a dead thread behind
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+
+    def _next_due(self) -> Optional[Timer]:
+        with self._condition:
+            while not self._shutdown:
+                if not self._heap:
+                    self._condition.wait()
+                    continue
+                deadline, _, timer = self._heap[0]
+                if timer.cancelled:
+                    heapq.heappop(self._heap)
+                    self._cancelled -= 1
+                    continue
+                delay = deadline - time.time()
+                if delay > 0:
+                    self._condition.wait(delay)
+                    continue
+                heapq.heappop(self._heap)
+                timer.fired = True
+                self._forget(timer)
+                self.fired += 1
+                return timer
+            return None
+
+    def _run(self) -> None:
+        while True:
+            timer = self._next_due()
+            if timer is None:
+                return
+            try:
+                timer.callback()
+            except Exception as e:
+                logger.error(f"Scheduled {timer.kind} expiration failed: {str(e)}")
+
+
+# Shared by the progress store, result cache, API key pool and job queue
+SCHEDULER = ExpiryScheduler()
@@ -0,0 +1,273 @@
+import codecs
+import json
+import logging
+import os
+import re
+import threading
+import time
+from functools import partial
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from scheduler import SCHEDULER, ExpiryScheduler
+
+logger = logging.getLogger('DNS_MAP')
+
+# API root; overridable to point the app at a stand-in (e.g. the load-test harness)
+SECURITY_TRAILS_BASE_URL = os.environ.get('SECURITY_TRAILS_BASE_URL', "https://api.securitytrails.com/v1")
+
+# (connect, read) timeouts; the read timeout applies between chunks, not to the whole body
+DEFAULT_TIMEOUT = (5, 30)
+
+# How long a key is skipped after the API rejects it; 429s prefer the Retry-After header
+KEY_COOLDOWNS = {401: 3600, 403: 3600, 429: 60}
+
+# Subdomains handed to the caller per page while the response is still downloading
+DEFAULT_PAGE_SIZE = 500
+
+
+class SecurityTrailsError(Exception):
+    """Raised when no API key produced a subdomain list."""
+
+
+class SecurityTrailsTruncated(SecurityTrailsError):
+    """Raised when a response broke off after some pages were already yielded."""
+
+
+class APIKeyPool:
+    """
+    Process-wide record of API keys the API recently rejected.
+
+    A key answered with 401/429 is cooling down until its deadline passes, so
+    later requests skip it instead of paying another failed round-trip. The
+    scheduler forgets the key once its cooldown is over.
+    """
+
+    def __init__(self, scheduler: ExpiryScheduler = SCHEDULER):
+        self.scheduler = scheduler
+        self._cooling: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def available(self, keys: Sequence[str]) -> List[str]:
+        """Return the keys that are not cooling down, in preference order."""
+        now = time.time()
+        with self._lock:
+            return [key for key in keys if self._cooling.get(key, 0) <= now]
+
+    def cool_down(self, key: str, seconds: float) -> None:
+        deadline = time.time() + seconds
+        with self._lock:
+            self._cooling[key] = deadline
+        self.scheduler.call_at(deadline, partial(self._cooled, key), 'api_key_cooldown', (id(self), key))
+
+    def release(self, key: str) -> None:
+        """Mark a key as good again after a successful request."""
+        with self._lock:
+            self._cooling.pop(key, None)
+        self.scheduler.cancel_key('api_key_cooldown', (id(self), key))
+
+    def _cooled(self, key: str) -> None:
+        with self._lock:
+            deadline = self._cooling.get(key)
+            if deadline is None:
+                return
+            if deadline <= time.time():
+                del self._cooling[key]
+                return
+        # Cooled down again after this timer was set
+        self.scheduler.call_at(deadline, partial(self._cooled, key), 'api_key_cooldown', (id(self), key))
+
+
+class SubdomainStreamParser:
+    """
+    Incrementally pull the "subdomains" array out of a Security Trails response body.
+
+    feed() returns the names completed by each chunk, so callers can start
+    resolving before the body has finished downloading. Bodies without the
+    array (e.g. error payloads) are parsed in full on close().
+    """
+
+    _ARRAY_START = re.compile(r'"subdomains"\s*:\s*\[')
+    _SEPARATOR = re.compile(r'[\s,]*')
+
+    def __init__(self):
+        self._decoder = codecs.getincrementaldecoder('utf-8')()
+        self._json = json.JSONDecoder()
+        self._buffer = ''
+        self._in_array = False
+        self.done = False
+        self.count = 0
+
+    def feed(self, chunk: bytes) -> List[str]:
+        self._buffer += self._decoder.decode(chunk)
+        if not self._in_array:
+            match = self._ARRAY_START.search(self._buffer)
+            if match is None:
+                return []
+            self._buffer = self._buffer[match.end():]
+            self._in_array = True
+        return self._drain()
+
+    def _drain(self) -> List[str]:
+        names = []
+        buffer = self._buffer
+        position = 0
+        while not self.done:
+            position = self._SEPARATOR.match(buffer, position).end()
+            if position >= len(buffer):
+                break
+            if buffer[position] == ']':
+                self.done = True
+                break
+            try:
+                value, end = self._json.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                # Element split across chunks; wait for the rest
+                break
+            if isinstance(value, str):
+                names.append(value)
+            position = end
+        self._buffer = buffer[position:]
+        self.count += len(names)
+        return names
+
+    def close(self) -> List[str]:
+        """
+        Finish parsing.
+
+        Returns:
+            List[str]: Names still pending, or the whole list for bodies that were not streamed
+
+        Raises:
+            ValueError: When the body ended inside the subdomains array
+        """
+        self._buffer += self._decoder.decode(b'', final=True)
+        if not self._in_array:
+            subdomains = json.loads(self._buffer).get('subdomains', [])
+            self.count = len(subdomains)
+            self.done = True
+            return subdomains
+        names = self._drain()
+        if not self.done:
+            raise ValueError(f"Response ended after {self.count} subdomains")
+        return names
+
+
+class SecurityTrailsClient:
+    """
+    Subdomain lookups over a pooled HTTP session with key failover.
+
+    Keys are tried in order, skipping those cooling down after a 401/429.
+    Every request has connect/read timeouts, so a hanging key costs one
+    timeout instead of blocking the mapping. Results are streamed page by page.
+    """
+
+    def __init__(self, api_keys: Sequence[str], base_url: str = SECURITY_TRAILS_BASE_URL,
+                 timeout: Tuple[float, float] = DEFAULT_TIMEOUT, page_size: int = DEFAULT_PAGE_SIZE,
+                 key_pool: Optional[APIKeyPool] = None, session: Optional[requests.Session] = None):
+        """
+        Initialize the client.
+
+        Args:
+            api_keys (Sequence[str]): API keys in preference order
+            base_url (str): API root, overridable for tests and benchmarks
+            timeout (Tuple[float, float]): (connect, read) timeouts in seconds
+            page_size (int): Subdomains per yielded page
+            key_pool (APIKeyPool, optional): Cooldown state (default: process-wide API_KEY_POOL)
+            session (requests.Session, optional): HTTP session (default: process-wide pooled session)
+        """
+        self.api_keys = list(api_keys)
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.page_size = page_size
+        self.key_pool = key_pool or API_KEY_POOL
+        self.session = session or SESSION
+
+    def iter_subdomains(self, apex_domain: str) -> Iterator[List[str]]:
+        """
+        Yield pages of subdomain labels (without the apex) for apex_domain.
+
+        Raises:
+            SecurityTrailsError: When every usable key failed before any page was yielded
+            SecurityTrailsTruncated: When the response broke off midway; pages already yielded stay valid
+        """
+        keys = self.key_pool.available(self.api_keys)
+        if len(keys) < len(self.api_keys):
+            logger.info(f"Skipping {len(self.api_keys) - len(keys)} Security Trails API key(s) cooling down")
+
+        url = f"{self.base_url}/domain/{apex_domain}/subdomains"
+        for api_key in keys:
+            position = self.api_keys.index(api_key) + 1
+            try:
+                logger.info(f"Trying Security Trails API key {position}/{len(self.api_keys)}")
+                response = self.session.get(url, params={'children_only': 'false'},
+                                            headers={"accept": "application/json", "apikey": api_key},
+                                            timeout=self.timeout, stream=True)
+            except requests.RequestException as e:
+                logger.warning(f"Error with API key {position}: {str(e)}")
+                continue
+
+            with response:
+                if response.status_code == 200:
+                    self.key_pool.release(api_key)
+                    yielded = 0
+                    try:
+                        for page in self._stream_pages(response, apex_domain):
+                            yielded += len(page)
+                            yield page
+                        return
+                    except (requests.RequestException, ValueError) as e:
+                        # Another key can only be tried if nothing has been handed out yet
+                        if yielded:
+                            raise SecurityTrailsTruncated(
+                                f"Security Trails response was cut off after {yielded} subdomains: {str(e)}")
+                        logger.warning(f"Error with API key {position}: {str(e)}")
+                        continue
+
+                cooldown = KEY_COOLDOWNS.get(response.status_code)
+                if cooldown is not None:
+                    retry_after = response.headers.get('Retry-After', '')
+                    if response.status_code == 429 and retry_after.isdigit():
+                        cooldown = int(retry_after)
+                    self.key_pool.cool_down(api_key, cooldown)
+                    logger.warning(f"API key {position} returned {response.status_code}, "
+                                   f"cooling down for {cooldown}s and trying next key if available")
+                else:
+                    logger.warning(f"API key {position} returned status code {response.status_code}: "
+                                   f"{response.text[:200]}")
+
+        raise SecurityTrailsError("All Security Trails API keys failed. Please check your API keys and try again.")
+
+    def _stream_pages(self, response: requests.Response, apex_domain: str) -> Iterator[List[str]]:
+        """Yield page_size batches as the body arrives; a partial batch is flushed before errors propagate."""
+        parser = SubdomainStreamParser()
+        page: List[str] = []
+        try:
+            for chunk in response.iter_content(chunk_size=16 * 1024):
+                page.extend(parser.feed(chunk))
+                while len(page) >= self.page_size:
+                    yield page[:self.page_size]
+                    page = page[self.page_size:]
+            page.extend(parser.close())
+        except (requests.RequestException, ValueError):
+            if page:
+                yield page
+            raise
+        if page:
+            yield page
+        logger.info(f"Found {parser.count} subdomains for {apex_domain}")
+
+
+def _pooled_session() -> requests.Session:
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=32)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+# Shared by every DNS_MAP in the process: keeps TLS connections and key cooldowns warm
+API_KEY_POOL = APIKeyPool()
+SESSION = _pooled_session()
@@ -0,0 +1,146 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger('DNS_MAP')
+
+# Under the container's working directory, not wherever the app happens to be started from
+DEFAULT_INVENTORY_PATH = os.environ.get('SUBDOMAIN_INVENTORY_PATH', '/app/data/subdomain_inventory.db')
+
+# A stored subdomain list is reused for a day before Security Trails is asked again
+DEFAULT_LIST_MAX_AGE = 24 * 3600
+# Stored address answers younger than this are reused instead of re-resolved
+DEFAULT_RESOLUTION_MAX_AGE = 6 * 3600
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS listings (apex TEXT PRIMARY KEY, listed_at REAL NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS subdomains ("
+    " apex TEXT NOT NULL, name TEXT NOT NULL, first_seen REAL NOT NULL, last_seen REAL NOT NULL,"
+    " ip TEXT, output TEXT, resolved_at REAL, PRIMARY KEY (apex, name))",
+)
+
+
+class SubdomainInventory:
+    """
+    SQLite store of each apex domain's subdomains and their latest address answers.
+
+    Keeps first/last-seen timestamps per subdomain, when the list was last
+    fetched, and when each name was last resolved, so a repeat map only
+    downloads the list and re-resolves names once they are older than the
+    caller's limits. Each thread gets its own connection; WAL mode lets
+    concurrent runs read while one writes.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        connection = self._connection()
+        for statement in _SCHEMA:
+            connection.execute(statement)
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def listing(self, apex: str, max_age: float) -> Optional[List[str]]:
+        """
+        Return the stored subdomain list of apex if it was fetched within max_age seconds.
+
+        Returns:
+            Optional[List[str]]: Subdomains seen in the latest listing, or None when missing or stale
+        """
+        connection = self._connection()
+        row = connection.execute("SELECT listed_at FROM listings WHERE apex = ?", (apex,)).fetchone()
+        if row is None or row[0] < time.time() - max_age:
+            return None
+        # Names that dropped out of the latest listing keep their row but an older last_seen
+        return [name for (name,) in connection.execute(
+            "SELECT name FROM subdomains WHERE apex = ? AND last_seen >= ? ORDER BY name", (apex, row[0]))]
+
+    def record_listing(self, apex: str, names: Iterable[str]) -> None:
+        """Store a freshly downloaded subdomain list, updating first/last-seen timestamps."""
+        now = time.time()
+        connection = self._connection()
+        with connection:
+            connection.execute("BEGIN")
+            connection.executemany(
+                "INSERT INTO subdomains (apex, name, first_seen, last_seen) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(apex, name) DO UPDATE SET last_seen = excluded.last_seen",
+                ((apex, name, now, now) for name in names),
+            )
+            connection.execute(
+                "INSERT INTO listings (apex, listed_at) VALUES (?, ?) "
+                "ON CONFLICT(apex) DO UPDATE SET listed_at = excluded.listed_at", (apex, now))
+
+    def resolutions(self, apex: str, max_age: float) -> Dict[str, Tuple[List[str], str]]:
+        """
+        Return stored answers of apex's subdomains resolved within max_age seconds.
+
+        Returns:
+            Dict[str, Tuple]: subdomain -> (addresses, resolution output)
+        """
+        # Addresses are kept space-separated in the ip column
+        return {name: ((ip or '').split(), output) for name, ip, output in self._connection().execute(
+            "SELECT name, ip, output FROM subdomains WHERE apex = ? AND resolved_at >= ?",
+            (apex, time.time() - max_age))}
+
+    def record_resolutions(self, apex: str, results: Iterable[Tuple[str, List[str], str]]) -> None:
+        """Store (subdomain, addresses, output) answers; names not seen before are added as well."""
+        now = time.time()
+        connection = self._connection()
+        with connection:
+            connection.execute("BEGIN")
+            connection.executemany(
+                "INSERT INTO subdomains (apex, name, first_seen, last_seen, ip, output, resolved_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(apex, name) DO UPDATE SET ip = excluded.ip, output = excluded.output, "
+                "resolved_at = excluded.resolved_at",
+                ((apex, name, now, now, ' '.join(addresses) or None, output, now) for name, addresses, output in results),
+            )
+
+    def stats(self) -> Dict[str, int]:
+        connection = self._connection()
+        return {
+            'domains': connection.execute("SELECT COUNT(*) FROM listings").fetchone()[0],
+            'subdomains': connection.execute("SELECT COUNT(*) FROM subdomains").fetchone()[0],
+        }
+
+
+def open_inventory(path: str) -> Optional[SubdomainInventory]:
+    """Open the inventory at path; returns None (inventory disabled) when it cannot be opened."""
+    if not path:
+        return None
+    try:
+        return SubdomainInventory(path)
+    except Exception as e:
+        logger.warning(f"Subdomain inventory at {path} unavailable: {str(e)}")
+        return None
+
+
+_inventories: Dict[str, Optional[SubdomainInventory]] = {}
+_inventories_lock = threading.Lock()
+
+
+def load_subdomain_inventory(path: str = DEFAULT_INVENTORY_PATH) -> Optional[SubdomainInventory]:
+    """
+    Open the inventory at path on first use, once per process, and share it between DNS_MAP instances.
+
+    Nothing is created until a map needs it, so importing the app doesn't
+    write a database. SUBDOMAIN_INVENTORY_PATH= (empty) disables it.
+
+    Returns:
+        Optional[SubdomainInventory]: The inventory, or None when disabled or unavailable
+    """
+    with _inventories_lock:
+        if path not in _inventories:
+            _inventories[path] = open_inventory(path)
+        return _inventories[path]
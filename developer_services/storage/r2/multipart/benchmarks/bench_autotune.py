@@ -0,0 +1,72 @@
+"""
+Fixed part size and concurrency vs. the autotuner, against a throttling stub Worker.
+
+Prints the part sizes choose_part_size() picks for a range of file sizes,
+then uploads a --size-mb file twice through the stub Worker, which shares a
+--link-mb MB/s link between parts, adds --latency seconds to every part and
+answers 429 to part uploads beyond --server-limit at once (0: no limit):
+
+  fixed     -- 5MiB parts, 25 in flight (the previous defaults)
+  autotune  -- choose_part_size() and a ConcurrencyTuner up to --max-concurrency
+
+    python benchmarks/bench_autotune.py --size-mb 1000 --link-mb 100 --latency 0.1 --server-limit 8
+"""
+import argparse
+import os
+import sys
+import tempfile
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARKS_DIR, '..'))
+
+import requests  # noqa: E402
+
+from r2_multipart import AUTOTUNE_MAX_CONCURRENCY, MultipartUploader, choose_part_size, partsize  # noqa: E402
+from stub_r2_worker import StubR2Worker  # noqa: E402
+
+GB = 1024 ** 3
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size-mb', type=int, default=1000, help='size of the uploaded file in MB')
+    parser.add_argument('--link-mb', type=float, default=100, help='simulated link bandwidth in MB/s')
+    parser.add_argument('--latency', type=float, default=0.1, help='seconds added to every part upload')
+    parser.add_argument('--server-limit', type=int, default=8, help='part uploads the stub accepts at once')
+    parser.add_argument('--max-concurrency', type=int, default=AUTOTUNE_MAX_CONCURRENCY,
+                        help='ceiling for the autotuner')
+    args = parser.parse_args()
+
+    print(f"{'file':>8}{'part size':>11}{'parts':>7}   (5MiB parts)")
+    for size in (1 * GB, 10 * GB, 50 * GB, 100 * GB, 500 * GB):
+        chosen = choose_part_size(size)
+        print(f"{size // GB:>6}GB{chosen // 1024 ** 2:>8}MiB{-(-size // chosen):>7}   ({-(-size // partsize)})")
+    print()
+
+    with tempfile.TemporaryDirectory() as workdir, \
+            StubR2Worker(bandwidth=args.link_mb * 1024 * 1024, latency=args.latency,
+                         max_in_flight=args.server_limit) as stub:
+        filename = os.path.join(workdir, 'upload.bin')
+        with open(filename, 'wb') as file:
+            file.write(os.urandom(args.size_mb * 1024 * 1024))
+
+        print(f"{args.size_mb} MB over a {args.link_mb:g} MB/s link, {args.latency * 1000:.0f}ms per part, "
+              f"server limit {args.server_limit or 'none'}")
+        print(f"{'mode':<10}{'part MiB':>9}{'parts':>7}{'final':>7}{'peak':>6}{'429s':>6}{'MB/s':>8}  result")
+        for label, options, size in (('fixed', {'concurrency': 25}, partsize),
+                                     ('autotune', {'concurrency': args.max_concurrency, 'autotune': True}, None)):
+            rejected = stub.rejected
+            with MultipartUploader(stub.endpoint, **options) as uploader:
+                try:
+                    response = uploader.upload_file(filename, size)
+                    result = 'completed' if response.status_code == 200 else response.text
+                except requests.RequestException as e:
+                    result = f"failed: {type(e).__name__}"
+                stats = uploader.stats()
+            print(f"{label:<10}{(stats['partsize'] or 0) // 1024 ** 2:>9}{stats['parts']:>7}"
+                  f"{stats['concurrency']:>7}{stats['peak_concurrency']:>6}{stub.rejected - rejected:>6}"
+                  f"{stats['mb_per_second']:>8.1f}  {result}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""
+Connections and per-part latency: a Session per part vs. one pooled MultipartUploader.
+
+Starts the stub Worker over HTTPS (a TLS handshake per new connection, as
+with the real Worker endpoint) and uploads a --size-mb file twice:
+
+  per-part  -- the previous flow: module-level requests.post for create and
+               complete, and a new Session and HTTPAdapter for every part
+  pooled    -- MultipartUploader, one pool of --threads kept-alive connections
+
+and prints the connections the stub accepted, the uploader's own handshake
+count, part latency p50/p95 and throughput.
+
+    python benchmarks/bench_connection_reuse.py --size-mb 500 --threads 25
+"""
+import argparse
+import concurrent.futures
+import math
+import os
+import sys
+import tempfile
+import threading
+import time
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARKS_DIR, '..'))
+
+import requests  # noqa: E402
+from requests.adapters import HTTPAdapter, Retry  # noqa: E402
+
+from r2_multipart import MappedFile, MultipartUploader, partsize  # noqa: E402
+from stub_r2_worker import StubR2Worker  # noqa: E402
+
+
+def percentile(samples, share):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * share))] if samples else 0.0
+
+
+def upload_per_part_sessions(endpoint, filename, threads):
+    """The flow before MultipartUploader; returns the part latencies."""
+    url = f"{endpoint}{os.path.basename(filename)}"
+    latencies = []
+    lock = threading.Lock()
+
+    def upload_part(source, uploadId, index):
+        s = requests.Session()
+        retries = Retry(total=3, status_forcelist=[400, 500, 502, 503, 504])
+        s.mount("https://", HTTPAdapter(max_retries=retries))
+        with source.part(index, partsize) as part:
+            started = time.perf_counter()
+            response = s.put(url, params={"action": "mpu-uploadpart", "uploadId": uploadId,
+                                          "partNumber": str(index + 1)}, data=part)
+            with lock:
+                latencies.append(time.perf_counter() - started)
+        return response.json()
+
+    uploadId = requests.post(url, params={"action": "mpu-create"}).json()["uploadId"]
+    with MappedFile(filename) as source, concurrent.futures.ThreadPoolExecutor(threads) as executor:
+        futures = [executor.submit(upload_part, source, uploadId, index)
+                   for index in range(math.ceil(source.size / partsize))]
+        parts = [future.result() for future in futures]
+    response = requests.post(url, params={"action": "mpu-complete", "uploadId": uploadId}, json={"parts": parts})
+    assert response.status_code == 200, response.text
+    return latencies, None
+
+
+def upload_pooled(endpoint, filename, threads):
+    with MultipartUploader(endpoint, threads) as uploader:
+        response = uploader.upload_file(filename, partsize)
+        assert response.status_code == 200, response.text
+        return uploader.part_latencies, uploader.stats()['handshakes']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size-mb', type=int, default=500, help='size of the uploaded file in MB')
+    parser.add_argument('--threads', type=int, default=25, help='concurrent part uploads')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir, StubR2Worker(tls=True) as stub:
+        os.environ['REQUESTS_CA_BUNDLE'] = stub.cafile
+        filename = os.path.join(workdir, 'upload.bin')
+        with open(filename, 'wb') as file:
+            file.write(os.urandom(args.size_mb * 1024 * 1024))
+
+        print(f"{args.size_mb} MB file, {math.ceil(args.size_mb * 1024 * 1024 / partsize)} parts, "
+              f"{args.threads} threads, HTTPS")
+        print(f"{'flow':<10}{'accepted':>10}{'handshakes':>12}{'p50 ms':>9}{'p95 ms':>9}{'seconds':>9}{'MB/s':>8}")
+        for label, upload in (('per-part', upload_per_part_sessions), ('pooled', upload_pooled)):
+            accepted = stub.connections
+            started = time.perf_counter()
+            latencies, handshakes = upload(stub.endpoint, filename, args.threads)
+            elapsed = time.perf_counter() - started
+            print(f"{label:<10}{stub.connections - accepted:>10}{'-' if handshakes is None else handshakes:>12}"
+                  f"{percentile(latencies, 0.5) * 1000:>9.1f}{percentile(latencies, 0.95) * 1000:>9.1f}"
+                  f"{elapsed:>9.2f}{args.size_mb / elapsed:>8.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+"""
+Peak RSS and throughput of part uploads: a read() copy per part vs. MappedFile slices.
+
+Writes a --size-gb test file, starts the stub Worker and uploads the file once
+per mode, each in its own process so peak RSS (ru_maxrss) is that mode's alone:
+
+  read  -- the previous upload_part: open, seek and read() every part into bytes
+  mmap  -- MultipartUploader.upload_part sending memoryview slices of one mapping
+
+Peak anonymous and file-backed RSS are sampled separately: read() copies are
+anonymous memory, while mapped parts in flight are page cache the kernel can
+reclaim, dropped from the process once each part is sent.
+
+    python benchmarks/bench_part_reader.py --size-gb 2 --threads 25
+"""
+import argparse
+import concurrent.futures
+import math
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARKS_DIR, '..'))
+
+import requests  # noqa: E402
+
+from r2_multipart import MappedFile, MultipartUploader, partsize  # noqa: E402
+from stub_r2_worker import StubR2Worker  # noqa: E402
+
+BLOCK = 64 * 1024 * 1024
+
+
+def read_part(filename, partsize, url, uploadId, index):
+    """upload_part as it was: a fresh bytes copy of every part."""
+    with open(filename, "rb") as file:
+        file.seek(partsize * index)
+        part = file.read(partsize)
+    return requests.Session().put(url, params={"action": "mpu-uploadpart", "uploadId": uploadId,
+                                               "partNumber": str(index + 1)}, data=part).json()
+
+
+def memory_mb():
+    """Current anonymous (heap) and file-backed (mapped page cache) resident memory."""
+    usage = {}
+    with open('/proc/self/status') as status:
+        for line in status:
+            if line.startswith(('RssAnon:', 'RssFile:')):
+                name, kb, _ = line.split()
+                usage[name[:-1]] = int(kb) / 1024
+    return usage['RssAnon'], usage['RssFile']
+
+
+def worker(mode, endpoint, filename, threads):
+    url = f"{endpoint}{os.path.basename(filename)}"
+    peaks = [0.0, 0.0]
+    done = threading.Event()
+
+    def sample():
+        while not done.wait(0.01):
+            peaks[:] = map(max, peaks, memory_mb())
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    started = time.perf_counter()
+    upload_id = requests.post(url, params={"action": "mpu-create"}).json()["uploadId"]
+    with MappedFile(filename) as source, MultipartUploader(endpoint, threads) as uploader, \
+            concurrent.futures.ThreadPoolExecutor(threads) as executor:
+        part_count = math.ceil(source.size / partsize)
+        if mode == 'read':
+            futures = [executor.submit(read_part, filename, partsize, url, upload_id, index)
+                       for index in range(part_count)]
+        else:
+            futures = [executor.submit(uploader.upload_part, source, partsize, url, upload_id, index)
+                       for index in range(part_count)]
+        parts = [future.result() for future in futures]
+    response = requests.post(url, params={"action": "mpu-complete", "uploadId": upload_id}, json={"parts": parts})
+    elapsed = time.perf_counter() - started
+    done.set()
+    sampler.join()
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"{mode} {response.status_code} {elapsed:.3f} {peak_mb:.1f} {peaks[0]:.1f} {peaks[1]:.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size-gb', type=float, default=2.0, help='size of the uploaded file in GB')
+    parser.add_argument('--threads', type=int, default=25, help='concurrent part uploads')
+    parser.add_argument('--worker', nargs=3, metavar=('MODE', 'ENDPOINT', 'FILE'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.worker:
+        worker(*args.worker, args.threads)
+        return
+
+    size = int(args.size_gb * 1024 ** 3)
+    with tempfile.TemporaryDirectory() as workdir, StubR2Worker() as stub:
+        filename = os.path.join(workdir, 'upload.bin')
+        block = os.urandom(BLOCK)
+        with open(filename, 'wb') as file:
+            for offset in range(0, size, BLOCK):
+                file.write(block[:size - offset])
+
+        print(f"{size / 1024 ** 2:.0f} MB file, {math.ceil(size / partsize)} parts of "
+              f"{partsize // 1024 ** 2} MB, {args.threads} threads")
+        print(f"{'mode':<6}{'status':>8}{'seconds':>10}{'MB/s':>9}{'peak RSS MB':>13}{'anon MB':>10}{'file MB':>10}")
+        for mode in ('read', 'mmap'):
+            output = subprocess.run([sys.executable, os.path.abspath(__file__), '--threads', str(args.threads),
+                                     '--worker', mode, stub.endpoint, filename],
+                                    check=True, capture_output=True, text=True).stdout
+            _, status, elapsed, peak, anon, mapped = output.split()
+            print(f"{mode:<6}{status:>8}{float(elapsed):>10.2f}{size / 1024 ** 2 / float(elapsed):>9.1f}"
+                  f"{float(peak):>13.1f}{float(anon):>10.1f}{float(mapped):>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
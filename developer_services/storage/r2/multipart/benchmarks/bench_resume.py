@@ -0,0 +1,93 @@
+"""
+Resuming an interrupted upload from its PartManifest vs. starting over.
+
+Uploads a --size-mb file with resume=True in a child process against the stub
+Worker, throttled to a --link-mb MB/s link, and SIGKILLs it once --kill-at of
+the parts have arrived. It then rewrites the first part of the file (which
+the killed run uploaded) and resumes, reporting how many parts each run sent
+and how long the resume took next to a full upload. The completed upload is
+checked against the file's current contents.
+
+    python benchmarks/bench_resume.py --size-mb 500 --link-mb 50 --kill-at 0.9
+"""
+import argparse
+import hashlib
+import math
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARKS_DIR, '..'))
+
+from r2_multipart import MultipartUploader, PartManifest, partsize  # noqa: E402
+from stub_r2_worker import StubR2Worker  # noqa: E402
+
+
+def upload(endpoint, filename, resume):
+    with MultipartUploader(endpoint) as uploader:
+        started = time.perf_counter()
+        response = uploader.upload_file(filename, partsize, resume=resume)
+        return response, time.perf_counter() - started, uploader.stats()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size-mb', type=int, default=500, help='size of the uploaded file in MB')
+    parser.add_argument('--link-mb', type=float, default=50, help='simulated link bandwidth in MB/s (0: unlimited)')
+    parser.add_argument('--kill-at', type=float, default=0.9, help='share of parts uploaded before the kill')
+    parser.add_argument('--worker', nargs=2, metavar=('ENDPOINT', 'FILE'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.worker:
+        upload(*args.worker, resume=True)
+        return
+
+    part_count = math.ceil(args.size_mb * 1024 * 1024 / partsize)
+    with tempfile.TemporaryDirectory() as workdir, StubR2Worker(bandwidth=args.link_mb * 1024 * 1024) as stub:
+        filename = os.path.join(workdir, 'upload.bin')
+        with open(filename, 'wb') as file:
+            file.write(os.urandom(args.size_mb * 1024 * 1024))
+
+        response, full_seconds, _ = upload(stub.endpoint, filename, resume=False)
+        assert response.status_code == 200, response.text
+        print(f"{args.size_mb} MB in {part_count} parts: full upload {full_seconds:.2f}s")
+
+        sent = stub.requests['mpu-uploadpart']
+        child = subprocess.Popen([sys.executable, os.path.abspath(__file__), '--worker', stub.endpoint, filename],
+                                 stdout=subprocess.DEVNULL)
+        while stub.requests['mpu-uploadpart'] - sent < part_count * args.kill_at and child.poll() is None:
+            time.sleep(0.01)
+        child.send_signal(signal.SIGKILL)
+        child.wait()
+        # Let the stub finish with the parts that were cut off
+        time.sleep(1)
+        killed_parts = stub.requests['mpu-uploadpart'] - sent
+        manifest = PartManifest(filename)
+        manifest.load(f"{stub.endpoint}{filename}", partsize)
+        manifest.close()
+        print(f"killed run: {killed_parts} parts sent, {len(manifest.parts)} checkpointed")
+
+        with open(filename, 'r+b') as file:
+            file.write(os.urandom(1024))
+
+        sent = stub.requests['mpu-uploadpart']
+        response, resume_seconds, stats = upload(stub.endpoint, filename, resume=True)
+        assert response.status_code == 200, response.text
+        print(f"resumed run: {stub.requests['mpu-uploadpart'] - sent} parts sent, {stats['parts_skipped']} "
+              f"skipped, {resume_seconds:.2f}s ({resume_seconds / full_seconds:.0%} of a full upload)")
+
+        parts = stub.completed[manifest.uploadId]
+        with open(filename, 'rb') as file:
+            data = file.read()
+        assert [part['partNumber'] for part in parts] == list(range(1, part_count + 1))
+        assert all(part['etag'] == hashlib.md5(data[(part['partNumber'] - 1) * partsize:
+                                                     part['partNumber'] * partsize]).hexdigest() for part in parts)
+        assert not os.path.exists(manifest.path)
+        print('completed parts match the file; manifest removed')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+"""
+Peak memory of streaming uploads from a pipe with MultipartUploader.upload_stream.
+
+For each --sizes-mb stream, a generator process writes deterministic data to a
+pipe read by an uploader process, which streams it from stdin to the stub
+Worker (throttled to a --link-mb MB/s link, so parts back up behind it) with
+--threads parts of --part-mb in flight. Peak anonymous RSS and
+ru_maxrss are reported per stream size next to the threads x part size bound:
+memory should stay flat as the stream grows. Completed parts are checked
+against the regenerated stream.
+
+    python benchmarks/bench_stream.py --sizes-mb 200 1000 --threads 8 --part-mb 5 --link-mb 50
+"""
+import argparse
+import hashlib
+import os
+import random
+import resource
+import subprocess
+import sys
+import threading
+import time
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARKS_DIR, '..'))
+
+from r2_multipart import MultipartUploader  # noqa: E402
+from stub_r2_worker import StubR2Worker  # noqa: E402
+
+BLOCK = 1024 * 1024
+
+
+def stream_blocks(size_mb):
+    """The same pseudo-random bytes every time for a given size."""
+    generator = random.Random(size_mb)
+    for _ in range(size_mb):
+        yield generator.randbytes(BLOCK)
+
+
+def generate(size_mb):
+    for block in stream_blocks(size_mb):
+        sys.stdout.buffer.write(block)
+
+
+def anon_mb():
+    with open('/proc/self/status') as status:
+        for line in status:
+            if line.startswith('RssAnon:'):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def upload(endpoint, key, threads, part_mb):
+    peak = [anon_mb()]
+    baseline = peak[0]
+    done = threading.Event()
+
+    def sample():
+        while not done.wait(0.01):
+            peak[0] = max(peak[0], anon_mb())
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    with MultipartUploader(endpoint, threads) as uploader:
+        response = uploader.upload_stream(key, sys.stdin.buffer, part_mb * 1024 * 1024)
+        stats = uploader.stats()
+    done.set()
+    sampler.join()
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(response.status_code, stats['parts'], stats['buffers'], f"{stats['mb_per_second']:.1f}",
+          f"{baseline:.1f}", f"{peak[0]:.1f}", f"{peak_mb:.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes-mb', type=int, nargs='+', default=[200, 1000], help='stream sizes in MB')
+    parser.add_argument('--threads', type=int, default=8, help='parts in flight')
+    parser.add_argument('--part-mb', type=int, default=5, help='part size in MiB')
+    parser.add_argument('--link-mb', type=float, default=50, help='simulated link bandwidth in MB/s (0: unlimited)')
+    parser.add_argument('--generate', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--upload', nargs=2, metavar=('ENDPOINT', 'KEY'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.generate is not None:
+        generate(args.generate)
+        return
+    if args.upload:
+        upload(*args.upload, args.threads, args.part_mb)
+        return
+
+    partsize = args.part_mb * 1024 * 1024
+    print(f"{args.threads} threads x {args.part_mb}MiB parts = {args.threads * args.part_mb}MiB bound")
+    print(f"{'stream MB':>10}{'parts':>7}{'buffers':>9}{'MB/s':>8}{'base anon':>11}{'peak anon':>11}"
+          f"{'peak RSS':>10}  parts")
+    with StubR2Worker(bandwidth=args.link_mb * 1024 * 1024) as stub:
+        for size_mb in args.sizes_mb:
+            script = os.path.abspath(__file__)
+            generator = subprocess.Popen([sys.executable, script, '--generate', str(size_mb)],
+                                         stdout=subprocess.PIPE)
+            uploaded = set(stub.completed)
+            output = subprocess.run([sys.executable, script, '--threads', str(args.threads),
+                                     '--part-mb', str(args.part_mb), '--upload', stub.endpoint, f'{size_mb}.bin'],
+                                    stdin=generator.stdout, check=True, capture_output=True, text=True).stdout
+            generator.stdout.close()
+            generator.wait()
+            status, parts, buffers, mb_per_second, baseline, anon, peak = output.split()
+            assert status == '200', output
+
+            # The completed parts must be the stream cut into partsize pieces
+            completed = stub.completed[(set(stub.completed) - uploaded).pop()]
+            expected, digest, filled = [], hashlib.md5(), 0
+            for block in stream_blocks(size_mb):
+                while block:
+                    taken = block[:partsize - filled]
+                    digest.update(taken)
+                    filled += len(taken)
+                    block = block[len(taken):]
+                    if filled == partsize:
+                        expected.append(digest.hexdigest())
+                        digest, filled = hashlib.md5(), 0
+            if filled or not expected:
+                expected.append(digest.hexdigest())
+            matches = [part['etag'] for part in completed] == expected
+            print(f"{size_mb:>10}{parts:>7}{buffers:>9}{float(mb_per_second):>8.1f}{float(baseline):>11.1f}"
+                  f"{float(anon):>11.1f}{float(peak):>10.1f}  {'match' if matches else 'MISMATCH'}")
+            time.sleep(0.1)
+
+
+if __name__ == '__main__':
+    main()
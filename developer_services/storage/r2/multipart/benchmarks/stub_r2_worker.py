@@ -0,0 +1,230 @@
+"""
+Local stand-in for r2-multipart-worker: answers mpu-create, mpu-uploadpart,
+mpu-complete and mpu-abort like the Worker, reading and discarding part bodies.
+
+    with StubR2Worker() as worker:
+        upload_file(worker.endpoint, filename, partsize)
+"""
+import hashlib
+import json
+import os
+import ssl
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+READ_SIZE = 1024 * 1024
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server: '_Server'
+
+    def log_message(self, format, *args):
+        pass
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def _params(self):
+        return {key: values[0] for key, values in parse_qs(urlparse(self.path).query).items()}
+
+    def _body(self):
+        """The body, or for parts its MD5; None if the client went away mid-body."""
+        length = int(self.headers.get('Content-Length', 0))
+        if length <= 1024 * 1024 and self.command == 'POST':
+            return self.rfile.read(length)
+        # Part bodies are hashed as they arrive rather than held
+        digest = hashlib.md5()
+        while length:
+            chunk = self.rfile.read(min(READ_SIZE, length))
+            if not chunk:
+                return None
+            self._throttle(len(chunk))
+            digest.update(chunk)
+            length -= len(chunk)
+        return digest.hexdigest().encode()
+
+    def _throttle(self, size: int):
+        # Parts share one link of server.bandwidth bytes/s, queued in arrival order
+        bandwidth = self.server.bandwidth
+        if not bandwidth:
+            return
+        with self.server.lock:
+            now = time.monotonic()
+            self.server.link_free_at = max(now, self.server.link_free_at) + size / bandwidth
+            delay = self.server.link_free_at - now
+        time.sleep(delay)
+
+    def _reply(self, status: int, body: bytes = b'', headers=None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        params = self._params()
+        body = self._body()
+        action = params.get('action')
+        with self.server.lock:
+            self.server.requests[action] += 1
+        if action == 'mpu-create':
+            upload_id = uuid.uuid4().hex
+            with self.server.lock:
+                self.server.uploads[upload_id] = {}
+            self._reply(200, json.dumps({'key': self.path.split('?')[0].rsplit('/', 1)[-1],
+                                         'uploadId': upload_id}).encode())
+        elif action == 'mpu-complete':
+            parts = json.loads(body)['parts']
+            with self.server.lock:
+                uploaded = self.server.uploads.get(params.get('uploadId'))
+                if uploaded is None:
+                    self._reply(400, b'Unknown uploadId')
+                    return
+                if any(uploaded.get(part['partNumber']) != part['etag'] for part in parts):
+                    self._reply(400, b'Parts do not match the uploaded parts')
+                    return
+                self.server.completed[params['uploadId']] = parts
+            self._reply(200, headers={'etag': uuid.uuid4().hex})
+        else:
+            self._reply(400, f"Unknown action {action} for POST".encode())
+
+    def do_PUT(self):
+        params = self._params()
+        with self.server.lock:
+            self.server.in_flight += 1
+            rejected = bool(self.server.max_in_flight) and self.server.in_flight > self.server.max_in_flight
+        try:
+            if rejected:
+                # Drained without using the link: the rejection costs a round trip, not bandwidth
+                self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                with self.server.lock:
+                    self.server.rejected += 1
+                time.sleep(self.server.latency)
+                self._reply(429, b'Too many concurrent uploads', headers={'Retry-After': '1'})
+                return
+            body = self._body()
+        finally:
+            with self.server.lock:
+                self.server.in_flight -= 1
+        if body is None:
+            return
+        time.sleep(self.server.latency)
+        etag = body.decode()
+        with self.server.lock:
+            self.server.requests[params.get('action')] += 1
+            uploaded = self.server.uploads.get(params.get('uploadId'))
+            if uploaded is None:
+                self._reply(400, b'Unknown uploadId')
+                return
+            part_number = int(params['partNumber'])
+            uploaded[part_number] = etag
+        self._reply(200, json.dumps({'partNumber': part_number, 'etag': etag}).encode())
+
+    def do_DELETE(self):
+        params = self._params()
+        action = params.get('action')
+        with self.server.lock:
+            self.server.requests[action] += 1
+            if action != 'mpu-abort':
+                self._reply(400, f"Unknown action {action} for DELETE".encode())
+                return
+            self.server.uploads.pop(params.get('uploadId'), None)
+        self._reply(204)
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients killed or timing out mid-request are part of the benchmarks
+        if not isinstance(sys.exc_info()[1], (ConnectionError, ssl.SSLError)):
+            super().handle_error(request, client_address)
+
+
+class StubR2Worker:
+    """
+    Serves the Worker's multipart API on 127.0.0.1, over HTTPS with tls.
+
+    A part's etag is the MD5 of its body, so callers can check what arrived.
+    connections counts accepted TCP connections (each a TLS handshake with
+    tls); requests counts calls by action. With tls a throwaway self-signed
+    certificate is made with the openssl CLI; clients trust it through cafile
+    (e.g. REQUESTS_CA_BUNDLE). bandwidth (bytes/s) throttles all part bodies
+    as if they shared one link; parts cut off mid-body are not recorded.
+    latency is added to every part upload's reply. With max_in_flight, part
+    uploads beyond that many at once are answered 429 with Retry-After: 1,
+    counted in rejected.
+    """
+
+    def __init__(self, tls: bool = False, bandwidth: float = 0, latency: float = 0.0, max_in_flight: int = 0):
+        self._server = _Server(('127.0.0.1', 0), _Handler)
+        self._certs = None
+        self.cafile = None
+        if tls:
+            self._certs = tempfile.TemporaryDirectory()
+            self.cafile = os.path.join(self._certs.name, 'cert.pem')
+            keyfile = os.path.join(self._certs.name, 'key.pem')
+            subprocess.run(['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1',
+                            '-subj', '/CN=127.0.0.1', '-addext', 'subjectAltName=IP:127.0.0.1',
+                            '-keyout', keyfile, '-out', self.cafile], check=True, capture_output=True)
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            context.load_cert_chain(self.cafile, keyfile)
+            # The handshake runs on the handler's thread, not in the accept loop
+            self._server.socket = context.wrap_socket(self._server.socket, server_side=True,
+                                                      do_handshake_on_connect=False)
+        self._scheme = 'https' if tls else 'http'
+        self._server.lock = threading.Lock()
+        self._server.connections = 0
+        self._server.requests = Counter()
+        self._server.uploads = {}
+        self._server.completed = {}
+        self._server.bandwidth = bandwidth
+        self._server.link_free_at = 0.0
+        self._server.latency = latency
+        self._server.max_in_flight = max_in_flight
+        self._server.in_flight = 0
+        self._server.rejected = 0
+        self._thread = None
+
+    @property
+    def endpoint(self) -> str:
+        host, port = self._server.server_address
+        return f"{self._scheme}://{host}:{port}/r2/multipart/"
+
+    @property
+    def connections(self) -> int:
+        return self._server.connections
+
+    @property
+    def requests(self) -> Counter:
+        return self._server.requests
+
+    @property
+    def rejected(self) -> int:
+        return self._server.rejected
+
+    @property
+    def completed(self) -> dict:
+        return self._server.completed
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+        if self._certs is not None:
+            self._certs.cleanup()
@@ -1,12 +1,17 @@
+import argparse
+import hashlib
+import json
 import math
+import mmap
 import os
+import queue
 import requests
 from requests.adapters import HTTPAdapter, Retry
 import sys
+import threading
+import time
 import concurrent.futures
-
-# Take the file to upload as an argument
-filename = sys.argv[1]
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
 
 # The endpoint for our worker, change this to wherever you deploy your worker
 worker_endpoint = "https://dev.tmsquare.net/r2/multipart/"
@@ -14,57 +19,695 @@ worker_endpoint = "https://dev.tmsquare.net/r2/multipart/"
 # Configure the part size to be 10MB. 5MB is the minimum part size, except for the last part
 partsize = 5 * 1024 * 1024
 
+# R2 limits: parts of at least 5MiB (except the last) and at most 10,000 parts per upload
+MIN_PART_SIZE = 5 * 1024 * 1024
+MAX_PART_COUNT = 10000
+# Parts are request bodies to the Worker, which accepts up to 100MB on most plans
+MAX_PART_SIZE = 100 * 1000 * 1000 // (1024 * 1024) * 1024 * 1024
+# Autotuned part size aims for about this many parts: few enough to keep the
+# per-request overhead small, enough to spread over the concurrent uploads
+TARGET_PART_COUNT = 1000
+
+# Attempts at a part the worker keeps answering 429 (Too Many Requests)
+THROTTLED_ATTEMPTS = 8
+
+# Concurrency the autotuner starts at, and its default ceiling
+AUTOTUNE_INITIAL_CONCURRENCY = 4
+AUTOTUNE_MAX_CONCURRENCY = 64
+
+
+class MappedFile:
+    """
+    The file to upload, memory-mapped once and shared by every part upload.
+
+    part() hands out memoryview slices of the mapping, which requests sends
+    straight from the page cache, so no part is ever copied into a bytes
+    object. Pages of a part are dropped from our address space once it has
+    been sent, so memory stays flat whatever the file size or part count.
+    """
+
+    def __init__(self, filename):
+        self.size = os.stat(filename).st_size
+        self._mmap = None
+        self._view = memoryview(b"")
+        # mmap can't map an empty file
+        if self.size:
+            with open(filename, "rb") as file:
+                self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            if hasattr(self._mmap, "madvise"):
+                self._mmap.madvise(mmap.MADV_SEQUENTIAL)
+            self._view = memoryview(self._mmap)
+
+    def part(self, index, partsize):
+        # Use as `with source.part(index, partsize) as part:` so the slice is released
+        return self._view[partsize * index:partsize * (index + 1)]
+
+    def release(self, index, partsize):
+        """Drop the pages of a sent part; they stay in the page cache and fault back in if it's resent."""
+        if self._mmap is None or not hasattr(self._mmap, "madvise"):
+            return
+        # madvise needs a page-aligned start; the page shared with the previous part just faults back in
+        start = partsize * index // mmap.PAGESIZE * mmap.PAGESIZE
+        end = min(partsize * (index + 1), self.size)
+        if end > start:
+            self._mmap.madvise(mmap.MADV_DONTNEED, start, end - start)
+
+    def close(self):
+        self._view.release()
+        if self._mmap is not None:
+            self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class PartManifest:
+    """
+    Checkpoint of a multipart upload, kept next to the file as <file>.r2-manifest.
+
+    JSON lines: a header with the uploadId, url, part size and file size, then
+    one line per uploaded part with its MD5 and the part the worker returned.
+    Parts are appended and flushed as they finish, so a killed upload loses at
+    most the parts in flight; a torn last line is ignored. Resuming uploads
+    only the parts that are missing or whose MD5 changed, then completes.
+    A checkpoint that can't be resumed leaves its (url, uploadId) in stale,
+    so that upload can be aborted instead of its parts lingering in R2.
+    """
+
+    def __init__(self, filename):
+        self.path = f"{filename}.r2-manifest"
+        self.uploadId = None
+        self.partsize = None
+        self.parts = {}
+        self.stale = None
+        self._file = None
+        self._lock = threading.Lock()
+
+    def load(self, url, partsize=None):
+        """
+        Read a previous run's checkpoint; False if there is none for this url and part size.
+        Without partsize (an autotuned upload) the checkpoint's part size is taken as is.
+        """
+        try:
+            with open(self.path, "rb") as file:
+                data = file.read()
+        except FileNotFoundError:
+            return False
+        records = []
+        # Bytes up to the end of the last complete record
+        end = 0
+        for line in data.splitlines(keepends=True):
+            try:
+                if not line.endswith(b"\n"):
+                    raise ValueError("no newline")
+                records.append(json.loads(line))
+            except ValueError:
+                # The line being written when the previous run died
+                break
+            end += len(line)
+        if not records:
+            return False
+        if records[0].get("url") != url or (partsize is not None and records[0].get("partsize") != partsize):
+            if records[0].get("uploadId"):
+                self.stale = (records[0].get("url"), records[0]["uploadId"])
+            return False
+        self.uploadId = records[0]["uploadId"]
+        self.partsize = records[0]["partsize"]
+        self.parts = {record["part"]["partNumber"]: record for record in records[1:]}
+        self._file = open(self.path, "a")
+        # Drop a torn last line, or the next record would be appended to it and lost with it
+        if end < len(data):
+            self._file.truncate(end)
+        return True
+
+    def start(self, uploadId, url, partsize, size):
+        self.uploadId = uploadId
+        self.partsize = partsize
+        self.parts = {}
+        self._file = open(self.path, "w")
+        self._append({"uploadId": uploadId, "url": url, "partsize": partsize, "size": size})
+
+    def uploaded(self, partNumber, md5):
+        """The part the worker returned for partNumber, if it was uploaded with this content."""
+        record = self.parts.get(partNumber)
+        return record["part"] if record is not None and record["md5"] == md5 else None
+
+    def record(self, part, md5):
+        self._append({"part": part, "md5": md5})
+
+    def remove(self):
+        self.close()
+        os.remove(self.path)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _append(self, record):
+        with self._lock:
+            self._file.write(json.dumps(record) + "\n")
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+
+class _CountingConnectionPoolMixin:
+    """Counts every connect() of the pool's connections, reconnects after a dropped keep-alive included."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.handshakes = 0
+        self._handshakes_lock = threading.Lock()
+
+    def _new_conn(self):
+        conn = super()._new_conn()
+        connect = conn.connect
+
+        def counted_connect():
+            with self._handshakes_lock:
+                self.handshakes += 1
+            connect()
+
+        conn.connect = counted_connect
+        return conn
+
+
+class _CountingHTTPConnectionPool(_CountingConnectionPoolMixin, HTTPConnectionPool):
+    pass
+
+
+class _CountingHTTPSConnectionPool(_CountingConnectionPoolMixin, HTTPSConnectionPool):
+    pass
+
+
+class _PooledAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _CountingHTTPConnectionPool,
+            "https": _CountingHTTPSConnectionPool,
+        }
+
+    @property
+    def handshakes(self):
+        pools = self.poolmanager.pools
+        return sum(pools[key].handshakes for key in pools.keys())
+
+
+def choose_part_size(size):
+    """
+    Part size for a file of size bytes: about TARGET_PART_COUNT parts, in whole MiB,
+    never below R2's 5MiB minimum and never so small that the upload needs more
+    than MAX_PART_COUNT parts.
+    """
+    mib = 1024 * 1024
+    size_for_target = math.ceil(size / TARGET_PART_COUNT / mib) * mib
+    size_for_limit = math.ceil(size / MAX_PART_COUNT / mib) * mib
+    chosen = max(MIN_PART_SIZE, size_for_target, size_for_limit)
+    if chosen > MAX_PART_SIZE:
+        if size_for_limit > MAX_PART_SIZE:
+            raise ValueError(f"{size} bytes needs parts over {MAX_PART_SIZE} bytes to fit in {MAX_PART_COUNT} parts")
+        chosen = MAX_PART_SIZE
+    return chosen
+
+
+class ConcurrencyTuner:
+    """
+    AIMD limit on the parts in flight, driven by measured throughput and throttling.
+
+    The limit is re-evaluated every `limit` completed parts (a window). While
+    the window's throughput beats the best seen by more than GAIN the limit
+    grows by one. It starts by doubling instead (slow start, so high-latency
+    links fill quickly) until a window gains less than SLOW_START_GAIN or a
+    part is throttled. It
+    holds once more parts no longer add throughput. A part that met a 429 or
+    5xx (retried or not) halves the limit straight away, at most once for the
+    parts that were already in flight, and the throughput baseline is measured
+    again.
+    """
+
+    GAIN = 0.05
+    # Doubling continues only while it adds at least this share of throughput
+    SLOW_START_GAIN = 0.25
+
+    def __init__(self, initial, maximum, minimum=1):
+        self.limit = max(minimum, min(initial, maximum))
+        self.minimum = minimum
+        self.maximum = maximum
+        self.peak = self.limit
+        self.throttled = 0
+        self._in_flight = 0
+        self._condition = threading.Condition()
+        self._best_rate = None
+        self._slow_start = True
+        self._last_decrease = 0.0
+        self._start_window(time.perf_counter())
+
+    def acquire(self):
+        """Block until one more part may be in flight."""
+        with self._condition:
+            while self._in_flight >= self.limit:
+                self._condition.wait()
+            self._in_flight += 1
+
+    def release(self):
+        with self._condition:
+            self._in_flight -= 1
+            self._condition.notify()
+
+    def record(self, size, started, throttled):
+        """
+        Account a finished part upload attempt.
+
+        Args:
+            size (int): Bytes in the part
+            started (float): time.perf_counter() when the part was sent
+            throttled (bool): Whether any attempt of it got a 429 or 5xx
+        """
+        with self._condition:
+            now = time.perf_counter()
+            if throttled:
+                self.throttled += 1
+                # Parts sent before the last decrease already saw that congestion
+                if started >= self._last_decrease:
+                    self._slow_start = False
+                    self._set_limit(self.limit // 2)
+                    self._last_decrease = now
+                    self._best_rate = None
+                    self._start_window(now)
+                return
+            self._window_bytes += size
+            self._window_parts += 1
+            if self._window_parts < self.limit:
+                return
+            rate = self._window_bytes / max(now - self._window_start, 1e-9)
+            if self._slow_start:
+                if self._best_rate is None or rate > self._best_rate * (1 + self.SLOW_START_GAIN):
+                    self._set_limit(self.limit * 2)
+                else:
+                    self._slow_start = False
+            elif self._best_rate is None or rate > self._best_rate * (1 + self.GAIN):
+                self._set_limit(self.limit + 1)
+            self._best_rate = max(rate, self._best_rate or 0.0)
+            self._start_window(now)
+
+    def _set_limit(self, limit):
+        self.limit = max(self.minimum, min(limit, self.maximum))
+        self.peak = max(self.peak, self.limit)
+        self._condition.notify_all()
+
+    def _start_window(self, now):
+        self._window_start = now
+        self._window_bytes = 0
+        self._window_parts = 0
 
-def upload_file(worker_endpoint, filename, partsize):
-    url = f"{worker_endpoint}{filename}"
-
-    # Create the multipart upload
-    uploadId = requests.post(url, params={"action": "mpu-create"}).json()["uploadId"]
-
-    part_count = math.ceil(os.stat(filename).st_size / partsize)
-    # Create an executor for up to 25 concurrent uploads.
-    executor = concurrent.futures.ThreadPoolExecutor(25)
-    # Submit a task to the executor to upload each part
-    futures = [
-        executor.submit(upload_part, filename, partsize, url, uploadId, index)
-        for index in range(part_count)
-    ]
-    concurrent.futures.wait(futures)
-    # get the parts from the futures
-    uploaded_parts = [future.result() for future in futures]
-
-    # complete the multipart upload
-    response = requests.post(
-        url,
-        params={"action": "mpu-complete", "uploadId": uploadId},
-        json={"parts": uploaded_parts},
-    )
+
+def _retry_after(response):
+    try:
+        return max(0.0, float(response.headers.get("Retry-After", 1)))
+    except ValueError:
+        return 1.0
+
+
+def _throttled(response):
+    """Whether the part met a 429 or 5xx, including attempts urllib3 retried."""
+    statuses = [response.status_code]
+    retries = getattr(response.raw, "retries", None)
+    if retries is not None:
+        statuses.extend(attempt.status for attempt in retries.history if attempt.status is not None)
+    return any(status == 429 or status >= 500 for status in statuses)
+
+
+class _StreamReader:
+    """Fills part buffers from a binary file object (readinto) or an iterable of bytes chunks."""
+
+    def __init__(self, stream):
+        self._readinto = getattr(stream, "readinto", None)
+        self._chunks = iter(stream) if self._readinto is None else None
+        self._pending = memoryview(b"")
+
+    def readinto(self, buffer):
+        """Fill buffer; returns the bytes read, less than its length only at the end of the stream."""
+        filled = 0
+        with memoryview(buffer) as view:
+            while filled < len(view):
+                if self._readinto is not None:
+                    # Pipes return what's available, so keep reading until the part is full
+                    count = self._readinto(view[filled:])
+                    if not count:
+                        break
+                elif self._pending:
+                    count = min(len(self._pending), len(view) - filled)
+                    view[filled:filled + count] = self._pending[:count]
+                    self._pending = self._pending[count:]
+                else:
+                    chunk = next(self._chunks, None)
+                    if chunk is None:
+                        break
+                    self._pending = memoryview(chunk).cast("B")
+                    continue
+                filled += count
+        return filled
+
+
+class MultipartUploader:
+    """
+    Uploads files through the worker over one pool of kept-alive connections.
+
+    mpu-create, every mpu-uploadpart and mpu-complete share a single session
+    whose pool holds as many connections as there are upload threads, so a
+    TCP+TLS handshake is paid once per thread rather than once per part.
+    stats() reports the handshakes made and the latency of each part upload.
+
+    With autotune, concurrency is a ceiling: a ConcurrencyTuner starts at
+    AUTOTUNE_INITIAL_CONCURRENCY parts in flight and adjusts from there.
+    """
+
+    def __init__(self, worker_endpoint, concurrency=None, autotune=False):
+        self.worker_endpoint = worker_endpoint
+        self.autotune = autotune
+        self.concurrency = concurrency or (AUTOTUNE_MAX_CONCURRENCY if autotune else 25)
+        self.tuner = None
+
+        # Retry policy for when uploading a part fails; urllib3 doesn't retry the POSTs on a status.
+        # 429s are left to upload_part, which waits them out and tells the tuner
+        retries = Retry(total=3, status_forcelist=[400, 500, 502, 503, 504])
+        # pool_block keeps the pool at concurrency connections instead of opening throwaway extras
+        self._adapter = _PooledAdapter(pool_connections=1, pool_maxsize=self.concurrency, pool_block=True,
+                                       max_retries=retries)
+        self.session = requests.Session()
+        self.session.mount("https://", self._adapter)
+        self.session.mount("http://", self._adapter)
+
+        self._lock = threading.Lock()
+        self.part_latencies = []
+        self.bytes_uploaded = 0
+        self.parts_skipped = 0
+        self.partsize = None
+        self.buffers_allocated = 0
+        self.elapsed = 0.0
+
+    def upload_file(self, filename, partsize=None, resume=False):
+        """
+        Upload filename in parts of partsize bytes and complete the upload.
+
+        Without partsize, choose_part_size() picks one from the file size.
+
+        With resume, progress is checkpointed in a PartManifest next to the
+        file. A run that finds one for the same url and part size continues
+        that upload, skipping parts already uploaded with the same content.
+        The manifest is removed once the upload completes.
+        """
+        url = f"{self.worker_endpoint}{filename}"
+        started = time.perf_counter()
+
+        with MappedFile(filename) as source:
+            manifest = None
+            if resume:
+                manifest = PartManifest(filename)
+                # An autotuned upload continues with the part size it was started with
+                if manifest.load(url, partsize):
+                    uploadId = manifest.uploadId
+                    partsize = manifest.partsize
+                    print(f"Resuming upload {uploadId} with {len(manifest.parts)} parts checkpointed")
+                elif manifest.stale is not None:
+                    # Checkpointed for another url or part size; its parts would stay in R2 uncompleted
+                    stale_url, stale_uploadId = manifest.stale
+                    if self.abort(stale_url, stale_uploadId):
+                        print(f"Aborted upload {stale_uploadId} from a checkpoint that doesn't match this run")
+                    else:
+                        print(f"Could not abort upload {stale_uploadId} at {stale_url}; abort it to free its parts")
+            if partsize is None:
+                partsize = choose_part_size(source.size)
+            self.partsize = partsize
+            if manifest is None or manifest.uploadId is None:
+                # Create the multipart upload
+                uploadId = self.session.post(url, params={"action": "mpu-create"}).json()["uploadId"]
+                if manifest is not None:
+                    manifest.start(uploadId, url, partsize, source.size)
+
+            part_count = math.ceil(source.size / partsize)
+            if self.autotune:
+                self.tuner = ConcurrencyTuner(AUTOTUNE_INITIAL_CONCURRENCY, self.concurrency)
+            try:
+                # Create an executor for up to concurrency uploads, one pooled connection each
+                with concurrent.futures.ThreadPoolExecutor(self.concurrency) as executor:
+                    # Submit a task to the executor to upload each part, as the tuner lets more in flight
+                    futures = []
+                    for index in range(part_count):
+                        self._acquire()
+                        futures.append(self._submit(executor, self.upload_part, source, partsize, url, uploadId,
+                                                    index, manifest))
+                    concurrent.futures.wait(futures)
+                # get the parts from the futures
+                uploaded_parts = [future.result() for future in futures]
+            finally:
+                if manifest is not None:
+                    manifest.close()
+
+        # complete the multipart upload
+        response = self.session.post(
+            url,
+            params={"action": "mpu-complete", "uploadId": uploadId},
+            json={"parts": uploaded_parts},
+        )
+        self.elapsed = time.perf_counter() - started
+        # Kept after a failed complete, so the parts can still be completed or aborted
+        if manifest is not None and response.status_code == 200:
+            manifest.remove()
+        return response
+
+    def abort(self, url, uploadId):
+        """Abort a multipart upload so R2 drops its parts; True once the worker confirmed it."""
+        try:
+            response = self.session.delete(url, params={"action": "mpu-abort", "uploadId": uploadId})
+        except requests.RequestException:
+            return False
+        return response.ok
+
+    def upload_part(self, source, partsize, url, uploadId, index, manifest=None):
+        # A zero-copy window onto the mapped file; retries resend the same slice
+        with source.part(index, partsize) as part:
+            md5 = hashlib.md5(part).hexdigest() if manifest is not None else None
+            uploaded = manifest.uploaded(index + 1, md5) if manifest is not None else None
+            if uploaded is None:
+                uploaded = self._put_part(url, uploadId, index + 1, part)
+                if manifest is not None:
+                    manifest.record(uploaded, md5)
+            else:
+                # Already uploaded with the same content by an interrupted run
+                with self._lock:
+                    self.parts_skipped += 1
+        source.release(index, partsize)
+        return uploaded
+
+    def upload_stream(self, key, stream, partsize=None, size_hint=None):
+        """
+        Upload a stream of unknown length (stdin, a pipe, any iterable of bytes) as key.
+
+        Parts are cut as data arrives into reusable buffers of partsize bytes,
+        at most one per part in flight, so memory stays at concurrency x
+        partsize however long the stream is. Reading pauses while every buffer
+        is being uploaded. The upload completes when the stream ends.
+
+        Without partsize, choose_part_size(size_hint) is used if the caller
+        can estimate the stream's length; otherwise 5MiB parts, which cap a
+        stream at MAX_PART_COUNT parts (about 48GiB). A stream can't be read
+        twice, so a failed upload is aborted rather than checkpointed.
+        """
+        url = f"{self.worker_endpoint}{key}"
+        started = time.perf_counter()
+        if partsize is None:
+            partsize = choose_part_size(size_hint) if size_hint else MIN_PART_SIZE
+        self.partsize = partsize
+        reader = _StreamReader(stream)
+        free_buffers = queue.LifoQueue()
+        failed = threading.Event()
+
+        # Create the multipart upload
+        uploadId = self.session.post(url, params={"action": "mpu-create"}).json()["uploadId"]
+        if self.autotune:
+            self.tuner = ConcurrencyTuner(AUTOTUNE_INITIAL_CONCURRENCY, self.concurrency)
+        try:
+            with concurrent.futures.ThreadPoolExecutor(self.concurrency) as executor:
+                futures = []
+                while not failed.is_set():
+                    self._acquire()
+                    # Buffers are allocated only while all existing ones are in flight
+                    if free_buffers.empty() and self.buffers_allocated < self.concurrency:
+                        buffer = bytearray(partsize)
+                        self.buffers_allocated += 1
+                    else:
+                        buffer = free_buffers.get()
+                    size = reader.readinto(buffer)
+                    # An empty stream still uploads one (empty) part, so the object exists
+                    if size == 0 and futures:
+                        free_buffers.put(buffer)
+                        self._release()
+                        break
+                    if len(futures) == MAX_PART_COUNT:
+                        raise ValueError(f"Stream needs more than {MAX_PART_COUNT} parts of {partsize} bytes; "
+                                         f"pass a larger partsize or a size_hint")
+                    future = self._submit(executor, self._upload_buffer, url, uploadId, len(futures), buffer, size)
+                    future.add_done_callback(lambda future, buffer=buffer: free_buffers.put(buffer))
+                    # Stop reading the stream once a part has failed
+                    future.add_done_callback(lambda future: future.exception() is not None and failed.set())
+                    futures.append(future)
+                    if size < partsize:
+                        break
+                concurrent.futures.wait(futures)
+            uploaded_parts = [future.result() for future in futures]
+        except BaseException:
+            self.abort(url, uploadId)
+            raise
+
+        # complete the multipart upload
+        response = self.session.post(
+            url,
+            params={"action": "mpu-complete", "uploadId": uploadId},
+            json={"parts": uploaded_parts},
+        )
+        self.elapsed = time.perf_counter() - started
+        return response
+
+    def _upload_buffer(self, url, uploadId, index, buffer, size):
+        with memoryview(buffer)[:size] as part:
+            return self._put_part(url, uploadId, index + 1, part)
+
+    def _put_part(self, url, uploadId, partNumber, part):
+        """Upload one part, waiting out 429s, and return the part the worker reports."""
+        size = len(part)
+        first_started = time.perf_counter()
+        for attempt in range(1, THROTTLED_ATTEMPTS + 1):
+            started = time.perf_counter()
+            response = self.session.put(
+                url,
+                params={
+                    "action": "mpu-uploadpart",
+                    "uploadId": uploadId,
+                    "partNumber": str(partNumber),
+                },
+                data=part,
+            )
+            if self.tuner is not None:
+                self.tuner.record(size, started, _throttled(response))
+            if response.status_code != 429 or attempt == THROTTLED_ATTEMPTS:
+                break
+            time.sleep(_retry_after(response))
+        latency = time.perf_counter() - first_started
+
+        response.raise_for_status()
+        uploaded = response.json()
+        with self._lock:
+            self.part_latencies.append(latency)
+            self.bytes_uploaded += size
+        return uploaded
+
+    def _acquire(self):
+        if self.tuner is not None:
+            self.tuner.acquire()
+
+    def _release(self):
+        if self.tuner is not None:
+            self.tuner.release()
+
+    def _submit(self, executor, fn, *args):
+        """Run a part upload on executor; the tuner's slot taken by _acquire() is freed when it's done."""
+        future = executor.submit(fn, *args)
+        future.add_done_callback(lambda _: self._release())
+        return future
+
+    def stats(self):
+        """Handshakes made, per-part latency percentiles in seconds and the parameters the upload ran with."""
+        with self._lock:
+            latencies = sorted(self.part_latencies)
+            uploaded = self.bytes_uploaded
+            skipped = self.parts_skipped
+
+        def percentile(share):
+            return latencies[min(len(latencies) - 1, int(len(latencies) * share))] if latencies else 0.0
+
+        return {
+            "handshakes": self._adapter.handshakes,
+            "parts": len(latencies),
+            "parts_skipped": skipped,
+            "bytes": uploaded,
+            "part_latency_p50": percentile(0.5),
+            "part_latency_p95": percentile(0.95),
+            "part_latency_max": latencies[-1] if latencies else 0.0,
+            "partsize": self.partsize,
+            "concurrency": self.tuner.limit if self.tuner is not None else self.concurrency,
+            "peak_concurrency": self.tuner.peak if self.tuner is not None else self.concurrency,
+            "throttled_parts": self.tuner.throttled if self.tuner is not None else None,
+            "buffers": self.buffers_allocated,
+            "mb_per_second": uploaded / (1024 * 1024) / self.elapsed if self.elapsed else 0.0,
+        }
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def upload_file(worker_endpoint, filename, partsize=None, resume=False, autotune=False, concurrency=None):
+    with MultipartUploader(worker_endpoint, concurrency, autotune) as uploader:
+        response = uploader.upload_file(filename, partsize, resume)
+        _print_result(response, uploader.stats())
+
+
+def upload_stream(worker_endpoint, key, stream, partsize=None, autotune=False, concurrency=None):
+    with MultipartUploader(worker_endpoint, concurrency, autotune) as uploader:
+        response = uploader.upload_stream(key, stream, partsize)
+        stats = uploader.stats()
+    _print_result(response, stats)
+    print(f"{stats['buffers']} part buffers ({stats['buffers'] * stats['partsize'] / (1024 * 1024):.0f}MiB) "
+          f"for {stats['bytes'] / (1024 * 1024):.0f}MiB streamed")
+
+
+def _print_result(response, stats):
     if response.status_code == 200:
         print("🎉 successfully completed multipart upload")
     else:
         print(response.text)
+    if stats["parts_skipped"]:
+        print(f"{stats['parts_skipped']} parts already uploaded by a previous run")
+    print(f"{stats['parts']} parts over {stats['handshakes']} connections, part latency "
+          f"p50 {stats['part_latency_p50'] * 1000:.0f}ms p95 {stats['part_latency_p95'] * 1000:.0f}ms "
+          f"max {stats['part_latency_max'] * 1000:.0f}ms")
+    print(f"part size {stats['partsize'] / (1024 * 1024):.0f}MiB, concurrency {stats['concurrency']} "
+          f"(peak {stats['peak_concurrency']}), {stats['mb_per_second']:.1f} MB/s")
 
 
-def upload_part(filename, partsize, url, uploadId, index):
-    # Open the file in rb mode, which treats it as raw bytes rather than attempting to parse utf-8
-    with open(filename, "rb") as file:
-        file.seek(partsize * index)
-        part = file.read(partsize)
-
-    # Retry policy for when uploading a part fails
-    s = requests.Session()
-    retries = Retry(total=3, status_forcelist=[400, 500, 502, 503, 504])
-    s.mount("https://", HTTPAdapter(max_retries=retries))
+if __name__ == "__main__":
+    # Take the file to upload as an argument; "-" streams stdin, e.g. pg_dump db | python r2_multipart.py - --key db.sql
+    parser = argparse.ArgumentParser(description="Upload a file (or stdin) to R2 through the multipart worker")
+    parser.add_argument("filename", help='file to upload, or "-" to stream stdin')
+    parser.add_argument("--key", help="object key when streaming stdin")
+    parser.add_argument("--part-size-mb", type=int, help="part size in MiB (default 5, or autotuned for files)")
+    parser.add_argument("--resume", action="store_true",
+                        help="checkpoint parts in <filename>.r2-manifest and continue an interrupted upload")
+    parser.add_argument("--autotune", action="store_true",
+                        help="pick the part size from the file size and adapt concurrency to the link")
+    parser.add_argument("--concurrency", type=int,
+                        help=f"parts in flight (the ceiling with --autotune; default 25, "
+                             f"{AUTOTUNE_MAX_CONCURRENCY} with --autotune)")
+    args = parser.parse_args()
 
-    return s.put(
-        url,
-        params={
-            "action": "mpu-uploadpart",
-            "uploadId": uploadId,
-            "partNumber": str(index + 1),
-        },
-        data=part,
-    ).json()
-
-
-upload_file(worker_endpoint, filename, partsize)
\ No newline at end of file
+    chosen_partsize = args.part_size_mb * 1024 * 1024 if args.part_size_mb else None
+    if args.filename == "-":
+        if not args.key:
+            parser.error("--key is required when streaming stdin")
+        if args.resume:
+            parser.error("--resume needs a file; stdin can't be read again")
+        upload_stream(worker_endpoint, args.key, sys.stdin.buffer, chosen_partsize, args.autotune, args.concurrency)
+    else:
+        if chosen_partsize is None and not args.autotune:
+            chosen_partsize = partsize
+        upload_file(worker_endpoint, args.filename, chosen_partsize, args.resume, args.autotune, args.concurrency)